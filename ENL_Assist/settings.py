@@ -50,6 +50,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.DisplayNameMemoMiddleware',
+    'users.middleware.SchemeStatusSessionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -140,6 +142,42 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'  
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  
 
+# Stored payment report exports (MEDIA_ROOT/exports) are evicted beyond this size
+PAYMENT_EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Seconds the department -> students membership index stays cached; assignment
+# changes replace it sooner
+DEPARTMENT_MEMBERSHIP_CACHE_TIMEOUT = 15 * 60
+
+# Seconds between heartbeats of a payment run while a department is being calculated;
+# run_payment_worker takes over runs without a heartbeat for --stale-after minutes
+PAYMENT_RUN_HEARTBEAT_INTERVAL = 60
+
+# Hours a student may log per month, enforced when each work log is saved
+WORK_LOG_MONTHLY_HOUR_CAP = 30
+
+# Application documents uploaded in chunks are assembled here until the
+# application is submitted; purge_document_uploads clears abandoned ones
+DOCUMENT_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, 'upload_parts')
+# Largest chunk the browser sends per request when uploading a document
+DOCUMENT_UPLOAD_CHUNK_SIZE = 256 * 1024
+# Seconds allowed for checking the content of a submitted application's documents,
+# which are checked side by side (see scheme/validation.py)
+DOCUMENT_VALIDATION_TIMEOUT = 5
+
+# Longest side in pixels of the document previews rendered by render_document_previews
+# (photos need Pillow, PDF first pages poppler's pdftoppm)
+DOCUMENT_PREVIEW_MAX_SIZE = 600
+
+# How application documents are sent once the viewer has been checked:
+# 'django' streams them from the view (sendfile through wsgi.file_wrapper where the
+# server supports it), 'x-accel-redirect' hands them to nginx and 'x-sendfile' to
+# Apache mod_xsendfile or lighttpd, so no worker is held for the transfer
+DOCUMENT_SERVE_MODE = 'django'
+# Internal nginx location aliased to MEDIA_ROOT, used with 'x-accel-redirect':
+#   location /protected-media/ { internal; alias /path/to/media/; }
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 
 # SMTP Email Backend Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
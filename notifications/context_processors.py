@@ -1,9 +1,10 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+from .models import UnreadNotificationCounter
 
 def unread_notifications_count(request):
-    """ Add unread notification count to context """
+    """ Add unread notification count to context, read only when a template uses it """
     if request.user.is_authenticated:
-        count = Notification.objects.filter(user=request.user, is_read=False).count()
+        count = SimpleLazyObject(lambda: UnreadNotificationCounter.get_count(request.user))
     else:
         count = 0
 
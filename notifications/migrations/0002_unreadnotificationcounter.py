@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    """Count the unread notifications that existed before the table was added"""
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadNotificationCounter = apps.get_model('notifications', 'UnreadNotificationCounter')
+
+    rows = Notification.objects.filter(is_read=False).values('user_id').annotate(count=Count('id')).order_by()
+    UnreadNotificationCounter.objects.bulk_create([
+        UnreadNotificationCounter(user_id=row['user_id'], unread_count=row['count'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+        ('users', '0002_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadNotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,107 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from users.models import User
+
+
+class NotificationQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """Create notifications in bulk and add the unread ones to each user's counter"""
+        objs = super().bulk_create(objs, *args, **kwargs)
+        unread_per_user = {}
+        for notification in objs:
+            if not notification.is_read:
+                unread_per_user[notification.user_id] = unread_per_user.get(notification.user_id, 0) + 1
+        for user_id, count in unread_per_user.items():
+            UnreadNotificationCounter.adjust(user_id, count)
+        return objs
+
+    def mark_read(self):
+        """Mark the unread notifications in this queryset as read and update the counters"""
+        with transaction.atomic():
+            unread = self.filter(is_read=False)
+            unread_per_user = list(unread.values('user_id').annotate(count=Count('id')).order_by())
+            marked = unread.update(is_read=True)
+            for row in unread_per_user:
+                UnreadNotificationCounter.adjust(row['user_id'], -row['count'])
+        return marked
+
+    def delete(self):
+        """Delete the notifications (as the admin's bulk action does) and take the unread ones off the counters"""
+        with transaction.atomic():
+            unread_per_user = list(self.filter(is_read=False).values('user_id').annotate(count=Count('id')).order_by())
+            result = super().delete()
+            for row in unread_per_user:
+                UnreadNotificationCounter.adjust(row['user_id'], -row['count'])
+        return result
+
+
 # Create your models here.
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # A user's notifications newest first; "NOT is_read" is filtered while walking it
+            models.Index(fields=['user', 'created_at'], name='notification_user_created'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Override save to keep the user's unread counter in sync"""
+        was_unread = False
+        if self.pk is not None:
+            was_unread = Notification.objects.filter(pk=self.pk, is_read=False).exists()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            change = int(not self.is_read) - int(was_unread)
+            if change:
+                UnreadNotificationCounter.adjust(self.user_id, change)
+
+    def delete(self, *args, **kwargs):
+        """Override delete to keep the user's unread counter in sync"""
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if not self.is_read:
+                UnreadNotificationCounter.adjust(self.user_id, -1)
+        return result
+
+
+class UnreadNotificationCounter(models.Model):
+    """Denormalized count of a user's unread notifications, read by every page render"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def adjust(cls, user_id, change):
+        """Add change (which may be negative) to the user's counter, creating it if missing"""
+        updated = cls.objects.filter(user_id=user_id).update(
+            unread_count=Greatest(F('unread_count') + change, 0)
+        )
+        if not updated:
+            cls._seed(user_id)
+
+    @classmethod
+    def get_count(cls, user):
+        """Unread notification count for the user"""
+        count = cls.objects.filter(user=user).values_list('unread_count', flat=True).first()
+        if count is None:
+            count = cls._seed(user.pk).unread_count
+        return count
+
+    @classmethod
+    def _seed(cls, user_id):
+        # A missing row is built from the notifications themselves, which already
+        # include whatever change the caller was recording
+        unread_count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        try:
+            with transaction.atomic():
+                counter, _ = cls.objects.get_or_create(user_id=user_id, defaults={'unread_count': unread_count})
+        except IntegrityError:
+            counter = cls.objects.get(user_id=user_id)
+        return counter
@@ -1,3 +1,90 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from users.models import User
+from .context_processors import unread_notifications_count
+from .models import Notification, UnreadNotificationCounter
+
+
+class QueryPlanTests(TestCase):
+    """The notification list uses its index (EXPLAIN QUERY PLAN)"""
+
+    def test_unread_notifications_newest_first(self):
+        plan = Notification.objects.filter(user_id=1, is_read=False).order_by('-created_at').explain()
+        self.assertIn('notification_user_created', plan, plan)
+
+
+class UnreadNotificationCounterTests(TestCase):
+    """The unread counter matches a COUNT of unread notifications after every kind of write"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='student1', password='x', role='student')
+        self.other = User.objects.create_user(username='student2', password='x', role='student')
+        self.notifications = [Notification.objects.create(user=self.user, message=f'Message {n}') for n in range(3)]
+        Notification.objects.bulk_create([
+            Notification(user=self.user, message='Assigned'),
+            Notification(user=self.other, message='Assigned'),
+            Notification(user=self.other, message='Seen', is_read=True),
+        ])
+        self.client.force_login(self.user)
+
+    def assertCountersMatch(self):
+        for user in (self.user, self.other):
+            self.assertEqual(UnreadNotificationCounter.get_count(user),
+                             Notification.objects.filter(user=user, is_read=False).count())
+
+    def test_creation_counts_unread_notifications(self):
+        self.assertEqual(UnreadNotificationCounter.get_count(self.user), 4)
+        self.assertEqual(UnreadNotificationCounter.get_count(self.other), 1)
+
+    def test_mark_as_read(self):
+        self.client.get(reverse('mark_notification_as_read', args=[self.notifications[0].pk]))
+        self.assertEqual(UnreadNotificationCounter.get_count(self.user), 3)
+
+        # Saving an already read notification again changes nothing
+        notification = Notification.objects.get(pk=self.notifications[0].pk)
+        notification.save()
+        self.assertCountersMatch()
+
+        notification.is_read = False
+        notification.save()
+        self.assertCountersMatch()
+
+    def test_mark_all_as_read(self):
+        self.client.get(reverse('mark_all_notifications_as_read'))
+
+        self.assertEqual(UnreadNotificationCounter.get_count(self.user), 0)
+        self.assertEqual(UnreadNotificationCounter.get_count(self.other), 1)
+        self.assertEqual(Notification.objects.filter(user=self.user).mark_read(), 0)
+        self.assertCountersMatch()
+
+    def test_delete(self):
+        self.notifications[0].delete()
+        read = self.notifications[1]
+        read.is_read = True
+        read.save()
+        read.delete()
+        self.assertCountersMatch()
+
+        # The admin's bulk delete goes through the queryset
+        Notification.objects.filter(message__in=['Assigned', 'Seen']).delete()
+        self.assertCountersMatch()
+        self.assertEqual(UnreadNotificationCounter.get_count(self.other), 0)
+
+    def test_missing_counter_is_seeded_from_the_notifications(self):
+        UnreadNotificationCounter.objects.all().delete()
+
+        self.assertEqual(UnreadNotificationCounter.get_count(self.user), 4)
+        Notification.objects.create(user=self.other, message='New')
+        self.assertCountersMatch()
+
+    def test_count_is_only_read_when_rendered(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        with self.assertNumQueries(0):
+            count = unread_notifications_count(request)['unread_notifications_count']
+        with self.assertNumQueries(1):
+            # As base.html uses it
+            self.assertTrue(count > 0)
+            self.assertEqual(str(count), '4')
@@ -25,12 +25,8 @@ def mark_notification_as_read(request, notification_id):
 
 @login_required
 def mark_all_notifications_as_read(request):
-    # Update all unread notifications for the current user
-    notifications = Notification.objects.filter(user=request.user, is_read=False)
-    count = notifications.count()
-    
-    # Use update for efficiency instead of looping
-    notifications.update(is_read=True)
+    # Update all unread notifications for the current user (a single UPDATE that also adjusts the counter)
+    count = Notification.objects.filter(user=request.user).mark_read()
     
     if count > 0:
         messages.success(request, f"{count} notification{'s' if count > 1 else ''} marked as read.")
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from .models import (SchemeApplication, WorkLog, Department, DepartmentIncharge,
                         StudentDepartmentAssignment, PaymentRate, PaymentCalculation,
-                        DepartmentPaymentSummary, PaymentExport)
+                        DepartmentPaymentSummary, PaymentExport, PaymentRun,
+                        DirtyPaymentMonth, StudentMonthRollup, KpiSnapshot, DocumentBlob,
+                        DocumentPreview)
+from users.models import User
 @admin.register(WorkLog)
 class WorkLogAdmin(admin.ModelAdmin):
     list_display = ('student', 'date', 'hours_worked', 'is_verified')
@@ -11,7 +14,15 @@ class WorkLogAdmin(admin.ModelAdmin):
 
 @admin.action(description="Mark selected students as Completed")
 def mark_as_completed(modeladmin, request, queryset):
+    rows = list(queryset.values_list('student_id', 'status'))
     queryset.update(status="Completed")
+    # update() skips SchemeApplication.save, so clear the cached statuses and adjust the KPIs here
+    User.clear_scheme_status_cache({student_id for student_id, _ in rows})
+    left = {}
+    for _, status in rows:
+        if status != "Completed":
+            left[status] = left.get(status, 0) - 1
+    KpiSnapshot.adjust_on_commit(**SchemeApplication.status_kpi_changes(left))
 
 
 class SchemeApplicationAdmin(admin.ModelAdmin):
@@ -40,6 +51,12 @@ class StudentDepartmentAssignmentAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'assigned_at', 'department')
     search_fields = ('student__username', 'department__name')
 
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes skip StudentDepartmentAssignment.delete
+        removed = list(queryset.values_list('student_id', 'is_active'))
+        super().delete_queryset(request, queryset)
+        StudentDepartmentAssignment.assignments_changed(removed=removed)
+
 
 @admin.register(PaymentRate)
 class PaymentRateAdmin(admin.ModelAdmin):
@@ -77,10 +94,69 @@ class DepartmentPaymentSummaryAdmin(admin.ModelAdmin):
 @admin.register(PaymentExport)
 class PaymentExportAdmin(admin.ModelAdmin):
     list_display = ('export_type', 'export_month', 'department', 'student', 
-                   'file_name', 'exported_by', 'created_at')
+                   'file_name', 'file_size', 'exported_by', 'created_at')
     list_filter = ('export_type', 'export_month', 'created_at')
     search_fields = ('file_name', 'exported_by__username')
     ordering = ('-created_at',)
 
 
+
+@admin.register(PaymentRun)
+class PaymentRunAdmin(admin.ModelAdmin):
+    list_display = ('calculation_month', 'department', 'status', 'calculated_count',
+                   'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'calculation_month')
+    ordering = ('-created_at',)
+    readonly_fields = ('completed_departments', 'calculated_count', 'errors', 'claimed_by',
+                       'heartbeat_at', 'started_at', 'finished_at')
+
+
+
+@admin.register(DirtyPaymentMonth)
+class DirtyPaymentMonthAdmin(admin.ModelAdmin):
+    list_display = ('student', 'month', 'created_at')
+    list_filter = ('month',)
+    ordering = ('month',)
+
+
+
+@admin.register(StudentMonthRollup)
+class StudentMonthRollupAdmin(admin.ModelAdmin):
+    list_display = ('student', 'month', 'submitted_hours', 'verified_hours', 'rejected_hours', 'log_count')
+    list_filter = ('month',)
+    search_fields = ('student__username',)
+    readonly_fields = ('submitted_hours', 'verified_hours', 'rejected_hours', 'log_count', 'updated_at')
+
+
+@admin.register(KpiSnapshot)
+class KpiSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('total_hours', 'pending_applications_count', 'approved_students_count',
+                    'departments_count', 'unassigned_students_count', 'refreshed_at', 'updated_at')
+    readonly_fields = ('total_hours', 'pending_applications_count', 'approved_students_count',
+                       'departments_count', 'departments_with_incharge', 'departments_without_incharge',
+                       'assigned_students_count', 'unassigned_students_count', 'refreshed_at', 'updated_at')
+
+
+@admin.register(DocumentBlob)
+class DocumentBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'created_at', 'updated_at')
+    list_filter = ('ref_count',)
+    search_fields = ('name', 'digest')
+    readonly_fields = ('name', 'digest', 'size', 'ref_count', 'created_at', 'updated_at')
+
+
+@admin.register(DocumentPreview)
+class DocumentPreviewAdmin(admin.ModelAdmin):
+    list_display = ('source_name', 'status', 'claimed_by', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('source_name',)
+    readonly_fields = ('source_name', 'preview_name', 'error', 'claimed_by', 'created_at', 'updated_at')
+    actions = ['queue_again']
+
+    @admin.action(description="Queue selected previews for rendering again")
+    def queue_again(self, request, queryset):
+        count = queryset.update(status='Pending')
+        self.message_user(request, f"{count} previews queued.")
+
+
 admin.site.register(SchemeApplication, SchemeApplicationAdmin)
\ No newline at end of file
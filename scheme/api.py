@@ -0,0 +1,354 @@
+"""
+Read-only JSON endpoints behind the dashboards.
+
+Each endpoint returns the data of one dashboard so pages can refresh a
+section without re-rendering everything. A section query parameter (one
+name or several separated by commas) limits the response to the sections a
+page is updating, so polling the stat cards fetches counts only and paging
+a table fetches that table only. Responses carry an ETag and Last-Modified
+built from cheap version stamps (the KPI snapshot's updated_at, or the
+newest updated_at and a row count of the rollup tables behind the data),
+so a client revalidating an unchanged section gets a 304 without the data
+being queried at all.
+"""
+import hashlib
+from datetime import date
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Max, Prefetch, Q, Sum
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.timezone import localdate
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from users.decorators import role_required, approved_scheme_required
+from .membership import department_student_ids
+from .models import (SchemeApplication, WorkLog, DepartmentIncharge, PaymentCalculation, DepartmentPaymentSummary,
+                     StudentMonthRollup, KpiSnapshot)
+from .utils import get_paginated_queryset, get_keyset_paginated_queryset, month_range
+
+
+def serialize_work_log(log):
+    """JSON-ready dict for a work log; fetch logs with _with_students() to avoid a query per name"""
+    return {
+        'id': log.id,
+        'student_id': log.student_id,
+        'student_name': log.student.get_full_name(),
+        'student_username': log.student.username,
+        'student_email': log.student.email,
+        'date': log.date,
+        'time': log.time,
+        'hours_worked': log.hours_worked,
+        'description': log.description,
+        'is_verified': log.is_verified,
+        'is_rejected': log.is_rejected,
+        'rejection_reason': log.rejection_reason,
+    }
+
+
+def serialize_page(page):
+    """Navigation details of a Page or KeysetPage"""
+    if getattr(page, 'is_keyset', False):
+        return {
+            'has_next': page.has_next(),
+            'has_previous': page.has_previous(),
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+    return {
+        'number': page.number,
+        'num_pages': page.paginator.num_pages,
+        'count': page.paginator.count,
+        'start_index': page.start_index(),
+        'end_index': page.end_index(),
+        'has_next': page.has_next(),
+        'has_previous': page.has_previous(),
+    }
+
+
+def _sections(request, available):
+    """
+    Sections requested with the section query parameter
+
+    Returns:
+        set: The requested names found in available, or all of them when none are requested
+    """
+    requested = set(request.GET.get('section', '').split(',')) & set(available)
+    return requested or set(available)
+
+
+def _with_students(queryset):
+    """Prefetch students with their application names annotated"""
+    from users.models import User
+
+    return queryset.prefetch_related(Prefetch('student', queryset=User.objects.with_display_name()))
+
+
+def _version(request, scope):
+    """
+    Version stamp of the data behind an endpoint, computed once per request
+
+    Returns:
+        tuple: (last modified datetime or None, ETag string)
+    """
+    cached = getattr(request, '_api_version', None)
+    if cached is not None:
+        return cached
+
+    if scope == 'student':
+        stamp = StudentMonthRollup.objects.filter(student=request.user).aggregate(
+            modified=Max('updated_at'), rows=Count('id'), logs=Sum('log_count'))
+        parts = [stamp['rows'], stamp['logs'], request.user.get_scheme_statuses()]
+        modified = stamp['modified']
+    elif scope == 'department':
+        student_ids = department_student_ids(_incharge_department(request))
+        stamp = StudentMonthRollup.objects.filter(student_id__in=student_ids).aggregate(
+            modified=Max('updated_at'), rows=Count('id'), logs=Sum('log_count'))
+        parts = [stamp['rows'], stamp['logs'], hash(tuple(student_ids))]
+        modified = stamp['modified']
+    elif scope == 'coordinator':
+        # Every write behind the coordinator sections adjusts the snapshot, so
+        # its updated_at alone versions them with a single-row read
+        modified = KpiSnapshot.get().updated_at
+        parts = []
+    else:  # payments
+        calculations, summaries = _payment_querysets(request)
+        stamp = calculations.aggregate(modified=Max('updated_at'), rows=Count('id'))
+        summary_stamp = summaries.aggregate(modified=Max('updated_at'), rows=Count('id'))
+        parts = [stamp['rows'], summary_stamp['rows'], summary_stamp['modified']]
+        modified = max(filter(None, [stamp['modified'], summary_stamp['modified']]), default=None)
+
+    # The same data paged or filtered differently is a different representation
+    parts += [scope, request.user.pk, modified, sorted(request.GET.lists())]
+    etag = hashlib.md5(repr(parts).encode()).hexdigest()
+    request._api_version = (modified, etag)
+    return request._api_version
+
+
+def _conditional(scope):
+    """Decorate an endpoint with ETag / Last-Modified handling for a version scope"""
+    return condition(
+        etag_func=lambda request, *args, **kwargs: _version(request, scope)[1],
+        last_modified_func=lambda request, *args, **kwargs: _version(request, scope)[0],
+    )
+
+
+def _incharge_department(request):
+    if not hasattr(request, '_api_department'):
+        request._api_department = get_object_or_404(DepartmentIncharge, user=request.user).department
+    return request._api_department
+
+
+def _payment_querysets(request):
+    """Payment calculations and department summaries for the month, limited to the incharge's department"""
+    try:
+        year = int(request.GET.get('year', date.today().year))
+        month = int(request.GET.get('month', date.today().month))
+        month_filter = month_range(year, month, 'calculation_month')
+    except ValueError:
+        month_filter = month_range(date.today().year, date.today().month, 'calculation_month')
+
+    calculations = PaymentCalculation.objects.filter(**month_filter)
+    summaries = DepartmentPaymentSummary.objects.filter(**month_filter)
+    if hasattr(request.user, 'departmentincharge'):
+        department = request.user.departmentincharge.department
+        calculations = calculations.filter(department=department)
+        summaries = summaries.filter(department=department)
+    elif request.GET.get('department', '').isdigit():
+        calculations = calculations.filter(department_id=request.GET['department'])
+        summaries = summaries.filter(department_id=request.GET['department'])
+
+    if request.GET.get('student', '').isdigit():
+        calculations = calculations.filter(student_id=request.GET['student'])
+    return calculations, summaries
+
+
+@require_GET
+@login_required
+@role_required('student')
+@approved_scheme_required
+@cache_control(private=True, no_cache=True)
+@_conditional('student')
+def student_dashboard_data(request):
+    """
+    Hour totals and recent work logs of the logged-in student
+
+    Sections: stats, work_logs (paged with page like the dashboard).
+    """
+    from .stats import StudentStats
+
+    sections = _sections(request, ('stats', 'work_logs'))
+    data = {}
+    if 'stats' in sections:
+        stats = StudentStats(request.user, localdate())
+        data['stats'] = {
+            'total_verified': stats.total_verified,
+            'month_verified': stats.month_verified,
+            'month_submitted': stats.month_submitted,
+            'monthly_limit': stats.monthly_limit,
+            'remaining_hours': stats.remaining_hours,
+            'monthly_limit_reached': stats.monthly_limit_reached,
+            'logged_today': stats.logged_today,
+            'last_updated': stats.last_updated,
+        }
+    if 'work_logs' in sections:
+        work_logs, _, _ = get_paginated_queryset(
+            request, _with_students(WorkLog.objects.filter(student=request.user)).order_by('-date', '-time'),
+            per_page_default=5
+        )
+        data['work_logs'] = [serialize_work_log(log) for log in work_logs]
+        data['page'] = serialize_page(work_logs)
+    return JsonResponse(data)
+
+
+@require_GET
+@login_required
+@role_required('department_encharge')
+@cache_control(private=True, no_cache=True)
+@_conditional('department')
+def department_dashboard_data(request):
+    """
+    Counts, pending and verified work logs and student hour totals of the incharge's department
+
+    Sections: counts, pending, verified, summary. Query parameters
+    pending_cursor, verified_cursor and summary_page page the lists the same
+    way as the dashboard.
+    """
+    sections = _sections(request, ('counts', 'pending', 'verified', 'summary'))
+    department = _incharge_department(request)
+    student_ids = department_student_ids(department)
+    logs = _with_students(WorkLog.objects.filter(student_id__in=student_ids))
+
+    data = {'department': {'id': department.id, 'name': department.name, 'code': department.code}}
+    if 'counts' in sections:
+        data.update(WorkLog.objects.filter(student_id__in=student_ids).aggregate(
+            pending_count=Count('id', filter=Q(is_verified=False, is_rejected=False)),
+            verified_count=Count('id', filter=Q(is_verified=True)),
+        ))
+        data['assigned_students_count'] = len(student_ids)
+    if 'pending' in sections:
+        pending, _, _ = get_keyset_paginated_queryset(
+            request, logs.filter(is_verified=False, is_rejected=False),
+            per_page_default=10, per_page_options=[10], cursor_param='pending_cursor'
+        )
+        data['pending_work_logs'] = [serialize_work_log(log) for log in pending]
+        data['pending_page'] = serialize_page(pending)
+    if 'verified' in sections:
+        verified, _, _ = get_keyset_paginated_queryset(
+            request, logs.filter(is_verified=True),
+            per_page_default=15, per_page_options=[15], cursor_param='verified_cursor'
+        )
+        data['verified_work_logs'] = [serialize_work_log(log) for log in verified]
+        data['verified_page'] = serialize_page(verified)
+    if 'summary' in sections:
+        student_hours = Paginator(WorkLog.objects.filter(is_verified=True, student_id__in=student_ids).values(
+            'student__username', 'student__first_name', 'student__last_name'
+        ).annotate(total_hours=Sum('hours_worked')).order_by('-total_hours'), 20).get_page(
+            request.GET.get('summary_page', 1)
+        )
+        data['student_hours'] = list(student_hours)
+        data['summary_page'] = serialize_page(student_hours)
+    return JsonResponse(data)
+
+
+@require_GET
+@login_required
+@role_required('el_coordinator')
+@cache_control(private=True, no_cache=True)
+@_conditional('coordinator')
+def coordinator_dashboard_data(request):
+    """
+    KPI totals and pending applications across all departments
+
+    Sections: kpis, pending_applications (paged with page like the dashboard).
+    """
+    sections = _sections(request, ('kpis', 'pending_applications'))
+    data = {}
+    if 'kpis' in sections:
+        kpis = KpiSnapshot.get()
+        data['kpis'] = {
+            'total_hours': kpis.total_hours,
+            'pending_applications_count': kpis.pending_applications_count,
+            'approved_students_count': kpis.approved_students_count,
+            'departments_count': kpis.departments_count,
+            'departments_with_incharge': kpis.departments_with_incharge,
+            'assigned_students_count': kpis.assigned_students_count,
+            'unassigned_students_count': kpis.unassigned_students_count,
+            'updated_at': kpis.updated_at,
+        }
+    if 'pending_applications' in sections:
+        pending_applications, _, _ = get_paginated_queryset(
+            request, SchemeApplication.objects.filter(status='Pending').select_related('student').order_by('-id'),
+            per_page_default=10
+        )
+        data['pending_applications'] = [
+            {
+                'id': app.id,
+                'first_name': app.first_name,
+                'last_name': app.last_name,
+                'username': app.student.username,
+                'prn_number': app.prn_number,
+                'department': app.department,
+                'submitted': app.student.date_joined,
+                'url': reverse('view_application', args=[app.id]),
+            }
+            for app in pending_applications
+        ]
+        data['pending_applications_page'] = serialize_page(pending_applications)
+    return JsonResponse(data)
+
+
+@require_GET
+@login_required
+@role_required(['el_coordinator', 'department_encharge'])
+@cache_control(private=True, no_cache=True)
+@_conditional('payments')
+def payment_reports_data(request):
+    """
+    Payment calculations and department summaries for a month (year, month, department, student, page)
+
+    Sections: totals, calculations, summaries.
+    """
+    sections = _sections(request, ('totals', 'calculations', 'summaries'))
+    calculations, summaries = _payment_querysets(request)
+    data = {}
+    if 'totals' in sections:
+        totals = calculations.aggregate(total_amount=Sum('total_amount'), total_hours=Sum('total_hours'),
+                                        total_students=Count('id'))
+        data['totals'] = {
+            'total_amount': totals['total_amount'] or 0,
+            'total_hours': totals['total_hours'] or 0,
+            'total_students': totals['total_students'],
+        }
+    if 'calculations' in sections:
+        page, _, _ = get_paginated_queryset(
+            request,
+            _with_students(calculations.select_related('department')).order_by('-created_at'),
+            per_page_default=20, per_page_options=[20, 50, 100]
+        )
+        data['payment_calculations'] = [
+            {
+                'id': calc.id,
+                'student_id': calc.student_id,
+                'student_name': calc.student.get_full_name(),
+                'student_username': calc.student.username,
+                'department': calc.department.name,
+                'department_code': calc.department.code,
+                'calculation_month': calc.calculation_month,
+                'total_hours': calc.total_hours,
+                'rate_per_hour': calc.rate_per_hour,
+                'total_amount': calc.total_amount,
+                'url': reverse('payment_calculation_detail', args=[calc.id]),
+            }
+            for calc in page
+        ]
+        data['page'] = serialize_page(page)
+    if 'summaries' in sections:
+        data['department_summaries'] = list(summaries.order_by('department__name').values(
+            'department_id', 'department__name', 'department__code', 'total_students', 'total_hours',
+            'total_amount', 'average_hours_per_student'
+        ))
+    return JsonResponse(data)
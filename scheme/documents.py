@@ -0,0 +1,159 @@
+"""
+Serving uploaded application documents.
+
+Documents (Aadhar cards, income certificates, ...) are never exposed under
+MEDIA_URL. Each request goes through a view that checks the viewer against
+the application; the file is then either streamed by Django, with Range
+and conditional request support, or handed to the front proxy with an
+X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) header so that
+no worker is held for the transfer (settings.DOCUMENT_SERVE_MODE).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .membership import student_department_id
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def can_view_documents(user, application):
+    """
+    Whether a user may open an application's documents
+
+    The student who applied, coordinators, staff, and the incharge of the
+    department the student is assigned to.
+    """
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or user.role == 'el_coordinator':
+        return True
+    if user.role == 'student':
+        return application.student_id == user.id
+    if user.role == 'department_encharge':
+        incharge = getattr(user, 'departmentincharge', None)
+        return incharge is not None and student_department_id(application.student_id) == incharge.department_id
+    return False
+
+
+class RangeFile:
+    """Read-only view of length bytes of a file from start, for streaming a byte range"""
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    The byte range asked for by a single-range Range header
+
+    Returns:
+        tuple: (start, end) inclusive, None to send the whole file (no, malformed or
+        multi-part range), or False if the range lies outside the file
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, end
+
+
+def serve_stored_file(request, storage, name, filename):
+    """
+    Respond with a stored file inline, honouring Range and conditional requests
+
+    Args:
+        storage: File system storage holding the file
+        name: Storage name of the file
+        filename: Name the browser should show or save the file as
+    """
+    path = storage.path(name)
+    stat = os.stat(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    last_modified = http_date(stat.st_mtime)
+
+    mode = getattr(settings, 'DOCUMENT_SERVE_MODE', 'django')
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        # The proxy answers Range and conditional requests itself
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            prefix = getattr(settings, 'DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+        else:
+            response['X-Sendfile'] = path
+        response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+        return _document_headers(response, etag, last_modified)
+
+    # Whole seconds, as HTTP dates have no fractions and If-Modified-Since would never match
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return _document_headers(not_modified, etag, last_modified)
+
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if byte_range is not None and not _if_range_matches(request, etag, stat.st_mtime):
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return _document_headers(response, etag, last_modified)
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        # A plain file object lets the server use wsgi.file_wrapper (sendfile) for the body
+        response = FileResponse(file, content_type=content_type, filename=filename)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206,
+                                content_type=content_type, filename=filename)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return _document_headers(response, etag, last_modified)
+
+
+def _if_range_matches(request, etag, mtime):
+    """Whether a range request may be answered with a part of the current file (If-Range)"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(mtime) <= if_range_date
+
+
+def _document_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Accept-Ranges'] = 'bytes'
+    # Personal documents: never kept by shared caches
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
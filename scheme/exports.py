@@ -0,0 +1,444 @@
+"""
+Payment report exports.
+
+Each report is described as headers plus a lazily evaluated row iterator,
+so writers can stream rows to the client without holding them in memory.
+Generated workbooks are stored under MEDIA_ROOT/exports and reused until
+the data behind them changes.
+"""
+import calendar
+import csv
+import datetime
+import hashlib
+import json
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum, Max, Count, Value, OuterRef, Subquery, CharField
+from django.db.models.functions import Concat, Coalesce, Length, NullIf
+from django.http import StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+
+from .models import (SchemeApplication, WorkLog, PaymentCalculation, DepartmentPaymentSummary, PaymentRate,
+                     PaymentExport, StudentMonthRollup)
+from .utils import month_range
+from users.models import application_name_subquery
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_CHUNK_SIZE = 2000
+MAX_COLUMN_WIDTH = 50
+NUMBER_COLUMN_WIDTH = 14
+
+
+def _student_name_expression():
+    """SQL expression for a student's display name, taken from their scheme application"""
+    return Coalesce(
+        application_name_subquery(OuterRef('student')),
+        NullIf(Concat('student__first_name', Value(' '), 'student__last_name', output_field=CharField()), Value(' ')),
+        'student__username',
+        output_field=CharField(),
+    )
+
+
+def _prn_expression():
+    """SQL expression for a student's PRN number, taken from their scheme application"""
+    application = SchemeApplication.objects.filter(student=OuterRef('student')).values('prn_number')[:1]
+    return Coalesce(Subquery(application), Value('N/A'), output_field=CharField())
+
+
+def _column_widths(headers, text_widths):
+    """
+    Column widths from header lengths and the longest text value per column
+
+    Args:
+        headers: List of column headers
+        text_widths: {column index: longest value length} for text columns; other columns are numeric
+    """
+    widths = []
+    for index, header in enumerate(headers):
+        longest = max(len(header), text_widths.get(index) or 0, 0 if index in text_widths else NUMBER_COLUMN_WIDTH - 2)
+        widths.append(min(longest + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def _sheet_title(title):
+    """Excel sheet titles are limited to 31 characters and cannot contain []:*?/\\"""
+    return re.sub(r'[\[\]:*?/\\]', '-', title)[:31]
+
+
+def student_report(student, year, month):
+    """Work logs and amounts for one student in a month"""
+    payment_calculation = PaymentCalculation.objects.filter(
+        student=student,
+        **month_range(year, month, 'calculation_month')
+    ).first()
+    if payment_calculation:
+        rate_per_hour = payment_calculation.rate_per_hour
+    else:
+        current_rate = PaymentRate.get_current_rate()
+        rate_per_hour = current_rate.rate_per_hour if current_rate else 0
+
+    work_logs = WorkLog.objects.filter(
+        student=student,
+        **month_range(year, month)
+    ).order_by('date')
+
+    verified_hours = work_logs.filter(is_verified=True).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
+
+    def rows():
+        for log_date, hours, description, is_verified in work_logs.values_list(
+                'date', 'hours_worked', 'description', 'is_verified').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                log_date.strftime('%Y-%m-%d'),
+                hours,
+                description[:50] + '...' if len(description) > 50 else description,
+                'Yes' if is_verified else 'No',
+                float(rate_per_hour) if is_verified else 0,
+                float(rate_per_hour * hours) if is_verified else 0,
+            ]
+
+    student_name = student.get_full_name()
+    headers = ['Date', 'Hours', 'Description', 'Verified', 'Rate/Hour', 'Amount']
+    return {
+        'title': f"{student_name} - {calendar.month_name[month]} {year}",
+        'headers': headers,
+        'rows': rows(),
+        'widths': _column_widths(headers, {0: 10, 2: 53, 3: 3}),
+        'footer': [None, None, None, None, 'Total:', float(rate_per_hour * verified_hours)],
+        'filename': f"payment_report_{student_name.replace(' ', '_')}_{year}_{month:02d}",
+    }
+
+
+def department_report(departments, year, month, title_scope):
+    """Payment calculations of every student in the given departments for a month"""
+    calculations = PaymentCalculation.objects.filter(
+        department__in=departments,
+        **month_range(year, month, 'calculation_month')
+    ).annotate(
+        student_name=_student_name_expression(),
+        prn=_prn_expression(),
+    )
+
+    longest = calculations.aggregate(
+        name=Max(Length('student_name')),
+        prn=Max(Length('prn')),
+        department=Max(Length('department__name')),
+        grand_total=Sum('total_amount'),
+    )
+
+    def rows():
+        for name, prn, department_name, total_hours, rate_per_hour, total_amount in calculations.order_by(
+                'department__name', 'student__first_name').values_list(
+                'student_name', 'prn', 'department__name', 'total_hours', 'rate_per_hour', 'total_amount'
+                ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [name, prn, department_name, float(total_hours), float(rate_per_hour), float(total_amount)]
+
+    headers = ['Student Name', 'PRN', 'Department', 'Total Hours', 'Rate/Hour', 'Total Amount']
+    return {
+        'title': f"{title_scope} - {calendar.month_name[month]} {year}",
+        'headers': headers,
+        'rows': rows(),
+        'widths': _column_widths(headers, {0: longest['name'], 1: longest['prn'], 2: longest['department']}),
+        'footer': [None, None, None, None, 'Grand Total:', float(longest['grand_total'] or 0)],
+        'filename': f"payment_report_departments_{year}_{month:02d}",
+    }
+
+
+def summary_report(year, month):
+    """Department payment summaries for a month"""
+    summaries = DepartmentPaymentSummary.objects.filter(
+        **month_range(year, month, 'calculation_month')
+    )
+
+    totals = summaries.aggregate(
+        department=Max(Length('department__name')),
+        total_students=Sum('total_students'),
+        total_hours=Sum('total_hours'),
+        total_amount=Sum('total_amount'),
+    )
+    total_students = totals['total_students'] or 0
+    total_hours = float(totals['total_hours'] or 0)
+
+    def rows():
+        for department_name, students, hours, amount, average in summaries.order_by('department__name').values_list(
+                'department__name', 'total_students', 'total_hours', 'total_amount', 'average_hours_per_student'
+                ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [department_name, students, float(hours), float(amount), float(average)]
+
+    headers = ['Department', 'Total Students', 'Total Hours', 'Total Amount', 'Avg Hours/Student']
+    return {
+        'title': f"Payment Summary - {calendar.month_name[month]} {year}",
+        'headers': headers,
+        'rows': rows(),
+        'widths': _column_widths(headers, {0: max(totals['department'] or 0, len('TOTALS:'))}),
+        'footer': [
+            'TOTALS:',
+            total_students,
+            total_hours,
+            float(totals['total_amount'] or 0),
+            total_hours / total_students if total_students > 0 else 0,
+        ],
+        'filename': f"payment_summary_all_departments_{year}_{month:02d}",
+    }
+
+
+def write_xlsx(report, output):
+    """
+    Write a report to a file object with openpyxl's write-only mode
+
+    Rows are serialised as they are produced, so memory use does not grow
+    with the number of rows. Column widths have to be known before the
+    first row in this mode, which is why reports carry them up front.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(_sheet_title(report['title']))
+
+    for index, width in enumerate(report['widths'], 1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_row = []
+    for header in report['headers']:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal='center')
+        header_row.append(cell)
+    ws.append(header_row)
+
+    for row in report['rows']:
+        ws.append(row)
+
+    # Blank row, then the totals in bold
+    ws.append([])
+    footer_row = []
+    for value in report['footer']:
+        cell = WriteOnlyCell(ws, value=value)
+        if value is not None:
+            cell.font = Font(bold=True)
+        footer_row.append(cell)
+    ws.append(footer_row)
+
+    wb.save(output)
+
+
+# ---------------------------------------------------------------------------
+# Raw CSV / JSONL exports
+# ---------------------------------------------------------------------------
+
+RAW_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+PAYMENT_CALCULATION_FIELDS = [
+    'student_id', 'student_name', 'prn', 'department', 'calculation_month',
+    'total_hours', 'rate_per_hour', 'total_amount', 'calculated_by', 'updated_at',
+]
+
+DEPARTMENT_SUMMARY_FIELDS = [
+    'department', 'calculation_month', 'total_students', 'total_hours',
+    'total_amount', 'average_hours_per_student', 'updated_at',
+]
+
+WORK_LOG_FIELDS = [
+    'student_id', 'student_name', 'prn', 'department', 'date', 'time', 'hours_worked',
+    'description', 'is_verified', 'is_rejected', 'rejection_reason',
+]
+
+
+def payment_calculation_rows(queryset):
+    """Raw PaymentCalculation rows, fetched in chunks with names and PRNs joined in SQL"""
+    return queryset.annotate(
+        student_name=_student_name_expression(),
+        prn=_prn_expression(),
+    ).order_by('calculation_month', 'department__name', 'student__first_name').values_list(
+        'student_id', 'student_name', 'prn', 'department__name', 'calculation_month',
+        'total_hours', 'rate_per_hour', 'total_amount', 'calculated_by__username', 'updated_at'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def department_summary_rows(queryset):
+    """Raw DepartmentPaymentSummary rows, fetched in chunks"""
+    return queryset.order_by('calculation_month', 'department__name').values_list(
+        'department__name', 'calculation_month', 'total_students', 'total_hours',
+        'total_amount', 'average_hours_per_student', 'updated_at'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def work_log_rows(queryset):
+    """Raw WorkLog rows, fetched in chunks with student names, PRNs and departments joined in SQL"""
+    return queryset.annotate(
+        student_name=_student_name_expression(),
+        prn=_prn_expression(),
+    ).order_by('date', 'time', 'id').values_list(
+        'student_id', 'student_name', 'prn', 'student__studentdepartmentassignment__department__name',
+        'date', 'time', 'hours_worked', 'description', 'is_verified', 'is_rejected', 'rejection_reason'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object whose write() hands the value back, so csv.writer can feed a generator"""
+    def write(self, value):
+        return value
+
+
+def _stream_lines(fields, rows, export_format):
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def streaming_export_response(fields, rows, export_format, filename):
+    """
+    StreamingHttpResponse writing rows as CSV or JSON Lines as they are fetched
+
+    The first bytes go out as soon as the first chunk of rows is read, and
+    memory use stays constant however many rows the export covers.
+    """
+    response = StreamingHttpResponse(
+        _stream_lines(fields, rows, export_format),
+        content_type=RAW_FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Stored export artifacts
+# ---------------------------------------------------------------------------
+
+def _version_stamp(queryset, field='updated_at'):
+    """Version of a set of rows: newest change timestamp plus row count (so deletions change it too)"""
+    stamp = queryset.aggregate(latest=Max(field), count=Count('pk'))
+    latest = stamp['latest'].strftime('%Y%m%d%H%M%S%f') if stamp['latest'] else '0'
+    return f"{latest}-{stamp['count']}"
+
+
+def data_version(export_type, year, month, departments=None, student=None):
+    """
+    Version of the data behind an export, taken from the latest updated_at of its rows
+
+    Args:
+        export_type: 'student', 'department' or any other value for the summary report
+        year, month: Report month
+        departments: Departments covered by a department report
+        student: Student covered by a student report
+    """
+    if export_type == 'student':
+        calculation_month = datetime.date(year, month, 1)
+        parts = [
+            _version_stamp(PaymentCalculation.objects.filter(student=student, calculation_month=calculation_month)),
+            _version_stamp(StudentMonthRollup.objects.filter(student=student, month=calculation_month)),
+            _version_stamp(PaymentRate.objects.all()),
+        ]
+    elif export_type == 'department':
+        parts = [_version_stamp(PaymentCalculation.objects.filter(
+            department__in=departments,
+            **month_range(year, month, 'calculation_month')
+        ))]
+    else:
+        parts = [_version_stamp(DepartmentPaymentSummary.objects.filter(
+            **month_range(year, month, 'calculation_month')
+        ))]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+
+def get_export_artifact(export_type, export_month, department_id, student_id, version, build_report):
+    """
+    Get the stored workbook for an export, generating it only when no file exists for this data version
+
+    Generating a new version evicts the files of older versions of the same export,
+    then trims the whole store to PAYMENT_EXPORT_CACHE_MAX_BYTES.
+
+    Args:
+        export_type, export_month, department_id, student_id: Identify the export
+        version: Data version from data_version()
+        build_report: Callable returning the report dict, called on a cache miss
+
+    Returns:
+        dict: 'file' (the stored workbook opened for reading; the caller closes it),
+        'file_path', 'file_name' and 'file_size'
+    """
+    same_export = PaymentExport.objects.filter(
+        export_type=export_type,
+        export_month=export_month,
+        department_id=department_id,
+        student_id=student_id,
+    ).exclude(file_path='')
+
+    # The file is opened here rather than by the caller: once open it can still be
+    # read if another request evicts it, and a file evicted since the lookup is regenerated
+    cached = same_export.filter(data_version=version).order_by('-created_at').first()
+    if cached:
+        try:
+            file = default_storage.open(cached.file_path, 'rb')
+        except FileNotFoundError:
+            pass
+        else:
+            return {'file': file, 'file_path': cached.file_path, 'file_name': cached.file_name,
+                    'file_size': cached.file_size}
+
+    report = build_report()
+    scope = f"department-{department_id}" if department_id else f"student-{student_id}" if student_id else 'all'
+    path = f"exports/{export_type}/{export_month:%Y-%m}/{scope}-{version}.xlsx"
+
+    with tempfile.TemporaryFile() as output:
+        write_xlsx(report, output)
+        output.seek(0)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        path = default_storage.save(path, File(output))
+    file = default_storage.open(path, 'rb')
+
+    # Older versions of this export are stale now
+    for stale_path in same_export.exclude(data_version=version).values_list('file_path', flat=True).distinct():
+        _evict_artifact(stale_path)
+
+    artifact = {
+        'file': file,
+        'file_path': path,
+        'file_name': f"{report['filename']}.xlsx",
+        'file_size': file.size,
+    }
+    enforce_export_cache_budget(keep=path, incoming_size=artifact['file_size'])
+    return artifact
+
+
+def enforce_export_cache_budget(keep=None, incoming_size=0):
+    """Evict least recently downloaded artifacts until the store fits PAYMENT_EXPORT_CACHE_MAX_BYTES"""
+    max_bytes = getattr(settings, 'PAYMENT_EXPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+
+    artifacts = PaymentExport.objects.exclude(file_path='').values('file_path').annotate(
+        last_used=Max('created_at'),
+        size=Max('file_size'),
+    ).order_by('last_used')
+
+    total = incoming_size + sum(artifact['size'] for artifact in artifacts if artifact['file_path'] != keep)
+    for artifact in artifacts:
+        if total <= max_bytes:
+            break
+        if artifact['file_path'] == keep:
+            continue
+        _evict_artifact(artifact['file_path'])
+        total -= artifact['size']
+
+
+def _evict_artifact(file_path):
+    """Delete a stored artifact; its PaymentExport rows stay as the export history"""
+    if default_storage.exists(file_path):
+        default_storage.delete(file_path)
+    PaymentExport.objects.filter(file_path=file_path).update(file_path='')
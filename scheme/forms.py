@@ -1,7 +1,10 @@
 from django import forms
 from .models import (SchemeApplication, WorkLog, Department, DepartmentIncharge, 
-                    StudentDepartmentAssignment, PaymentRate, PaymentCalculation)
+                    StudentDepartmentAssignment, PaymentRate, PaymentCalculation,
+                    StudentMonthRollup, DocumentUpload, validate_monthly_hours)
 from users.models import User
+from .utils import month_range
+from .membership import department_student_ids
 import re
 from django.contrib.auth.forms import UserCreationForm
 from django.utils import timezone
@@ -38,6 +41,69 @@ class SchemeApplicationForm(forms.ModelForm):
             'caste_validity_certificate': forms.ClearableFileInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        # Student whose chunked uploads (see DocumentUpload) may stand in for the files
+        self.student = kwargs.pop('student', None)
+        super().__init__(*args, **kwargs)
+        self.document_uploads = {}
+        self._upload_files = []
+        for name in SchemeApplication.DOCUMENT_FIELDS:
+            self.fields[f'{name}_upload'] = forms.UUIDField(required=False, widget=forms.HiddenInput)
+            # A referenced upload replaces the multipart file, so the file itself is not required
+            if self.is_bound and self.data.get(f'{name}_upload'):
+                self.fields[name].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for name in SchemeApplication.DOCUMENT_FIELDS:
+            upload_id = cleaned_data.get(f'{name}_upload')
+            if not upload_id or self.files.get(name):
+                continue
+            upload = DocumentUpload.objects.filter(id=upload_id, student=self.student, field_name=name).first()
+            if upload is None or not upload.is_complete:
+                self.add_error(name, "The uploaded file was not found or is incomplete. Please upload it again.")
+                continue
+            # Assigned to the model field like a multipart file; the field validators run on it in _post_clean
+            cleaned_data[name] = upload.open()
+            self._upload_files.append(cleaned_data[name])
+            self.document_uploads[name] = upload
+        self._validate_document_content(cleaned_data)
+        return cleaned_data
+
+    def _validate_document_content(self, cleaned_data):
+        """Check that new documents really are PDFs and images, all of them at once"""
+        from .validation import validate_documents
+
+        new_files = {
+            name: cleaned_data[name] for name in SchemeApplication.DOCUMENT_FIELDS
+            if cleaned_data.get(name) and (name in self.files or name in self.document_uploads)
+        }
+        for name, error in validate_documents(new_files).items():
+            self.add_error(name, error)
+
+    def full_clean(self):
+        valid = False
+        try:
+            super().full_clean()
+            valid = not self._errors
+        finally:
+            # The chunked upload files of a valid form stay open until save() has stored them
+            if not valid:
+                self.close_document_uploads()
+
+    def close_document_uploads(self):
+        """Close the files of the chunked uploads opened while cleaning"""
+        for file in self._upload_files:
+            file.close()
+        self._upload_files = []
+
+    def discard_document_uploads(self):
+        """Delete the chunked uploads taken by the saved application, closing their files"""
+        self.close_document_uploads()
+        for upload in self.document_uploads.values():
+            upload.delete()
+        self.document_uploads = {}
+
     def clean_prn_number(self):
         prn = self.cleaned_data.get('prn_number', '').strip().upper()
         if not prn:
@@ -73,6 +139,8 @@ class WorkLogForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        # Optional StudentStats for self.user, saves recounting today's log and the monthly hours
+        self.stats = kwargs.pop('stats', None)
         super().__init__(*args, **kwargs)
 
     def clean_hours_worked(self):
@@ -96,39 +164,41 @@ class WorkLogForm(forms.ModelForm):
             if today.weekday() == 6:  # Sunday is weekday 6
                 raise forms.ValidationError("Work logs cannot be added on Sundays.")
             
-            # Check if user already has a work log for today
-            existing_worklog = WorkLog.objects.filter(
-                student=self.user,
-                date=today
-            )
+            is_update = bool(self.instance and self.instance.pk)
+            stats = self.stats if self.stats is not None and self.stats.covers(today) else None
             
-            # If this is an update, exclude the current instance
-            if self.instance and self.instance.pk:
-                existing_worklog = existing_worklog.exclude(pk=self.instance.pk)
+            # Check if user already has a work log for today
+            if stats is not None and not is_update:
+                already_logged = stats.logged_today
+            else:
+                existing_worklog = WorkLog.objects.filter(
+                    student=self.user,
+                    date=today
+                )
+                
+                # If this is an update, exclude the current instance
+                if is_update:
+                    existing_worklog = existing_worklog.exclude(pk=self.instance.pk)
+                already_logged = existing_worklog.exists()
             
-            if existing_worklog.exists():
+            if already_logged:
                 raise forms.ValidationError("You can only submit one work log per day.")
             
-            # Check monthly hours limit
-            current_month_hours = WorkLog.objects.filter(
-                student=self.user,
-                date__year=today.year,
-                date__month=today.month,
-                is_rejected=False
-            )
+            # Check monthly hours limit using the dashboard stats or the student's monthly rollup
+            if stats is not None:
+                total_hours = stats.month_submitted
+            else:
+                total_hours = StudentMonthRollup.get_for(self.user.pk, today).submitted_hours
             
             # Exclude current instance if updating
             if self.instance and self.instance.pk:
-                current_month_hours = current_month_hours.exclude(pk=self.instance.pk)
+                total_hours -= WorkLog.objects.filter(
+                    pk=self.instance.pk,
+                    **month_range(today.year, today.month),
+                    is_rejected=False
+                ).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
             
-            total_hours = current_month_hours.aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-            
-            if total_hours + hours_worked > 30:
-                remaining_hours = 30 - total_hours
-                if remaining_hours <= 0:
-                    raise forms.ValidationError("Monthly limit of 30 hours has been reached for this month.")
-                else:
-                    raise forms.ValidationError(f"Adding {hours_worked} hours would exceed monthly limit. You can only add {remaining_hours} more hours this month.")
+            validate_monthly_hours(total_hours, hours_worked)
         
         return cleaned_data
 
@@ -218,6 +288,31 @@ class BulkStudentAssignmentForm(forms.Form):
     )
 
 
+class WorkLogImportForm(forms.Form):
+    """Form for a department incharge to upload work logs from an attendance system"""
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.ndjson'}),
+        help_text="CSV with a header row, or JSONL, with columns prn, date (YYYY-MM-DD), hours and description"
+    )
+    verified = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text="Import the logs as already verified"
+    )
+    download_report = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text="Download the per-row report as CSV instead of showing it"
+    )
+
+    def clean_file(self):
+        from .imports import detect_import_format
+        uploaded = self.cleaned_data['file']
+        if detect_import_format(uploaded.name) is None:
+            raise forms.ValidationError("Only .csv and .jsonl files can be imported.")
+        return uploaded
+
+
 # Payment Module Forms
 
 class PaymentRateForm(forms.ModelForm):
@@ -292,8 +387,7 @@ class PaymentReportFilterForm(forms.Form):
             self.fields['student'].queryset = User.objects.filter(
                 role='student',
                 is_registered=True,
-                studentdepartmentassignment__department=department,
-                studentdepartmentassignment__is_active=True
+                pk__in=department_student_ids(department)
             )
             # Hide department field for department incharge
             self.fields['department'].widget = forms.HiddenInput()
@@ -0,0 +1,299 @@
+"""
+Bulk work log imports.
+
+Departments that record hours on an attendance system export them as CSV
+or JSONL rows of (prn, date, hours, description). Rows are parsed lazily,
+checked a batch at a time against the rules a student's own submission
+goes through (Sundays, 1-3 hours, one log per day, the monthly cap) and
+inserted with bulk_create, so tens of thousands of rows load in seconds.
+Every row ends up in a report as accepted or rejected with the reason.
+"""
+import csv
+import datetime
+import io
+import json
+
+from django.db import IntegrityError, transaction
+
+from .membership import department_student_ids
+from .models import (SchemeApplication, WorkLog, StudentMonthRollup, DirtyPaymentMonth, KpiSnapshot,
+                     monthly_hour_cap)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_BATCH_SIZE = 1000
+MIN_DESCRIPTION_LENGTH = 10
+DUPLICATE_DAY_ERROR = 'A work log already exists for this student on this date'
+
+
+def detect_import_format(file_name):
+    """Import format from a file name's extension (csv, or jsonl for .jsonl/.ndjson), None if unknown"""
+    extension = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return None
+
+
+def parse_import_rows(stream, import_format):
+    """
+    Lazily parse an import file into (row number, record) pairs
+
+    Args:
+        stream: Binary or text file object
+        import_format: 'csv' (with a header row) or 'jsonl'
+
+    Yields:
+        tuple: (row_number, dict) where the dict is None for a line that could not be parsed
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        if reader.fieldnames:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for record in reader:
+            # Data rows are numbered from 2, after the header
+            yield reader.line_num, record
+        return
+
+    for row_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield row_number, record if isinstance(record, dict) else None
+
+
+class WorkLogImport:
+    """
+    Validate and insert work log rows in batches
+
+    Args:
+        department: Only accept students actively assigned to this department (None for any)
+        verify: Insert the logs as already verified
+        dry_run: Validate and report without inserting anything
+        batch_size: Rows validated and inserted per transaction
+
+    Attributes:
+        results: One dict per row with row, prn, date, hours, status ('accepted' or 'rejected') and error
+    """
+    def __init__(self, department=None, verify=False, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+        self.department = department
+        self.verify = verify
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.today = datetime.date.today()
+        self.cap = monthly_hour_cap()
+        self.results = []
+        # PRN -> student id, filled one lookup per batch for PRNs not seen before
+        self._students = {}
+        # (student id, date) pairs already in the database or accepted from this file
+        self._logged_days = set()
+
+    @property
+    def accepted_count(self):
+        return sum(1 for result in self.results if result['status'] == 'accepted')
+
+    @property
+    def rejected_count(self):
+        return len(self.results) - self.accepted_count
+
+    def run(self, rows):
+        """
+        Import (row number, record) pairs such as those from parse_import_rows
+
+        Returns:
+            WorkLogImport: self, with results filled in
+        """
+        batch = []
+        for row_number, record in rows:
+            batch.append((row_number, record))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        return self
+
+    def _import_batch(self, batch):
+        parsed = []
+        for row_number, record in batch:
+            result = {'row': row_number, 'prn': '', 'date': '', 'hours': '', 'status': 'rejected', 'error': ''}
+            self.results.append(result)
+            try:
+                parsed.append((result, self._parse_record(record, result)))
+            except ValueError as e:
+                result['error'] = str(e)
+
+        self._resolve_students({values['prn'] for _, values in parsed})
+
+        with transaction.atomic():
+            student_dates, used_hours = self._lock_month_totals(parsed)
+            accepted = []
+            for result, values in parsed:
+                student_id = self._students.get(values['prn'])
+                key = (student_id, values['date'])
+                month_key = (student_id, values['date'].replace(day=1))
+
+                if student_id is None:
+                    result['error'] = 'No approved scheme application with this PRN' + (
+                        ' in your department' if self.department else '')
+                elif key in self._logged_days:
+                    result['error'] = DUPLICATE_DAY_ERROR
+                elif used_hours.get(month_key, 0) + values['hours'] > self.cap:
+                    remaining_hours = max(self.cap - used_hours.get(month_key, 0), 0)
+                    result['error'] = f"Exceeds the monthly limit of {self.cap} hours ({remaining_hours} remaining)"
+                else:
+                    result['status'] = 'accepted'
+                    self._logged_days.add(key)
+                    used_hours[month_key] = used_hours.get(month_key, 0) + values['hours']
+                    accepted.append((result, WorkLog(
+                        student_id=student_id,
+                        date=values['date'],
+                        hours_worked=values['hours'],
+                        description=values['description'],
+                        is_verified=self.verify,
+                    )))
+
+            if self.dry_run:
+                return
+            # bulk_create skips WorkLog.save, so sync the rollups, KPIs and payment flags here;
+            # refreshing every locked month also drops rollups created just for locking
+            work_logs = self._insert(accepted)
+            StudentMonthRollup.refresh(student_dates)
+            KpiSnapshot.adjust_hours_on_commit(sum(log.hours_worked for log in work_logs))
+            if self.verify and work_logs:
+                DirtyPaymentMonth.mark([(log.student_id, log.date) for log in work_logs])
+
+    def _insert(self, accepted):
+        """
+        Insert the accepted logs, rejecting any whose day was logged meanwhile
+
+        A student's own submission can save a log for the same day after the
+        batch was checked; the insert then fails on (student, date), so those
+        rows are reported as duplicates and the rest of the batch is retried.
+
+        Args:
+            accepted: (result, unsaved WorkLog) pairs
+
+        Returns:
+            list: The WorkLog objects inserted
+        """
+        while True:
+            work_logs = [log for _, log in accepted]
+            try:
+                with transaction.atomic():
+                    return WorkLog.objects.bulk_create(work_logs)
+            except IntegrityError:
+                taken = set(WorkLog.objects.filter(
+                    student_id__in={log.student_id for log in work_logs},
+                    date__in={log.date for log in work_logs}
+                ).values_list('student_id', 'date'))
+                if not any((log.student_id, log.date) in taken for log in work_logs):
+                    raise
+                self._logged_days.update(taken)
+                remaining = []
+                for result, log in accepted:
+                    if (log.student_id, log.date) in taken:
+                        result['status'] = 'rejected'
+                        result['error'] = DUPLICATE_DAY_ERROR
+                    else:
+                        remaining.append((result, log))
+                accepted = remaining
+
+    def _parse_record(self, record, result):
+        """Check one record's own fields, raising ValueError with the reason"""
+        if record is None:
+            raise ValueError('Could not parse this row')
+        record = {str(key).strip().lower(): value for key, value in record.items()}
+
+        prn = str(record.get('prn') or '').strip()
+        result['prn'] = prn
+        if not prn:
+            raise ValueError('PRN is required')
+
+        raw_date = str(record.get('date') or '').strip()
+        result['date'] = raw_date
+        try:
+            work_date = datetime.date.fromisoformat(raw_date)
+        except ValueError:
+            raise ValueError('Date must be in YYYY-MM-DD format')
+        if work_date.weekday() == 6:  # Sunday is weekday 6
+            raise ValueError('Work logs cannot be added on Sundays')
+        if work_date > self.today:
+            raise ValueError('Date is in the future')
+
+        raw_hours = record.get('hours')
+        result['hours'] = raw_hours if raw_hours is not None else ''
+        try:
+            hours = int(str(raw_hours).strip())
+        except ValueError:
+            raise ValueError('Hours must be a whole number')
+        if hours < 1 or hours > 3:
+            raise ValueError('Hours worked must be between 1 and 3 hours per day')
+
+        description = str(record.get('description') or '').strip()
+        if len(description) < MIN_DESCRIPTION_LENGTH:
+            raise ValueError(f'Description must be at least {MIN_DESCRIPTION_LENGTH} characters')
+
+        return {'prn': prn, 'date': work_date, 'hours': hours, 'description': description}
+
+    def _resolve_students(self, prns):
+        """Look up the students behind PRNs not seen in earlier batches with one query"""
+        new_prns = [prn for prn in prns if prn not in self._students]
+        if not new_prns:
+            return
+        applications = SchemeApplication.objects.filter(prn_number__in=new_prns, status='Approved')
+        if self.department is not None:
+            applications = applications.filter(student_id__in=department_student_ids(self.department))
+        found = dict(applications.values_list('prn_number', 'student_id'))
+        for prn in new_prns:
+            self._students[prn] = found.get(prn)
+
+    def _lock_month_totals(self, parsed):
+        """
+        Load the submitted hours of every (student, month) in the batch, locking the rollups
+
+        Missing rollup rows are created first so that they can be locked too; a
+        concurrent submission then waits on the row and re-checks its own cap.
+        Also records which of the batch's days already have a work log.
+
+        Returns:
+            tuple: ((student_id, date) pairs of the batch, {(student_id, month): submitted hours})
+        """
+        student_dates = {
+            (self._students[values['prn']], values['date'])
+            for _, values in parsed if self._students.get(values['prn'])
+        }
+        if not student_dates:
+            return student_dates, {}
+        student_ids = {student_id for student_id, _ in student_dates}
+        months = {work_date.replace(day=1) for _, work_date in student_dates}
+        dates = {work_date for _, work_date in student_dates}
+
+        rollups = StudentMonthRollup.objects.filter(student_id__in=student_ids, month__in=months)
+        if not self.dry_run:
+            StudentMonthRollup.objects.bulk_create(
+                [StudentMonthRollup(student_id=student_id, month=month)
+                 for student_id, month in {(student_id, work_date.replace(day=1)) for student_id, work_date in student_dates}],
+                ignore_conflicts=True
+            )
+            rollups = rollups.select_for_update()
+        used_hours = {(student_id, month): hours
+                      for student_id, month, hours in rollups.values_list('student_id', 'month', 'submitted_hours')}
+
+        self._logged_days.update(
+            WorkLog.objects.filter(student_id__in=student_ids, date__in=dates).values_list('student_id', 'date')
+        )
+        return student_dates, used_hours
+
+
+def write_import_report(results, stream):
+    """Write import results as CSV (row, prn, date, hours, status, error) to a text stream"""
+    writer = csv.DictWriter(stream, fieldnames=['row', 'prn', 'date', 'hours', 'status', 'error'])
+    writer.writeheader()
+    writer.writerows(results)
@@ -0,0 +1,115 @@
+"""
+Benchmark the bulk payment engine against the per-student calculation path.
+
+Builds throwaway cohorts of increasing size inside a transaction that is
+rolled back, then reports how many queries each path issues.
+
+Usage:
+    python manage.py benchmark_payment_engine
+    python manage.py benchmark_payment_engine --sizes 10 100 1000 4000 --legacy
+"""
+import datetime
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.timezone import localdate
+
+from scheme.models import (WorkLog, Department, StudentDepartmentAssignment,
+                           PaymentRate, PaymentCalculation)
+from scheme.payments import calculate_payments_for_month
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Report query counts of the bulk payment engine for growing cohort sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000],
+                            help='Cohort sizes to benchmark')
+        parser.add_argument('--departments', type=int, default=5,
+                            help='Number of departments the cohort is spread across')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also run the per-student calculate_for_student_month path')
+
+    def handle(self, *args, **options):
+        header = f"{'students':>10} {'engine queries':>15} {'engine secs':>12}"
+        if options['legacy']:
+            header += f" {'legacy queries':>15} {'legacy secs':>12}"
+        self.stdout.write(header)
+
+        for size in options['sizes']:
+            row = f"{size:>10}"
+            queries, seconds = self._run(size, options['departments'], legacy=False)
+            row += f" {queries:>15} {seconds:>12.3f}"
+            if options['legacy']:
+                queries, seconds = self._run(size, options['departments'], legacy=True)
+                row += f" {queries:>15} {seconds:>12.3f}"
+            self.stdout.write(row)
+
+    def _run(self, size, department_count, legacy):
+        try:
+            with transaction.atomic():
+                departments = self._build_cohort(size, department_count)
+                today = localdate()
+
+                query_count = [0]
+
+                def count_queries(execute, sql, params, many, context):
+                    query_count[0] += 1
+                    return execute(sql, params, many, context)
+
+                start = time.perf_counter()
+                with connection.execute_wrapper(count_queries):
+                    if legacy:
+                        self._legacy(departments, today.year, today.month)
+                    else:
+                        calculate_payments_for_month(departments, today.year, today.month)
+                elapsed = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return query_count[0], elapsed
+
+    def _legacy(self, departments, year, month):
+        for dept in departments:
+            students = User.objects.filter(
+                role='student',
+                is_registered=True,
+                studentdepartmentassignment__department=dept,
+                studentdepartmentassignment__is_active=True
+            ).distinct()
+            for student in students:
+                PaymentCalculation.objects.filter(
+                    student=student, calculation_month=datetime.date(year, month, 1)
+                ).first()
+                WorkLog.objects.filter(
+                    student=student, date__year=year, date__month=month,
+                    is_verified=True, is_rejected=False
+                ).exists()
+                PaymentCalculation.calculate_for_student_month(student, year, month)
+
+    def _build_cohort(self, size, department_count):
+        PaymentRate.objects.create(rate_per_hour=Decimal('50.00'))
+        departments = Department.objects.bulk_create([
+            Department(name=f"Benchmark Dept {i}", code=f"BM{i}")
+            for i in range(department_count)
+        ])
+        students = User.objects.bulk_create([
+            User(username=f"benchmark_student_{i}", role='student', is_registered=True)
+            for i in range(size)
+        ])
+        StudentDepartmentAssignment.objects.bulk_create([
+            StudentDepartmentAssignment(student=student, department=departments[i % department_count])
+            for i, student in enumerate(students)
+        ])
+        WorkLog.objects.bulk_create([
+            WorkLog(student=student, hours_worked=2, description='Benchmark work log', is_verified=True)
+            for student in students
+        ])
+        return departments
@@ -0,0 +1,55 @@
+"""
+Remove stored application documents that no application refers to any more.
+
+Documents are stored once per distinct content and reference-counted from the
+SchemeApplication document fields (see scheme.storage). This recounts the
+references from the applications, then deletes blobs with none left and stray
+files under the blob directory, sparing anything touched within --grace-hours
+so uploads of applications still being saved are not collected.
+
+Usage:
+    python manage.py collect_document_blobs
+    python manage.py collect_document_blobs --dry-run
+    python manage.py collect_document_blobs --grace-hours 1
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from scheme.models import DocumentBlob
+from scheme.storage import document_storage, orphan_blob_files
+
+
+class Command(BaseCommand):
+    help = 'Delete application document blobs no longer referenced by any application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List what would be deleted without deleting anything')
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='Keep unreferenced blobs touched within this many hours (default: 24)')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+
+        drifted = DocumentBlob.recount()
+        if drifted:
+            self.stdout.write(f"Reference counts of {drifted} blobs had drifted (now recounted)")
+
+        deleted = DocumentBlob.collect(before, dry_run=dry_run)
+        orphans = orphan_blob_files(before)
+        if not dry_run:
+            for name, _ in orphans:
+                document_storage.delete(name)
+        for name, size in deleted + orphans:
+            if options['verbosity'] > 1 or dry_run:
+                self.stdout.write(f"{name} ({size} bytes)")
+
+        action = 'would be deleted' if dry_run else 'deleted'
+        freed = sum(size for _, size in deleted + orphans)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(deleted)} unreferenced blobs and {len(orphans)} stray files {action} "
+            f"({freed / (1024 * 1024):.1f} MB)"
+        ))
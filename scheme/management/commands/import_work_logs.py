@@ -0,0 +1,74 @@
+"""
+Import work logs recorded on an attendance system from a CSV or JSONL file.
+
+Each row carries prn, date (YYYY-MM-DD), hours and description. Rows are
+validated like a student's own submission and inserted in batches; rejected
+rows are listed with the reason, or written with every other row to --report.
+
+Usage:
+    python manage.py import_work_logs attendance.csv
+    python manage.py import_work_logs attendance.jsonl --department CSE --verified
+    python manage.py import_work_logs attendance.csv --dry-run --report report.csv
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from scheme.imports import (IMPORT_BATCH_SIZE, IMPORT_FORMATS, WorkLogImport, detect_import_format,
+                            parse_import_rows, write_import_report)
+from scheme.models import Department
+
+
+class Command(BaseCommand):
+    help = 'Bulk import work logs from a CSV or JSONL file of (prn, date, hours, description)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file to import')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--department',
+                            help='Department code; only students actively assigned to it are accepted')
+        parser.add_argument('--verified', action='store_true',
+                            help='Import the logs as already verified')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate and report without inserting anything')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help=f'Rows per insert batch (default: {IMPORT_BATCH_SIZE})')
+        parser.add_argument('--report', help='Write the per-row accept/reject report to this CSV file')
+
+    def handle(self, *args, **options):
+        import_format = options['format'] or detect_import_format(options['path'])
+        if import_format is None:
+            raise CommandError("Cannot tell the file format from its extension; pass --format csv or --format jsonl")
+
+        department = None
+        if options['department']:
+            try:
+                department = Department.objects.get(code__iexact=options['department'])
+            except Department.DoesNotExist:
+                raise CommandError(f"Department '{options['department']}' does not exist")
+
+        work_log_import = WorkLogImport(
+            department=department,
+            verify=options['verified'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+        try:
+            with open(options['path'], 'rb') as stream:
+                work_log_import.run(parse_import_rows(stream, import_format))
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        except UnicodeDecodeError:
+            raise CommandError(f"{options['path']} is not UTF-8 text")
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as report:
+                write_import_report(work_log_import.results, report)
+        else:
+            for result in work_log_import.results:
+                if result['status'] == 'rejected':
+                    self.stdout.write(f"Row {result['row']} ({result['prn'] or 'no PRN'}): {result['error']}")
+
+        action = 'would be imported' if options['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{work_log_import.accepted_count} work logs {action}, {work_log_import.rejected_count} rows rejected"
+        ))
@@ -0,0 +1,29 @@
+"""
+Delete chunked document uploads that were never attached to an application.
+
+Students upload documents before submitting the application form; uploads
+abandoned along the way keep their temporary files under
+DOCUMENT_UPLOAD_TEMP_DIR until this runs. Schedule it daily.
+
+Usage:
+    python manage.py purge_document_uploads
+    python manage.py purge_document_uploads --hours 6
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from scheme.models import DocumentUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked document uploads (and their temporary files) left untouched for a while'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Delete uploads not touched for this many hours (default: 24)')
+
+    def handle(self, *args, **options):
+        purged = DocumentUpload.purge_stale(timezone.now() - timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"{purged} stale document uploads deleted"))
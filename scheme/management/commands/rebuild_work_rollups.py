@@ -0,0 +1,81 @@
+"""
+Rebuild the StudentMonthRollup table from WorkLog, or check it for drift.
+
+Usage:
+    python manage.py rebuild_work_rollups
+    python manage.py rebuild_work_rollups --check
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from scheme.models import ROLLUP_FIELDS, WorkLog, StudentMonthRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild monthly work-hour rollups from work logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report rollups that differ from the work logs; exit non-zero on drift')
+
+    def handle(self, *args, **options):
+        expected = self._expected_rollups()
+        stored = {
+            (rollup.student_id, rollup.month): rollup
+            for rollup in StudentMonthRollup.objects.all()
+        }
+
+        drift = []
+        for key, totals in expected.items():
+            rollup = stored.get(key)
+            if rollup is None or any(getattr(rollup, field) != totals[field] for field in ROLLUP_FIELDS):
+                drift.append(key)
+        orphans = [key for key in stored if key not in expected]
+
+        if options['check']:
+            for student_id, month in drift:
+                self.stdout.write(f"Drift: student {student_id}, {month:%Y-%m}")
+            for student_id, month in orphans:
+                self.stdout.write(f"Orphan rollup: student {student_id}, {month:%Y-%m}")
+            if drift or orphans:
+                raise CommandError(f"{len(drift)} rollups out of date, {len(orphans)} without work logs")
+            self.stdout.write(self.style.SUCCESS(f"All {len(stored)} rollups match the work logs"))
+            return
+
+        # Fix rows in place rather than recreating the table, so writers holding a
+        # rollup's row lock (StudentMonthRollup.reserve_hours) keep their row
+        with transaction.atomic():
+            now = timezone.now()
+            changed = []
+            for key in drift:
+                rollup = stored.get(key)
+                if rollup is None:
+                    continue
+                for field in ROLLUP_FIELDS:
+                    setattr(rollup, field, expected[key][field])
+                rollup.updated_at = now
+                changed.append(rollup)
+            StudentMonthRollup.objects.bulk_update(changed, ROLLUP_FIELDS + ['updated_at'], batch_size=500)
+            StudentMonthRollup.objects.bulk_create([
+                StudentMonthRollup(student_id=student_id, month=month, **expected[(student_id, month)])
+                for student_id, month in drift if (student_id, month) not in stored
+            ], batch_size=500)
+            StudentMonthRollup.objects.filter(pk__in=[stored[key].pk for key in orphans]).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(expected)} rollups ({len(drift)} were out of date, {len(orphans)} removed)"
+        ))
+
+    def _expected_rollups(self):
+        rows = WorkLog.objects.annotate(month=TruncMonth('date')).values('student_id', 'month').annotate(
+            submitted_hours=Sum('hours_worked', filter=Q(is_rejected=False)),
+            verified_hours=Sum('hours_worked', filter=Q(is_verified=True, is_rejected=False)),
+            rejected_hours=Sum('hours_worked', filter=Q(is_rejected=True)),
+            log_count=Count('id'),
+        ).order_by()
+        return {
+            (row['student_id'], row['month']): {field: row[field] or 0 for field in ROLLUP_FIELDS}
+            for row in rows
+        }
@@ -0,0 +1,28 @@
+"""
+Recalculate payments for student months flagged by work log changes.
+
+Usage:
+    python manage.py recalculate_dirty_payments
+"""
+from django.core.management.base import BaseCommand
+
+from scheme.models import DirtyPaymentMonth
+from scheme.payments import recalculate_dirty_payments
+
+
+class Command(BaseCommand):
+    help = 'Rebuild payment calculations and department summaries affected by work log changes'
+
+    def handle(self, *args, **options):
+        pending = DirtyPaymentMonth.objects.count()
+        if not pending:
+            self.stdout.write("No payment recalculations pending")
+            return
+
+        result = recalculate_dirty_payments()
+        self.stdout.write(
+            f"Processed {pending} student months: {result['recalculated']} recalculated, "
+            f"{result['removed']} removed"
+        )
+        for error in result['errors']:
+            self.stderr.write(error)
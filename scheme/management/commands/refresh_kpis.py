@@ -0,0 +1,43 @@
+"""
+Rebuild the coordinator dashboard KPI snapshot from the underlying tables.
+
+Writes keep the snapshot current as they happen; run this after bulk data
+changes made outside the application, or periodically as a safety net.
+
+Usage:
+    python manage.py refresh_kpis
+    python manage.py refresh_kpis --check
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from scheme.models import KpiSnapshot
+
+KPI_FIELDS = ['total_hours', 'pending_applications_count', 'approved_students_count', 'departments_count',
+              'departments_with_incharge', 'departments_without_incharge', 'assigned_students_count',
+              'unassigned_students_count']
+
+
+class Command(BaseCommand):
+    help = 'Recount the KPI snapshot shown on the coordinator dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Report KPIs that had drifted from the tables; exit non-zero on drift')
+
+    def handle(self, *args, **options):
+        before = KpiSnapshot.objects.filter(pk=1).first()
+        snapshot = KpiSnapshot.refresh()
+
+        drift = [
+            field for field in KPI_FIELDS
+            if before is not None and getattr(before, field) != getattr(snapshot, field)
+        ]
+        for field in drift:
+            self.stdout.write(f"{field}: {getattr(before, field)} -> {getattr(snapshot, field)}")
+        if options['check'] and drift:
+            raise CommandError(f"{len(drift)} KPIs had drifted (now refreshed)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"KPI snapshot refreshed at {snapshot.refreshed_at:%Y-%m-%d %H:%M:%S} "
+            f"({snapshot.total_hours} hours, {snapshot.approved_students_count} approved students)"
+        ))
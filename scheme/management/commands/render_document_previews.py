@@ -0,0 +1,67 @@
+"""
+Background worker rendering application document previews.
+
+Saving an application queues a preview for each new document; this claims
+them from the database one at a time, so several workers can run side by
+side. --backfill queues previews for documents uploaded before previews
+existed, and --retry-failed queues failed ones again.
+
+Usage:
+    python manage.py render_document_previews
+    python manage.py render_document_previews --once --backfill
+"""
+import datetime
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from scheme.models import SchemeApplication, DocumentPreview
+from scheme.previews import process_preview
+
+
+class Command(BaseCommand):
+    help = 'Render thumbnails of uploaded application documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Render the previews that are currently queued, then exit')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue previews for every application document without one')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='First queue failed and unsupported previews again')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Minutes a preview may stay in rendering before it is taken over')
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stale_after = datetime.timedelta(minutes=options['stale_after'])
+
+        if options['backfill']:
+            DocumentPreview.request(
+                name
+                for names in SchemeApplication.objects.values_list(*SchemeApplication.DOCUMENT_FIELDS)
+                for name in names if name
+            )
+        if options['retry_failed']:
+            DocumentPreview.objects.filter(status__in=['Failed', 'Unsupported']).update(status='Pending')
+
+        self.stdout.write(f"Preview worker {worker_id} started")
+        rendered = 0
+        while True:
+            preview = DocumentPreview.claim_next(worker_id, stale_after=stale_after)
+            if preview is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            preview = process_preview(preview)
+            rendered += 1
+            if options['verbosity'] > 1 or preview.status == 'Failed':
+                self.stdout.write(f"{preview.source_name}: {preview.status.lower()} {preview.error}".rstrip())
+
+        self.stdout.write(self.style.SUCCESS(f"{rendered} previews processed"))
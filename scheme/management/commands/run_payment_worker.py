@@ -0,0 +1,59 @@
+"""
+Background worker for queued payment runs.
+
+Claims PaymentRun rows straight from the database, so it needs no broker.
+Several workers can run side by side; each run is processed by one of them.
+While the queue is empty the worker also applies pending incremental
+recalculations recorded by work log changes.
+
+Usage:
+    python manage.py run_payment_worker
+    python manage.py run_payment_worker --once
+"""
+import datetime
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from scheme.models import PaymentRun
+from scheme.payments import process_payment_run, recalculate_dirty_payments
+
+
+class Command(BaseCommand):
+    help = 'Process queued bulk payment calculations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the runs that are currently queued, then exit')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Minutes without a heartbeat before a running job is taken over')
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stale_after = datetime.timedelta(minutes=options['stale_after'])
+        self.stdout.write(f"Payment worker {worker_id} started")
+
+        while True:
+            run = PaymentRun.claim_next(worker_id, stale_after=stale_after)
+            if run is None:
+                result = recalculate_dirty_payments()
+                if result['recalculated'] or result['removed']:
+                    self.stdout.write(
+                        f"Incremental recalculation: {result['recalculated']} recalculated, "
+                        f"{result['removed']} removed"
+                    )
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Processing payment run {run.pk} ({run})")
+            run = process_payment_run(run)
+            self.stdout.write(
+                f"Payment run {run.pk} {run.status.lower()}: "
+                f"{run.calculated_count} calculations, {len(run.errors)} errors"
+            )
@@ -0,0 +1,90 @@
+"""
+Cached department membership.
+
+Which students are actively assigned to which department is read on every
+incharge page but changes only when a coordinator assigns or unassigns
+students. Each department's student ids, and each student's department,
+are cached under a versioned key; any change to the assignments bumps the
+version and the next read of an entry loads it again with one small query.
+
+The entries decide which students an incharge may review and whose
+documents they may open, so they are only cached in a cache every process
+shares without a database round trip (memcached, Redis, files). With a
+per-process local-memory cache a version bump would not reach the other
+workers, and a database cache costs more queries than it saves, so the
+assignments are queried directly instead.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import StudentDepartmentAssignment
+
+VERSION_KEY = 'department-membership:version'
+UNCACHED_BACKENDS = (LocMemCache, DatabaseCache, DummyCache)
+
+
+def _timeout():
+    return getattr(settings, 'DEPARTMENT_MEMBERSHIP_CACHE_TIMEOUT', 15 * 60)
+
+
+def _cache_is_shared():
+    """Whether the default cache is seen by every worker process without a database query"""
+    return not isinstance(caches['default'], UNCACHED_BACKENDS)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A fresh version starts from the clock so entries cached under an
+        # evicted version number are never picked up again
+        cache.add(VERSION_KEY, time.time_ns(), _timeout())
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _cached(name, load):
+    """Value of a membership entry from the shared cache, loaded and stored on a miss"""
+    if not _cache_is_shared():
+        return load()
+    key = f'department-membership:{_version()}:{name}'
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        cache.set(key, value, _timeout())
+    return value
+
+
+def department_student_ids(department):
+    """IDs of the students actively assigned to a department (a Department or its id)"""
+    department_id = getattr(department, 'pk', department)
+    return list(_cached(f'department:{department_id}', lambda: tuple(
+        StudentDepartmentAssignment.objects.filter(
+            department_id=department_id, is_active=True
+        ).values_list('student_id', flat=True).order_by('student_id')
+    )))
+
+
+def student_department_id(student):
+    """ID of the department a student (a User or their id) is actively assigned to, or None"""
+    student_id = getattr(student, 'pk', student)
+    # 0 stands for "not assigned", since the cache cannot tell a stored None from a miss
+    department_id = _cached(f'student:{student_id}', lambda: StudentDepartmentAssignment.objects.filter(
+        student_id=student_id, is_active=True
+    ).values_list('department_id', flat=True).first() or 0)
+    return department_id or None
+
+
+def invalidate_membership():
+    """Discard the cached entries after assignments change"""
+    if not _cache_is_shared():
+        return
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # No version cached (expired or evicted): nothing to discard
+        pass
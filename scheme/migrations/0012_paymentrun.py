@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0011_schemeapplication_comments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calculation_month', models.DateField(help_text='Month to calculate (stored as first day of month)')),
+                ('recalculate_existing', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('Queued', 'Queued'), ('Running', 'Running'), ('Completed', 'Completed'), ('Failed', 'Failed')], default='Queued', max_length=20)),
+                ('total_departments', models.PositiveIntegerField(default=0)),
+                ('completed_departments', models.JSONField(blank=True, default=list, help_text='IDs of departments already processed')),
+                ('calculated_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('claimed_by', models.CharField(blank=True, default='', help_text='Worker currently processing the run', max_length=100)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('department', models.ForeignKey(blank=True, help_text='Department to calculate (blank for all active departments)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payment_runs', to='scheme.department')),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Payment Run',
+                'verbose_name_plural': 'Payment Runs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0012_paymentrun'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyPaymentMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='Month to recalculate (stored as first day of month)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dirty_payment_months', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Dirty Payment Month',
+                'verbose_name_plural': 'Dirty Payment Months',
+                'ordering': ['month'],
+                'unique_together': {('student', 'month')},
+            },
+        ),
+    ]
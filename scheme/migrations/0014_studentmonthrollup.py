@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    """Build rollups for work logs that existed before the table was added"""
+    WorkLog = apps.get_model('scheme', 'WorkLog')
+    StudentMonthRollup = apps.get_model('scheme', 'StudentMonthRollup')
+
+    rows = WorkLog.objects.annotate(month=TruncMonth('date')).values('student_id', 'month').annotate(
+        submitted_hours=Sum('hours_worked', filter=Q(is_rejected=False)),
+        verified_hours=Sum('hours_worked', filter=Q(is_verified=True, is_rejected=False)),
+        rejected_hours=Sum('hours_worked', filter=Q(is_rejected=True)),
+        log_count=Count('id'),
+    ).order_by()
+
+    StudentMonthRollup.objects.bulk_create([
+        StudentMonthRollup(
+            student_id=row['student_id'],
+            month=row['month'],
+            submitted_hours=row['submitted_hours'] or 0,
+            verified_hours=row['verified_hours'] or 0,
+            rejected_hours=row['rejected_hours'] or 0,
+            log_count=row['log_count'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0013_dirtypaymentmonth'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentMonthRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='Month of the totals (stored as first day of month)')),
+                ('submitted_hours', models.PositiveIntegerField(default=0, help_text='Hours of all non-rejected logs')),
+                ('verified_hours', models.PositiveIntegerField(default=0, help_text='Hours of verified, non-rejected logs')),
+                ('rejected_hours', models.PositiveIntegerField(default=0, help_text='Hours of rejected logs')),
+                ('log_count', models.PositiveIntegerField(default=0, help_text='Number of logs, including rejected ones')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Student Month Rollup',
+                'verbose_name_plural': 'Student Month Rollups',
+                'ordering': ['-month'],
+                'unique_together': {('student', 'month')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+def clear_unwritten_paths(apps, schema_editor):
+    """Earlier exports recorded a file_path but never wrote the file"""
+    PaymentExport = apps.get_model('scheme', 'PaymentExport')
+    PaymentExport.objects.update(file_path='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0014_studentmonthrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentexport',
+            name='data_version',
+            field=models.CharField(blank=True, default='', help_text='Version of the data the file was generated from', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='paymentexport',
+            name='file_size',
+            field=models.PositiveBigIntegerField(default=0, help_text='Size of the exported file in bytes'),
+        ),
+        migrations.AlterField(
+            model_name='paymentexport',
+            name='file_path',
+            field=models.CharField(blank=True, help_text='Path to the exported file under MEDIA_ROOT (blank once evicted)', max_length=500),
+        ),
+        migrations.RunPython(clear_unwritten_paths, migrations.RunPython.noop),
+    ]
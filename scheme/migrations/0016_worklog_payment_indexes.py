@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0015_paymentexport_artifact_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymentcalculation',
+            index=models.Index(fields=['calculation_month', 'department'], name='paycalc_month_department'),
+        ),
+        migrations.AddIndex(
+            model_name='worklog',
+            index=models.Index(condition=models.Q(('is_rejected', False), ('is_verified', True)), fields=['student', 'date'], name='worklog_verified_student_date'),
+        ),
+        migrations.AddIndex(
+            model_name='worklog',
+            index=models.Index(condition=models.Q(('is_rejected', False), ('is_verified', False)), fields=['date'], name='worklog_pending_date'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:20
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0016_worklog_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='worklog',
+            name='date',
+            field=models.DateField(default=datetime.date.today, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0017_worklog_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KpiSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_hours', models.PositiveIntegerField(default=0, help_text='Hours of all work logs')),
+                ('pending_applications_count', models.PositiveIntegerField(default=0)),
+                ('approved_students_count', models.PositiveIntegerField(default=0)),
+                ('departments_count', models.PositiveIntegerField(default=0, help_text='Active departments')),
+                ('departments_with_incharge', models.PositiveIntegerField(default=0)),
+                ('departments_without_incharge', models.PositiveIntegerField(default=0)),
+                ('assigned_students_count', models.PositiveIntegerField(default=0, help_text='Active department assignments')),
+                ('unassigned_students_count', models.PositiveIntegerField(default=0, help_text='Registered students without a department')),
+                ('refreshed_at', models.DateTimeField(help_text='Last full rebuild')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Last change from any write')),
+            ],
+            options={
+                'verbose_name': 'KPI Snapshot',
+                'verbose_name_plural': 'KPI Snapshots',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:59
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0018_kpisnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('field_name', models.CharField(help_text='SchemeApplication document field the file is for', max_length=50)),
+                ('file_name', models.CharField(help_text='Original file name', max_length=255)),
+                ('size', models.PositiveIntegerField(help_text='Declared size of the whole file in bytes')),
+                ('received', models.PositiveIntegerField(default=0, help_text='Bytes stored so far')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:20
+
+import scheme.models
+import scheme.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0019_documentupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name (content digest and extension)', max_length=100, unique=True)),
+                ('digest', models.CharField(db_index=True, help_text='SHA-256 of the content', max_length=64)),
+                ('size', models.PositiveIntegerField(help_text='Size of the file in bytes')),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Application fields referencing the file')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Last stored or referenced')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='aadhar_card',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/identity/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='admission_receipt',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/receipts/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='application_form',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/forms/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='bank_passbook',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/passbooks/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='caste_certificate',
+            field=models.FileField(blank=True, null=True, storage=scheme.storage.get_document_storage, upload_to='scheme_documents/certificates/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='caste_validity_certificate',
+            field=models.FileField(blank=True, null=True, storage=scheme.storage.get_document_storage, upload_to='scheme_documents/certificates/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='domicile_certificate',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/certificates/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='income_certificate',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/certificates/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='last_year_marksheet',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/marksheets/', validators=[scheme.models.validate_pdf_file]),
+        ),
+        migrations.AlterField(
+            model_name='schemeapplication',
+            name='photo',
+            field=models.FileField(storage=scheme.storage.get_document_storage, upload_to='scheme_documents/photos/', validators=[scheme.models.validate_image_file]),
+        ),
+    ]
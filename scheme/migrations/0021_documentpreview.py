@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheme', '0020_documentblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(help_text='Storage name of the document', max_length=100, unique=True)),
+                ('preview_name', models.CharField(blank=True, default='', help_text='Storage name of the rendered preview', max_length=150)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Rendering', 'Rendering'), ('Ready', 'Ready'), ('Failed', 'Failed'), ('Unsupported', 'Unsupported')], default='Pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('claimed_by', models.CharField(blank=True, default='', help_text='Worker rendering the preview', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
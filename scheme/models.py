@@ -6,11 +6,18 @@ from django.utils import timezone
 from decimal import Decimal
 import os
 import datetime
-from django.db.models import Sum
+import uuid
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F, Q, Case, When, Value
+from django.db.models.functions import Greatest, TruncMonth
+from .utils import month_range
+from .storage import get_document_storage
+
+MAX_DOCUMENT_SIZE = 2 * 1024 * 1024
 
 def validate_file_size(file):
     """ Limit file size to 2 MB (2 * 1024 * 1024 bytes) """
-    max_size = 2 * 1024 * 1024 
+    max_size = MAX_DOCUMENT_SIZE
     if file.size > max_size:
         raise ValidationError(f"File size should be less than {max_size / (1024 * 1024):.2f} MB")
 
@@ -22,6 +29,18 @@ def validate_image_file(file):
     if ext not in valid_extensions:
         raise ValidationError("Only image files (JPG, PNG, GIF, BMP) are allowed.")
 
+def monthly_hour_cap():
+    """Hours a student may log in one month (settings.WORK_LOG_MONTHLY_HOUR_CAP)"""
+    return getattr(settings, 'WORK_LOG_MONTHLY_HOUR_CAP', 30)
+
+def validate_monthly_hours(used_hours, hours):
+    """ Validate that hours fit in the month after used_hours have been logged """
+    remaining_hours = monthly_hour_cap() - used_hours
+    if hours > remaining_hours:
+        if remaining_hours <= 0:
+            raise ValidationError(f"Monthly limit of {monthly_hour_cap()} hours has been reached for this month.")
+        raise ValidationError(f"Adding {hours} hours would exceed monthly limit. You can only add {remaining_hours} more hours this month.")
+
 def validate_pdf_file(file):
     """ Validate that uploaded file is a PDF """
     validate_file_size(file)
@@ -62,16 +81,21 @@ class SchemeApplication(models.Model):
     prn_number = models.CharField(max_length=20, unique=True)
 
     # Document Uploads
-    photo = models.FileField(upload_to='scheme_documents/photos/', validators=[validate_image_file])
-    application_form = models.FileField(upload_to='scheme_documents/forms/', validators=[validate_pdf_file])
-    income_certificate = models.FileField(upload_to='scheme_documents/certificates/', validators=[validate_pdf_file])
-    caste_certificate = models.FileField(upload_to='scheme_documents/certificates/', blank=True, null=True, validators=[validate_pdf_file])
-    last_year_marksheet = models.FileField(upload_to='scheme_documents/marksheets/', validators=[validate_pdf_file])
-    domicile_certificate = models.FileField(upload_to='scheme_documents/certificates/', validators=[validate_pdf_file])
-    admission_receipt = models.FileField(upload_to='scheme_documents/receipts/', validators=[validate_pdf_file])
-    aadhar_card = models.FileField(upload_to='scheme_documents/identity/', validators=[validate_pdf_file])
-    bank_passbook = models.FileField(upload_to='scheme_documents/passbooks/', validators=[validate_pdf_file])
-    caste_validity_certificate = models.FileField(upload_to='scheme_documents/certificates/', blank=True, null=True, validators=[validate_pdf_file])
+    photo = models.FileField(storage=get_document_storage, upload_to='scheme_documents/photos/', validators=[validate_image_file])
+    application_form = models.FileField(storage=get_document_storage, upload_to='scheme_documents/forms/', validators=[validate_pdf_file])
+    income_certificate = models.FileField(storage=get_document_storage, upload_to='scheme_documents/certificates/', validators=[validate_pdf_file])
+    caste_certificate = models.FileField(storage=get_document_storage, upload_to='scheme_documents/certificates/', blank=True, null=True, validators=[validate_pdf_file])
+    last_year_marksheet = models.FileField(storage=get_document_storage, upload_to='scheme_documents/marksheets/', validators=[validate_pdf_file])
+    domicile_certificate = models.FileField(storage=get_document_storage, upload_to='scheme_documents/certificates/', validators=[validate_pdf_file])
+    admission_receipt = models.FileField(storage=get_document_storage, upload_to='scheme_documents/receipts/', validators=[validate_pdf_file])
+    aadhar_card = models.FileField(storage=get_document_storage, upload_to='scheme_documents/identity/', validators=[validate_pdf_file])
+    bank_passbook = models.FileField(storage=get_document_storage, upload_to='scheme_documents/passbooks/', validators=[validate_pdf_file])
+    caste_validity_certificate = models.FileField(storage=get_document_storage, upload_to='scheme_documents/certificates/', blank=True, null=True, validators=[validate_pdf_file])
+
+    DOCUMENT_FIELDS = (
+        'photo', 'application_form', 'income_certificate', 'caste_certificate', 'last_year_marksheet',
+        'domicile_certificate', 'admission_receipt', 'aadhar_card', 'bank_passbook', 'caste_validity_certificate',
+    )
 
     STATUS_CHOICES = [
         ("Pending", "Pending"),
@@ -88,9 +112,390 @@ class SchemeApplication(models.Model):
     def __str__(self):
         return f"{self.first_name} {self.middle_name if self.middle_name else ''} {self.last_name} - {self.prn_number}"
 
+    def save(self, *args, **kwargs):
+        """Override save to count document references, drop the cached application status and adjust the KPIs"""
+        with transaction.atomic():
+            previous = []
+            previous_status = None
+            if self.pk:
+                row = SchemeApplication.objects.filter(pk=self.pk).values_list('status', *self.DOCUMENT_FIELDS).first()
+                if row:
+                    previous_status, *previous = row
+            super().save(*args, **kwargs)
+            DocumentBlob.update_references(self.document_names(), previous)
+            DocumentPreview.request_on_commit(set(self.document_names()) - set(previous))
+        self._clear_status_cache()
+        if self.status != previous_status:
+            KpiSnapshot.adjust_on_commit(**self.status_kpi_changes({self.status: 1, previous_status: -1}))
+
+    def delete(self, *args, **kwargs):
+        """Override delete to release document references, drop the cached application status and adjust the KPIs"""
+        with transaction.atomic():
+            names = self.document_names()
+            result = super().delete(*args, **kwargs)
+            DocumentBlob.update_references([], names)
+        self._clear_status_cache()
+        KpiSnapshot.adjust_on_commit(**self.status_kpi_changes({self.status: -1}))
+        return result
+
+    @staticmethod
+    def status_kpi_changes(changes):
+        """
+        KPI counter changes for applications entering or leaving statuses
+
+        Args:
+            changes: {status: number of applications gained (or lost, when negative)}
+        """
+        return {
+            'pending_applications_count': changes.get('Pending', 0),
+            'approved_students_count': changes.get('Approved', 0),
+        }
+
+    def document_names(self):
+        """Storage names of the documents attached to the application"""
+        return [getattr(self, field).name for field in self.DOCUMENT_FIELDS if getattr(self, field)]
+
+    def _clear_status_cache(self):
+        from users.models import User
+        User.clear_scheme_status_cache([self.student_id])
+
+class DocumentBlob(models.Model):
+    """
+    One stored application document file, shared by every field with the same content
+
+    ref_count is the number of SchemeApplication document fields pointing at the
+    file, kept up to date as applications are saved and deleted. Blobs nothing
+    points at are removed by the collect_document_blobs command.
+    """
+    name = models.CharField(max_length=100, unique=True, help_text="Storage name (content digest and extension)")
+    digest = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the content")
+    size = models.PositiveIntegerField(help_text="Size of the file in bytes")
+    ref_count = models.PositiveIntegerField(default=0, help_text="Application fields referencing the file")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last stored or referenced")
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+    @classmethod
+    def stored(cls, name, digest, size):
+        """
+        Record content about to be kept by the document storage
+
+        Touching an existing row keeps the blob out of garbage collection until
+        the application referencing it is saved; if collection holds the row,
+        this waits for it, and the storage then finds the file gone and writes it.
+        """
+        if cls.objects.filter(name=name).update(updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, digest=digest, size=size)
+        except IntegrityError:
+            cls.objects.filter(name=name).update(updated_at=timezone.now())
+
+    @classmethod
+    def update_references(cls, names, previous_names):
+        """
+        Move references from previous_names to names
+
+        Names present in both are left alone; names that are not blobs (files
+        stored before the content-addressed storage) are ignored.
+        """
+        from collections import Counter
+
+        current, previous = Counter(names), Counter(previous_names)
+        added, removed = current - previous, previous - current
+        now = timezone.now()
+        for count, blob_names in cls._group_by_count(added).items():
+            cls.objects.filter(name__in=blob_names).update(ref_count=F('ref_count') + count, updated_at=now)
+        for count, blob_names in cls._group_by_count(removed).items():
+            cls.objects.filter(name__in=blob_names).update(
+                ref_count=Case(When(ref_count__gte=count, then=F('ref_count') - count), default=Value(0)),
+                updated_at=now,
+            )
+
+    @staticmethod
+    def _group_by_count(counter):
+        groups = {}
+        for name, count in counter.items():
+            groups.setdefault(count, []).append(name)
+        return groups
+
+    @classmethod
+    def recount(cls):
+        """
+        Recount every blob's references from the application document fields
+
+        Returns:
+            int: Number of blobs whose count had drifted
+        """
+        from collections import Counter
+
+        references = Counter(
+            name
+            for names in SchemeApplication.objects.values_list(*SchemeApplication.DOCUMENT_FIELDS)
+            for name in names if name
+        )
+        drifted = 0
+        for blob in cls.objects.only('id', 'name', 'ref_count'):
+            if blob.ref_count != references[blob.name]:
+                cls.objects.filter(pk=blob.pk).update(ref_count=references[blob.name])
+                drifted += 1
+        return drifted
+
+    @classmethod
+    def collect(cls, before, dry_run=False):
+        """
+        Delete unreferenced blobs last stored or referenced before a datetime, with their files
+
+        Returns:
+            list: (name, size) of the deleted blobs
+        """
+        storage = get_document_storage()
+        garbage = list(cls.objects.filter(ref_count=0, updated_at__lt=before).values_list('id', 'name', 'size'))
+        if not dry_run:
+            for blob_id, name, size in garbage:
+                with transaction.atomic():
+                    # Re-checked under a lock so a blob stored or referenced since the listing survives
+                    if cls.objects.select_for_update().filter(pk=blob_id, ref_count=0, updated_at__lt=before).first():
+                        storage.delete(name)
+                        cls.objects.filter(pk=blob_id).delete()
+                        DocumentPreview.discard([name])
+        return [(name, size) for blob_id, name, size in garbage]
+
+class DocumentPreview(models.Model):
+    """
+    Downscaled image of a stored application document, rendered in the background
+
+    Keyed by the document's storage name, which changes whenever the file
+    field does (names are content digests), so a replaced document gets a new
+    preview and identical documents share one. Rendered by the
+    render_document_previews worker into scheme_documents/previews/.
+    """
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Rendering', 'Rendering'),
+        ('Ready', 'Ready'),
+        ('Failed', 'Failed'),
+        ('Unsupported', 'Unsupported'),
+    ]
+
+    source_name = models.CharField(max_length=100, unique=True, help_text="Storage name of the document")
+    preview_name = models.CharField(max_length=150, blank=True, default='', help_text="Storage name of the rendered preview")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    error = models.TextField(blank=True, default='')
+    claimed_by = models.CharField(max_length=100, blank=True, default='', help_text="Worker rendering the preview")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.source_name} - {self.status}"
+
+    @classmethod
+    def request(cls, names):
+        """Queue previews for document names that do not have one yet"""
+        cls.objects.bulk_create([cls(source_name=name) for name in set(names) if name], ignore_conflicts=True)
+
+    @classmethod
+    def request_on_commit(cls, names):
+        names = list(names)
+        if names:
+            transaction.on_commit(lambda: cls.request(names))
+
+    @classmethod
+    def claim_next(cls, worker_id, stale_after=datetime.timedelta(minutes=10)):
+        """
+        Claim the oldest pending preview, or one whose worker stopped without finishing
+
+        Returns:
+            DocumentPreview or None
+        """
+        now = timezone.now()
+        candidates = cls.objects.filter(
+            Q(status='Pending') | Q(status='Rendering', updated_at__lt=now - stale_after)
+        ).order_by('created_at').values_list('pk', 'status', 'updated_at')[:20]
+        for pk, status, updated_at in candidates:
+            if cls.objects.filter(pk=pk, status=status, updated_at=updated_at).update(
+                status='Rendering', claimed_by=worker_id, updated_at=now
+            ):
+                return cls.objects.get(pk=pk)
+        return None
+
+    @classmethod
+    def for_application(cls, application):
+        """
+        Ready previews of an application's documents
+
+        Returns:
+            dict: {document field name: DocumentPreview}
+        """
+        # Several fields may hold the same document, and so share a preview
+        fields_by_name = {}
+        for field in SchemeApplication.DOCUMENT_FIELDS:
+            if getattr(application, field):
+                fields_by_name.setdefault(getattr(application, field).name, []).append(field)
+        return {
+            field: preview
+            for preview in cls.objects.filter(source_name__in=fields_by_name, status='Ready')
+            for field in fields_by_name[preview.source_name]
+        }
+
+    @classmethod
+    def discard(cls, names):
+        """Delete the previews of documents that are gone, with their files"""
+        from django.core.files.storage import default_storage
+
+        for preview in cls.objects.filter(source_name__in=names):
+            if preview.preview_name:
+                default_storage.delete(preview.preview_name)
+            preview.delete()
+
+class DocumentUpload(models.Model):
+    """
+    A scheme application document uploaded in chunks ahead of the application submit
+
+    Chunks are appended to a temporary file under DOCUMENT_UPLOAD_TEMP_DIR;
+    received counts the bytes stored so far, so an interrupted upload resumes
+    from there. Once complete, the application form takes the file by the
+    upload's id instead of a multipart file.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='document_uploads')
+    field_name = models.CharField(max_length=50, help_text="SchemeApplication document field the file is for")
+    file_name = models.CharField(max_length=255, help_text="Original file name")
+    size = models.PositiveIntegerField(help_text="Declared size of the whole file in bytes")
+    received = models.PositiveIntegerField(default=0, help_text="Bytes stored so far")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name} ({self.received}/{self.size} bytes) - {self.student}"
+
+    @property
+    def is_complete(self):
+        return self.received == self.size
+
+    @property
+    def temp_path(self):
+        return os.path.join(document_upload_dir(), f'{self.id}.part')
+
+    @classmethod
+    def start(cls, student, field_name, file_name, size):
+        """
+        Begin an upload, or pick up an unfinished one of the same file
+
+        Checks the file name and declared size against the document field's
+        validators before any data is sent.
+
+        Raises:
+            ValidationError: If the field is unknown or the file is not acceptable
+        """
+        if field_name not in SchemeApplication.DOCUMENT_FIELDS:
+            raise ValidationError(f"Unknown document field '{field_name}'.")
+        file_name = os.path.basename(str(file_name or '').replace('\\', '/'))[:255]
+        if not file_name:
+            raise ValidationError("File name is required.")
+        if size <= 0:
+            raise ValidationError("The file is empty.")
+        for validator in SchemeApplication._meta.get_field(field_name).validators:
+            # The validators only look at the name and size
+            validator(DeclaredFile(file_name, size))
+
+        upload = cls.objects.filter(
+            student=student, field_name=field_name, file_name=file_name, size=size, received__lt=size
+        ).first()
+        if upload is None:
+            upload = cls.objects.create(student=student, field_name=field_name, file_name=file_name, size=size)
+        return upload
+
+    def append(self, offset, stream, length):
+        """
+        Store a chunk of length bytes read from stream at offset
+
+        The chunk is copied in small pieces and the upload refused as soon as it
+        would grow past its declared size, so nothing larger than the limit is
+        ever written.
+
+        Raises:
+            ValidationError: If offset is not where the upload left off or the chunk overruns the file
+        """
+        with transaction.atomic():
+            upload = DocumentUpload.objects.select_for_update().get(pk=self.pk)
+            if offset != upload.received:
+                raise ValidationError(f"Upload is at byte {upload.received}, not {offset}.", code='offset')
+            if length is None or length > upload.size - offset:
+                raise ValidationError("Chunk goes past the end of the file.", code='overrun')
+
+            os.makedirs(document_upload_dir(), exist_ok=True)
+            written = 0
+            with open(upload.temp_path, 'r+b' if os.path.exists(upload.temp_path) else 'wb') as part:
+                # Drop anything a broken earlier request wrote past the last stored byte
+                part.truncate(offset)
+                part.seek(offset)
+                while written < length:
+                    piece = stream.read(min(64 * 1024, length - written))
+                    if not piece:
+                        break
+                    part.write(piece)
+                    written += len(piece)
+
+            upload.received = offset + written
+            upload.save(update_fields=['received', 'updated_at'])
+        self.received = upload.received
+        return written
+
+    def open(self):
+        """The completed file, named after the original, ready to assign to a FileField"""
+        from django.core.files import File
+        return File(open(self.temp_path, 'rb'), name=self.file_name)
+
+    def delete(self, *args, **kwargs):
+        """Override delete to remove the temporary file as well"""
+        temp_path = self.temp_path
+        result = super().delete(*args, **kwargs)
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        return result
+
+    @classmethod
+    def purge_stale(cls, before):
+        """
+        Delete uploads (finished or not) last touched before a datetime
+
+        Returns:
+            int: Number of uploads deleted
+        """
+        stale = list(cls.objects.filter(updated_at__lt=before))
+        for upload in stale:
+            upload.delete()
+        return len(stale)
+
+class DeclaredFile:
+    """Name and size of a file not uploaded yet, enough for the document validators"""
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+def document_upload_dir():
+    """Directory for partly uploaded documents (settings.DOCUMENT_UPLOAD_TEMP_DIR)"""
+    return getattr(settings, 'DOCUMENT_UPLOAD_TEMP_DIR', os.path.join(settings.MEDIA_ROOT, 'upload_parts'))
+
 class WorkLog(models.Model):
     student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    # Defaults to today; bulk imports set the attendance date themselves
+    date = models.DateField(default=datetime.date.today, editable=False)
     time = models.TimeField(auto_now_add=True)
     hours_worked = models.PositiveIntegerField()
     description = models.TextField()
@@ -102,6 +507,16 @@ class WorkLog(models.Model):
     class Meta:
         # Ensure one work log per student per day
         unique_together = ['student', 'date']
+        # Boolean filters compile to "is_verified AND NOT is_rejected", which SQLite cannot
+        # match against index columns, so the status is expressed as the index condition
+        indexes = [
+            # A student's verified hours within a date range (dashboards, payments)
+            models.Index(fields=['student', 'date'], condition=Q(is_verified=True, is_rejected=False),
+                         name='worklog_verified_student_date'),
+            # Logs awaiting verification across all students, newest first
+            models.Index(fields=['date'], condition=Q(is_verified=False, is_rejected=False),
+                         name='worklog_pending_date'),
+        ]
         
     def clean(self):
         # Basic hours validation
@@ -117,32 +532,275 @@ class WorkLog(models.Model):
         if work_date.weekday() == 6:  # Sunday is weekday 6
             raise ValidationError("Work logs cannot be added on Sundays.")
         
-        # Check monthly hours limit (30 hours per month)
+        # Check monthly hours limit; save() enforces it again atomically
         if self.hours_worked:
-            # Get current month's total hours (excluding current entry if updating)
-            current_month_hours = WorkLog.objects.filter(
-                student_id=self.student_id,
-                date__year=work_date.year,
-                date__month=work_date.month,
-                is_rejected=False
-            )
+            # Get current month's total hours (excluding current entry if updating), from the
+            # StudentStats the caller attached when available, otherwise from the rollup
+            stats = getattr(self, 'student_stats', None)
+            if stats is not None and stats.student.pk == self.student_id and stats.covers(work_date):
+                total_hours = stats.month_submitted
+            else:
+                total_hours = StudentMonthRollup.get_for(self.student_id, work_date).submitted_hours
             
             # Exclude current instance if updating
             if self.pk:
-                current_month_hours = current_month_hours.exclude(pk=self.pk)
+                total_hours -= WorkLog.objects.filter(
+                    pk=self.pk,
+                    **month_range(work_date.year, work_date.month),
+                    is_rejected=False
+                ).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
             
-            total_hours = current_month_hours.aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-            
-            if total_hours + self.hours_worked > 30:
-                remaining_hours = 30 - total_hours
-                if remaining_hours <= 0:
-                    raise ValidationError("Monthly limit of 30 hours has been reached for this month.")
-                else:
-                    raise ValidationError(f"Adding {self.hours_worked} hours would exceed monthly limit. You can only add {remaining_hours} more hours this month.")
+            validate_monthly_hours(total_hours, self.hours_worked)
+
+    def save(self, *args, **kwargs):
+        """
+        Override save to reserve the hours against the monthly cap, keep the student's
+        monthly rollup and the KPI hours in sync and flag the month for payment
+        recalculation when a log is verified, rejected or edited
+
+        Raises:
+            ValidationError: When the hours do not fit in the month's remaining allowance
+        """
+        is_edit = self.pk is not None
+        previous = None
+        if is_edit:
+            previous = WorkLog.objects.filter(pk=self.pk).values('date', 'hours_worked', 'is_rejected').first()
+        previous_date = previous['date'] if previous else None
+
+        with transaction.atomic():
+            hours_to_reserve = self._hours_to_reserve(previous)
+            if hours_to_reserve:
+                StudentMonthRollup.reserve_hours(self.student_id, self.date, hours_to_reserve)
+
+            super().save(*args, **kwargs)
+
+            affected = [(self.student_id, self.date)]
+            if previous_date and previous_date.replace(day=1) != self.date.replace(day=1):
+                affected.append((self.student_id, previous_date))
+
+            StudentMonthRollup.refresh(affected)
+            if is_edit or self.is_verified:
+                DirtyPaymentMonth.mark(affected)
+            KpiSnapshot.adjust_hours_on_commit(self.hours_worked - (previous['hours_worked'] if previous else 0))
+
+    def _hours_to_reserve(self, previous):
+        """Hours this save adds to the month's submitted total (rejected logs count for nothing)"""
+        if self.is_rejected or not self.hours_worked:
+            return 0
+        if previous is None or previous['is_rejected']:
+            return self.hours_worked
+        if self.date and previous['date'].replace(day=1) != self.date.replace(day=1):
+            return self.hours_worked
+        return max(self.hours_worked - previous['hours_worked'], 0)
+
+    def delete(self, *args, **kwargs):
+        """Override delete to keep the student's monthly rollup and the KPI hours in sync"""
+        affected = [(self.student_id, self.date)]
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            StudentMonthRollup.refresh(affected)
+            DirtyPaymentMonth.mark(affected)
+            KpiSnapshot.adjust_hours_on_commit(-self.hours_worked)
+        return result
+
+    @classmethod
+    def bulk_review(cls, queryset, verify, reviewer=None, reason='', reasons=None):
+        """
+        Verify or reject every pending log in queryset with a single UPDATE
+
+        Args:
+            queryset: WorkLog queryset to review; logs already verified or rejected are left alone
+            verify: True to verify, False to reject
+            reviewer: User rejecting the logs (stored as rejected_by)
+            reason: Rejection reason shared by all logs
+            reasons: Optional {log_id: reason} overriding the shared reason per log
+
+        Returns:
+            list: IDs of the logs that were changed
+        """
+        pending = {'is_verified': False, 'is_rejected': False}
+        with transaction.atomic():
+            targets = list(queryset.filter(**pending).select_for_update().values_list('id', 'student_id', 'date'))
+            if not targets:
+                return []
+            log_ids = [log_id for log_id, _, _ in targets]
+
+            if verify:
+                changes = {'is_verified': True}
+            else:
+                rejection_reason = Value(reason)
+                per_log = [When(pk=log_id, then=Value(text)) for log_id, text in (reasons or {}).items()
+                           if log_id in log_ids]
+                if per_log:
+                    rejection_reason = Case(*per_log, default=rejection_reason, output_field=models.TextField())
+                changes = {'is_rejected': True, 'rejection_reason': rejection_reason, 'rejected_by': reviewer}
+            cls.objects.filter(pk__in=log_ids, **pending).update(**changes)
+
+            # update() bypasses save(), so sync the rollups and flag payments here
+            affected = [(student_id, work_date) for _, student_id, work_date in targets]
+            StudentMonthRollup.refresh(affected)
+            DirtyPaymentMonth.mark(affected)
+        return log_ids
 
     def __str__(self):
         return f"{self.student} - ({self.hours_worked} hrs)"
 
+
+ROLLUP_FIELDS = ['submitted_hours', 'verified_hours', 'rejected_hours', 'log_count']
+
+
+class StudentMonthRollup(models.Model):
+    """Model to store each student's monthly work log totals, maintained on every WorkLog write"""
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='month_rollups'
+    )
+    month = models.DateField(help_text="Month of the totals (stored as first day of month)")
+    submitted_hours = models.PositiveIntegerField(default=0, help_text="Hours of all non-rejected logs")
+    verified_hours = models.PositiveIntegerField(default=0, help_text="Hours of verified, non-rejected logs")
+    rejected_hours = models.PositiveIntegerField(default=0, help_text="Hours of rejected logs")
+    log_count = models.PositiveIntegerField(default=0, help_text="Number of logs, including rejected ones")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['student', 'month']
+        ordering = ['-month']
+        verbose_name = "Student Month Rollup"
+        verbose_name_plural = "Student Month Rollups"
+
+    @property
+    def pending_hours(self):
+        return self.submitted_hours - self.verified_hours
+
+    @staticmethod
+    def aggregate_work_logs(queryset):
+        """Aggregate a WorkLog queryset into rollup totals in one query"""
+        totals = queryset.aggregate(
+            submitted_hours=Sum('hours_worked', filter=Q(is_rejected=False)),
+            verified_hours=Sum('hours_worked', filter=Q(is_verified=True, is_rejected=False)),
+            rejected_hours=Sum('hours_worked', filter=Q(is_rejected=True)),
+            log_count=Count('id'),
+        )
+        return {key: value or 0 for key, value in totals.items()}
+
+    @classmethod
+    def get_for(cls, student_id, work_date):
+        """Get the rollup for the month containing work_date (an empty unsaved rollup if there are no logs)"""
+        month = work_date.replace(day=1)
+        rollup = cls.objects.filter(student_id=student_id, month=month).first()
+        return rollup or cls(student_id=student_id, month=month)
+
+    @classmethod
+    def reserve_hours(cls, student_id, work_date, hours):
+        """
+        Claim hours against the student's monthly cap with one conditional UPDATE
+
+        Call inside the transaction that saves the work log. The updated row stays
+        locked until commit, so a concurrent reservation waits for it and then
+        re-checks the cap against the new total. refresh() afterwards recomputes
+        the exact totals, which is also how rejected hours are released.
+
+        Args:
+            student_id: ID of the student logging the hours
+            work_date: Date of the work log; any day of the month may be given
+            hours: Hours to add to the month's submitted total
+
+        Raises:
+            ValidationError: When the hours do not fit in the month's remaining allowance
+        """
+        month = work_date.replace(day=1)
+        try:
+            with transaction.atomic():
+                cls.objects.get_or_create(student_id=student_id, month=month)
+        except IntegrityError:
+            pass  # Created by a concurrent reservation
+
+        reserved = cls.objects.filter(
+            student_id=student_id,
+            month=month,
+            submitted_hours__lte=monthly_hour_cap() - hours
+        ).update(submitted_hours=F('submitted_hours') + hours)
+
+        if not reserved:
+            used_hours = cls.objects.filter(student_id=student_id, month=month).values_list('submitted_hours', flat=True).first()
+            validate_monthly_hours(used_hours or 0, hours)
+            # Another submission changed the total between the UPDATE and the read above
+            raise ValidationError(f"Monthly limit of {monthly_hour_cap()} hours has been reached for this month.")
+
+    @classmethod
+    def refresh(cls, student_dates):
+        """
+        Recompute the rollups for (student_id, date) pairs from their work logs
+
+        Args:
+            student_dates: Iterable of (student_id, date) tuples; any day of the month may be given
+        """
+        keys = {(student_id, work_date.replace(day=1)) for student_id, work_date in student_dates}
+        if not keys:
+            return
+        if len(keys) == 1:
+            (student_id, month), = keys
+            totals = cls.aggregate_work_logs(WorkLog.objects.filter(
+                student_id=student_id,
+                **month_range(month.year, month.month)
+            ))
+            if totals['log_count']:
+                cls.objects.update_or_create(student_id=student_id, month=month, defaults=totals)
+            else:
+                cls.objects.filter(student_id=student_id, month=month).delete()
+            return
+
+        # Many months (bulk review, imports): lock the rows, one grouped aggregate and bulk writes.
+        # Rows are updated in place so the lock reserve_hours relies on is never released early
+        cls.objects.bulk_create(
+            [cls(student_id=student_id, month=month) for student_id, month in keys],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+        student_ids = {student_id for student_id, _ in keys}
+        months = {month for _, month in keys}
+        rollups = {
+            (rollup.student_id, rollup.month): rollup
+            for rollup in cls.objects.select_for_update().filter(student_id__in=student_ids, month__in=months)
+            if (rollup.student_id, rollup.month) in keys
+        }
+
+        last_month = max(months)
+        rows = WorkLog.objects.filter(
+            student_id__in=student_ids,
+            date__gte=min(months),
+            date__lt=(last_month + datetime.timedelta(days=32)).replace(day=1)
+        ).annotate(month=TruncMonth('date')).values('student_id', 'month').annotate(
+            submitted_hours=Sum('hours_worked', filter=Q(is_rejected=False)),
+            verified_hours=Sum('hours_worked', filter=Q(is_verified=True, is_rejected=False)),
+            rejected_hours=Sum('hours_worked', filter=Q(is_rejected=True)),
+            log_count=Count('id'),
+        ).order_by()
+        expected = {}
+        for row in rows:
+            key = (row.pop('student_id'), row.pop('month'))
+            if key in keys:
+                expected[key] = {field: value or 0 for field, value in row.items()}
+
+        now = timezone.now()
+        changed, empty = [], []
+        for key, rollup in rollups.items():
+            totals = expected.get(key)
+            if totals is None:
+                empty.append(rollup.pk)
+            elif any(getattr(rollup, field) != value for field, value in totals.items()):
+                for field, value in totals.items():
+                    setattr(rollup, field, value)
+                rollup.updated_at = now
+                changed.append(rollup)
+        cls.objects.bulk_update(changed, ROLLUP_FIELDS + ['updated_at'], batch_size=500)
+        if empty:
+            cls.objects.filter(pk__in=empty).delete()
+
+    def __str__(self):
+        return f"{self.student} - {self.month.strftime('%B %Y')} ({self.submitted_hours} hrs)"
+
 class Department(models.Model):
     """Model to represent college departments"""
     name = models.CharField(max_length=100, unique=True)
@@ -158,6 +816,33 @@ class Department(models.Model):
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+    def save(self, *args, **kwargs):
+        """Override save to adjust the department KPIs"""
+        was_active = None
+        if self.pk:
+            was_active = Department.objects.filter(pk=self.pk).values_list('is_active', flat=True).first()
+        super().save(*args, **kwargs)
+        if was_active is None:
+            # A new department starts without an incharge
+            KpiSnapshot.adjust_on_commit(departments_count=int(self.is_active), departments_without_incharge=1)
+        else:
+            KpiSnapshot.adjust_on_commit(departments_count=int(self.is_active) - int(was_active))
+
+    def delete(self, *args, **kwargs):
+        """Override delete to adjust the KPIs (assignments and incharges go with it)"""
+        with transaction.atomic():
+            assignments = list(self.assigned_students.values_list('student_id', 'is_active'))
+            has_incharge = DepartmentIncharge.objects.filter(department=self).exists()
+            is_active = Department.objects.filter(pk=self.pk).values_list('is_active', flat=True).first()
+            result = super().delete(*args, **kwargs)
+            StudentDepartmentAssignment.assignments_changed(removed=assignments)
+        KpiSnapshot.adjust_on_commit(
+            departments_count=-int(bool(is_active)),
+            departments_with_incharge=-int(has_incharge),
+            departments_without_incharge=-int(not has_incharge),
+        )
+        return result
+
 class DepartmentIncharge(models.Model):
     """Model to link users with departments as incharges"""
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, limit_choices_to={'role': 'department_encharge'})
@@ -173,6 +858,20 @@ class DepartmentIncharge(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.department.name}"
 
+    def save(self, *args, **kwargs):
+        """Override save to adjust the department KPIs"""
+        created = self._state.adding
+        super().save(*args, **kwargs)
+        # Moving an incharge between departments leaves the totals as they were
+        if created:
+            KpiSnapshot.adjust_on_commit(departments_with_incharge=1, departments_without_incharge=-1)
+
+    def delete(self, *args, **kwargs):
+        """Override delete to adjust the department KPIs"""
+        result = super().delete(*args, **kwargs)
+        KpiSnapshot.adjust_on_commit(departments_with_incharge=-1, departments_without_incharge=1)
+        return result
+
 class StudentDepartmentAssignment(models.Model):
     """Model to assign students to departments"""
     student = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, limit_choices_to={'role': 'student'})
@@ -188,6 +887,47 @@ class StudentDepartmentAssignment(models.Model):
     def __str__(self):
         return f"{self.student.get_full_name()} → {self.department.name}"
 
+    def save(self, *args, **kwargs):
+        """Override save to discard the cached department membership and adjust the KPIs"""
+        previous = None
+        if self.pk:
+            previous = StudentDepartmentAssignment.objects.filter(pk=self.pk).values_list('student_id', 'is_active').first()
+        super().save(*args, **kwargs)
+        self.assignments_changed(added=[(self.student_id, self.is_active)], removed=[previous] if previous else ())
+
+    def delete(self, *args, **kwargs):
+        """Override delete to discard the cached department membership and adjust the KPIs"""
+        result = super().delete(*args, **kwargs)
+        self.assignments_changed(removed=[(self.student_id, self.is_active)])
+        return result
+
+    @staticmethod
+    def assignments_changed(added=(), removed=()):
+        """
+        Discard the cached membership (now and again once the change is committed)
+        and adjust the student KPIs; call after writes that bypass save()
+
+        Args:
+            added: (student_id, is_active) of the assignment rows created
+            removed: (student_id, is_active) of the assignment rows deleted
+        """
+        from .membership import invalidate_membership
+        from users.models import User
+        invalidate_membership()
+        transaction.on_commit(invalidate_membership)
+
+        assigned = sum(1 for _, is_active in added if is_active) - sum(1 for _, is_active in removed if is_active)
+        # Registered students count as unassigned while they have no assignment row
+        gained = {student_id for student_id, _ in added} - {student_id for student_id, _ in removed}
+        lost = {student_id for student_id, _ in removed} - {student_id for student_id, _ in added}
+        unassigned = 0
+        if gained or lost:
+            registered = set(User.objects.filter(
+                pk__in=gained | lost, role='student', is_registered=True
+            ).values_list('pk', flat=True))
+            unassigned = len(lost & registered) - len(gained & registered)
+        KpiSnapshot.adjust_on_commit(assigned_students_count=assigned, unassigned_students_count=unassigned)
+
 
 class PaymentRate(models.Model):
     """Model to manage the single hourly payment rate set by E&L Coordinator"""
@@ -278,6 +1018,9 @@ class PaymentCalculation(models.Model):
     class Meta:
         unique_together = ['student', 'calculation_month']
         ordering = ['-calculation_month', 'student__first_name']
+        indexes = [
+            models.Index(fields=['calculation_month', 'department'], name='paycalc_month_department'),
+        ]
         verbose_name = "Payment Calculation"
         verbose_name_plural = "Payment Calculations"
 
@@ -305,21 +1048,13 @@ class PaymentCalculation(models.Model):
         import datetime
         
         try:
-            # Get all verified work logs for the student in the specified month
-            work_logs = WorkLog.objects.filter(
-                student=student,
-                date__year=year,
-                date__month=month,
-                is_verified=True,
-                is_rejected=False
-            )
+            # Get the student's verified hours for the month from the rollup
+            rollup = StudentMonthRollup.get_for(student.pk, datetime.date(year, month, 1))
 
-            if not work_logs.exists():
+            if not rollup.verified_hours:
                 return None
 
-            # Calculate total hours using database aggregation for precision
-            total_hours_result = work_logs.aggregate(Sum('hours_worked'))
-            total_hours = total_hours_result['hours_worked__sum'] or Decimal('0.00')
+            total_hours = Decimal(rollup.verified_hours)
             
             # Get current payment rate
             rate = PaymentRate.get_current_rate()
@@ -510,7 +1245,9 @@ class PaymentExport(models.Model):
         help_text="Student (if applicable)"
     )
     file_name = models.CharField(max_length=255, help_text="Generated file name")
-    file_path = models.CharField(max_length=500, help_text="Path to the exported file")
+    file_path = models.CharField(max_length=500, blank=True, help_text="Path to the exported file under MEDIA_ROOT (blank once evicted)")
+    data_version = models.CharField(max_length=40, blank=True, default='', help_text="Version of the data the file was generated from")
+    file_size = models.PositiveBigIntegerField(default=0, help_text="Size of the exported file in bytes")
     exported_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -530,4 +1267,261 @@ class PaymentExport(models.Model):
         return self.export_month.strftime("%B %Y")
 
     def __str__(self):
-        return f"{self.get_export_type_display()} - {self.month_year_display} - {self.file_name}"
\ No newline at end of file
+        return f"{self.get_export_type_display()} - {self.month_year_display} - {self.file_name}"
+
+class PaymentRun(models.Model):
+    """Model to queue bulk payment calculations for the background worker"""
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+    calculation_month = models.DateField(help_text="Month to calculate (stored as first day of month)")
+    department = models.ForeignKey(
+        'Department',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='payment_runs',
+        help_text="Department to calculate (blank for all active departments)"
+    )
+    recalculate_existing = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='payment_runs'
+    )
+
+    # Progress, committed after every department so a crashed run can resume
+    total_departments = models.PositiveIntegerField(default=0)
+    completed_departments = models.JSONField(default=list, blank=True, help_text="IDs of departments already processed")
+    calculated_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    claimed_by = models.CharField(max_length=100, blank=True, default='', help_text="Worker currently processing the run")
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Payment Run"
+        verbose_name_plural = "Payment Runs"
+
+    @property
+    def month_year_display(self):
+        """Return formatted month/year for display"""
+        return self.calculation_month.strftime("%B %Y")
+
+    @property
+    def is_finished(self):
+        return self.status in ('Completed', 'Failed')
+
+    @property
+    def progress_percent(self):
+        if self.status == 'Completed':
+            return 100
+        if not self.total_departments:
+            return 0
+        return int(len(self.completed_departments) * 100 / self.total_departments)
+
+    @classmethod
+    def claim_next(cls, worker_id, stale_after=datetime.timedelta(minutes=10)):
+        """
+        Claim the oldest queued run, or a running run whose worker stopped sending heartbeats.
+
+        Claiming is a conditional UPDATE, so two workers can never both win the same row.
+        """
+        now = timezone.now()
+        candidates = cls.objects.filter(
+            models.Q(status='Queued') |
+            models.Q(status='Running', heartbeat_at__lt=now - stale_after)
+        ).order_by('created_at').values_list('pk', 'status', 'heartbeat_at')
+
+        for pk, status, heartbeat_at in candidates:
+            claimed = cls.objects.filter(pk=pk, status=status, heartbeat_at=heartbeat_at).update(
+                status='Running',
+                claimed_by=worker_id,
+                heartbeat_at=now,
+            )
+            if claimed:
+                run = cls.objects.get(pk=pk)
+                if not run.started_at:
+                    run.started_at = now
+                    run.save(update_fields=['started_at'])
+                return run
+        return None
+
+    def touch(self):
+        """
+        Record that the worker holding the run is still alive
+
+        Returns:
+            bool: False if the run has been taken over by another worker
+        """
+        return bool(PaymentRun.objects.filter(pk=self.pk, status='Running', claimed_by=self.claimed_by).update(
+            heartbeat_at=timezone.now()
+        ))
+
+    def __str__(self):
+        scope = self.department.name if self.department else "All Departments"
+        return f"{scope} - {self.month_year_display} - {self.status}"
+
+
+class DirtyPaymentMonth(models.Model):
+    """Model to track student months whose payment calculation is out of date after work log changes"""
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='dirty_payment_months'
+    )
+    month = models.DateField(help_text="Month to recalculate (stored as first day of month)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['student', 'month']
+        ordering = ['month']
+        verbose_name = "Dirty Payment Month"
+        verbose_name_plural = "Dirty Payment Months"
+
+    @classmethod
+    def mark(cls, student_dates):
+        """
+        Record (student_id, date) pairs whose month needs recalculating
+
+        Args:
+            student_dates: Iterable of (student_id, date) tuples; any day of the month may be given
+        """
+        keys = {(student_id, work_date.replace(day=1)) for student_id, work_date in student_dates}
+        cls.objects.bulk_create(
+            [cls(student_id=student_id, month=month) for student_id, month in keys],
+            ignore_conflicts=True
+        )
+
+    def __str__(self):
+        return f"{self.student} - {self.month.strftime('%B %Y')}"
+
+
+class KpiSnapshot(models.Model):
+    """
+    Coordinator dashboard totals, kept up to date on writes instead of recounted per page load
+
+    A single row. Each write adds its own change to the counters it affects
+    with an F() update once its transaction commits, so no write recounts a
+    table. The refresh_kpis command rebuilds everything from the tables.
+    """
+    GROUPS = ('work_logs', 'applications', 'departments', 'students')
+
+    total_hours = models.PositiveIntegerField(default=0, help_text="Hours of all work logs")
+    pending_applications_count = models.PositiveIntegerField(default=0)
+    approved_students_count = models.PositiveIntegerField(default=0)
+    departments_count = models.PositiveIntegerField(default=0, help_text="Active departments")
+    departments_with_incharge = models.PositiveIntegerField(default=0)
+    departments_without_incharge = models.PositiveIntegerField(default=0)
+    assigned_students_count = models.PositiveIntegerField(default=0, help_text="Active department assignments")
+    unassigned_students_count = models.PositiveIntegerField(default=0, help_text="Registered students without a department")
+    refreshed_at = models.DateTimeField(help_text="Last full rebuild")
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last change from any write")
+
+    class Meta:
+        verbose_name = "KPI Snapshot"
+        verbose_name_plural = "KPI Snapshots"
+
+    @classmethod
+    def get(cls):
+        """Get the snapshot, building it on first use"""
+        return cls.objects.filter(pk=1).first() or cls.refresh()
+
+    @classmethod
+    def refresh(cls, *groups):
+        """
+        Recount the given groups (all of them when none are given)
+
+        Returns:
+            KpiSnapshot: The updated snapshot
+        """
+        from users.models import User
+
+        values = {}
+        groups = groups or cls.GROUPS
+        if 'work_logs' in groups:
+            values['total_hours'] = WorkLog.objects.aggregate(total=Sum('hours_worked'))['total'] or 0
+        if 'applications' in groups:
+            values.update(SchemeApplication.objects.aggregate(
+                pending_applications_count=Count('id', filter=Q(status='Pending')),
+                approved_students_count=Count('id', filter=Q(status='Approved')),
+            ))
+        if 'departments' in groups:
+            values.update(Department.objects.aggregate(
+                departments_count=Count('id', filter=Q(is_active=True)),
+                departments_with_incharge=Count('id', filter=Q(incharge__isnull=False)),
+                departments_without_incharge=Count('id', filter=Q(incharge__isnull=True)),
+            ))
+        if 'students' in groups:
+            values['assigned_students_count'] = StudentDepartmentAssignment.objects.filter(is_active=True).count()
+            values['unassigned_students_count'] = User.objects.filter(
+                role='student',
+                is_registered=True,
+                studentdepartmentassignment__isnull=True
+            ).count()
+
+        now = timezone.now()
+        if set(groups) == set(cls.GROUPS):
+            values['refreshed_at'] = now
+        values['updated_at'] = now
+        if not cls.objects.filter(pk=1).update(**values):
+            # First use: build every group so the new row is complete
+            if set(groups) != set(cls.GROUPS):
+                return cls.refresh()
+            try:
+                with transaction.atomic():
+                    cls.objects.create(pk=1, **values)
+            except IntegrityError:
+                cls.objects.filter(pk=1).update(**values)
+        return cls.objects.get(pk=1)
+
+    @classmethod
+    def adjust(cls, **changes):
+        """
+        Add changes (which may be negative) to counters, e.g. adjust(total_hours=3)
+
+        A snapshot that has not been built yet is left alone; get() builds it
+        from the tables, which already include the change.
+        """
+        changes = {field: change for field, change in changes.items() if change}
+        if changes:
+            cls.objects.filter(pk=1).update(
+                **{field: Greatest(F(field) + change, 0) for field, change in changes.items()},
+                updated_at=timezone.now()
+            )
+
+    @classmethod
+    def adjust_on_commit(cls, **changes):
+        """
+        Add changes to counters once the current transaction commits
+
+        Writes use this so that they do not hold the lock on the single
+        snapshot row for the rest of their transaction, which would queue every
+        concurrent submission and review behind each other.
+        """
+        changes = {field: change for field, change in changes.items() if change}
+        if changes:
+            transaction.on_commit(lambda: cls.adjust(**changes))
+
+    @classmethod
+    def adjust_hours(cls, change):
+        """Add change (which may be negative) to the total work log hours"""
+        cls.adjust(total_hours=change)
+
+    @classmethod
+    def adjust_hours_on_commit(cls, change):
+        """Add change to the total work log hours once the current transaction commits"""
+        cls.adjust_on_commit(total_hours=change)
+
+    def __str__(self):
+        return f"KPI snapshot ({self.updated_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,465 @@
+"""
+Set-based payment calculation engine.
+
+Computes monthly payments for every assigned student of one or more
+departments with a fixed number of queries, instead of one round of
+queries per student.
+"""
+import datetime
+import logging
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum, Count, F
+from django.utils import timezone
+
+from .models import (Department, WorkLog, PaymentRate, PaymentCalculation, DepartmentPaymentSummary,
+                     StudentDepartmentAssignment, DirtyPaymentMonth, PaymentRun)
+from .utils import month_range
+
+logger = logging.getLogger(__name__)
+
+
+def calculate_payments_for_month(departments, year, month, recalculate_existing=False,
+                                 calculated_by=None, student_ids=None):
+    """
+    Calculate payments for all students assigned to the given departments
+
+    Args:
+        departments: Iterable of Department objects to process
+        year: Calculation year
+        month: Calculation month (1-12)
+        recalculate_existing: Recalculate students that already have a record for the month
+        calculated_by: User running the calculation
+        student_ids: Optional iterable restricting the run to these students
+
+    Returns:
+        dict: 'calculated' (int), 'department_counts' ({department_id: int}) and 'errors' (list of str)
+    """
+    departments = list(departments)
+    department_by_id = {dept.id: dept for dept in departments}
+    result = {'calculated': 0, 'department_counts': {}, 'errors': []}
+
+    if not departments:
+        return result
+
+    rate = PaymentRate.get_current_rate()
+    if not rate:
+        result['errors'].append("No payment rate has been set. Please contact EL Coordinator.")
+        return result
+
+    calculation_month = datetime.date(year, month, 1)
+    assignment_filter = {
+        'student__role': 'student',
+        'student__is_registered': True,
+        'student__studentdepartmentassignment__is_active': True,
+        'student__studentdepartmentassignment__department__in': list(department_by_id),
+    }
+    if student_ids is not None:
+        assignment_filter['student_id__in'] = list(student_ids)
+
+    # One grouped aggregate for every (student, department) pair with verified hours
+    hours_rows = WorkLog.objects.filter(
+        **month_range(year, month),
+        is_verified=True,
+        is_rejected=False,
+        **assignment_filter
+    ).values(
+        'student_id', 'student__studentdepartmentassignment__department_id'
+    ).annotate(total_hours=Sum('hours_worked'))
+
+    # One query for the records that already exist for these students
+    existing_records = {
+        record.student_id: record
+        for record in PaymentCalculation.objects.filter(
+            calculation_month=calculation_month,
+            **assignment_filter
+        )
+    }
+
+    to_create = {}
+    to_update = {}
+    now = timezone.now()
+
+    for row in hours_rows:
+        student_id = row['student_id']
+        department_id = row['student__studentdepartmentassignment__department_id']
+        existing_record = existing_records.get(student_id)
+
+        if existing_record and not recalculate_existing:
+            continue
+
+        total_hours = Decimal(row['total_hours'] or 0)
+        total_amount = total_hours * rate.rate_per_hour
+
+        if existing_record:
+            existing_record.department_id = department_id
+            existing_record.total_hours = total_hours
+            existing_record.rate_per_hour = rate.rate_per_hour
+            existing_record.total_amount = total_amount
+            existing_record.calculated_by = calculated_by
+            existing_record.updated_at = now
+            to_update.setdefault(department_id, []).append(existing_record)
+        else:
+            to_create.setdefault(department_id, []).append(PaymentCalculation(
+                student_id=student_id,
+                department_id=department_id,
+                calculation_month=calculation_month,
+                total_hours=total_hours,
+                rate_per_hour=rate.rate_per_hour,
+                total_amount=total_amount,
+                calculated_by=calculated_by,
+            ))
+
+    with transaction.atomic():
+        for department_id, dept in department_by_id.items():
+            new_records = to_create.get(department_id, [])
+            updated_records = to_update.get(department_id, [])
+            if not new_records and not updated_records:
+                continue
+
+            # A savepoint per department keeps one failing department from
+            # discarding the others, matching the per-department error reporting
+            try:
+                with transaction.atomic():
+                    PaymentCalculation.objects.bulk_create(new_records)
+                    PaymentCalculation.objects.bulk_update(
+                        updated_records,
+                        ['department', 'total_hours', 'rate_per_hour', 'total_amount',
+                         'calculated_by', 'updated_at']
+                    )
+            except Exception as e:
+                logger.error(f"Error processing department {dept.name} for {year}-{month}: {str(e)}")
+                result['errors'].append(f"Error processing department {dept.name}: {str(e)}")
+                continue
+
+            dept_calculated = len(new_records) + len(updated_records)
+            result['department_counts'][department_id] = dept_calculated
+            result['calculated'] += dept_calculated
+
+        if result['department_counts']:
+            result['errors'].extend(
+                generate_department_summaries(
+                    [department_by_id[dept_id] for dept_id in result['department_counts']],
+                    calculation_month
+                )
+            )
+
+    return result
+
+
+def generate_department_summaries(departments, calculation_month):
+    """
+    Regenerate DepartmentPaymentSummary rows for the given departments and month
+
+    Args:
+        departments: Iterable of Department objects
+        calculation_month: First day of the month to summarise
+
+    Returns:
+        list: Error messages (empty on success)
+    """
+    departments = list(departments)
+    department_by_id = {dept.id: dept for dept in departments}
+
+    totals = PaymentCalculation.objects.filter(
+        calculation_month=calculation_month,
+        department_id__in=list(department_by_id)
+    ).values('department_id').annotate(
+        total_students=Count('id'),
+        total_hours=Sum('total_hours'),
+        total_amount=Sum('total_amount')
+    )
+
+    existing_summaries = {
+        summary.department_id: summary
+        for summary in DepartmentPaymentSummary.objects.filter(
+            calculation_month=calculation_month,
+            department_id__in=list(department_by_id)
+        )
+    }
+
+    to_create = []
+    to_update = []
+    now = timezone.now()
+
+    for row in totals:
+        total_students = row['total_students']
+        total_hours = row['total_hours'] or Decimal('0.00')
+        total_amount = row['total_amount'] or Decimal('0.00')
+        average_hours = total_hours / total_students if total_students > 0 else Decimal('0.00')
+
+        summary = existing_summaries.get(row['department_id'])
+        if summary:
+            summary.total_students = total_students
+            summary.total_hours = total_hours
+            summary.total_amount = total_amount
+            summary.average_hours_per_student = average_hours
+            summary.updated_at = now
+            to_update.append(summary)
+        else:
+            to_create.append(DepartmentPaymentSummary(
+                department_id=row['department_id'],
+                calculation_month=calculation_month,
+                total_students=total_students,
+                total_hours=total_hours,
+                total_amount=total_amount,
+                average_hours_per_student=average_hours,
+            ))
+
+    # Departments left without any calculation for the month no longer have a summary
+    summarised_ids = {row['department_id'] for row in totals}
+    stale_ids = [dept_id for dept_id in existing_summaries if dept_id not in summarised_ids]
+
+    try:
+        with transaction.atomic():
+            if stale_ids:
+                DepartmentPaymentSummary.objects.filter(
+                    calculation_month=calculation_month,
+                    department_id__in=stale_ids
+                ).delete()
+            DepartmentPaymentSummary.objects.bulk_create(to_create)
+            DepartmentPaymentSummary.objects.bulk_update(
+                to_update,
+                ['total_students', 'total_hours', 'total_amount',
+                 'average_hours_per_student', 'updated_at']
+            )
+    except Exception as e:
+        logger.error(f"Error generating department summaries for {calculation_month:%Y-%m}: {str(e)}")
+        return [f"Error generating summary for {dept.name}: {str(e)}" for dept in departments]
+
+    return []
+
+
+class RunTakenOver(Exception):
+    """The payment run was claimed by another worker while this one was processing it"""
+
+
+@contextmanager
+def payment_run_heartbeat(run):
+    """
+    Keep a run's heartbeat current from a side thread while the block runs
+
+    A department can take longer than the stale window of claim_next, and its
+    progress is only committed at the end, so the heartbeat is written on the
+    thread's own connection every settings.PAYMENT_RUN_HEARTBEAT_INTERVAL seconds.
+    """
+    interval = getattr(settings, 'PAYMENT_RUN_HEARTBEAT_INTERVAL', 60)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    run.touch()
+                except DatabaseError as e:
+                    # SQLite: the department's transaction holds the write lock; try again next beat
+                    logger.error(f"Heartbeat of payment run {run.pk} failed: {str(e)}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'payment-run-{run.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_payment_run(run):
+    """
+    Work through a claimed PaymentRun one department at a time
+
+    Each department's payments and the run's progress are committed together,
+    so a run picked up again after a crash skips departments already done.
+    A department is only committed while the run is still held by this
+    worker, so a run taken over by another worker is never calculated twice.
+
+    Args:
+        run: PaymentRun claimed by the current worker
+    """
+    if run.department_id:
+        departments = [run.department]
+    else:
+        departments = list(Department.objects.filter(is_active=True).order_by('id'))
+
+    run.total_departments = len(departments)
+    run.save(update_fields=['total_departments'])
+
+    year = run.calculation_month.year
+    month = run.calculation_month.month
+
+    try:
+        for dept in departments:
+            if dept.id in run.completed_departments:
+                continue
+
+            with payment_run_heartbeat(run), transaction.atomic():
+                dept_result = calculate_payments_for_month(
+                    [dept], year, month,
+                    recalculate_existing=run.recalculate_existing,
+                    calculated_by=run.requested_by
+                )
+                if not PaymentRun.objects.select_for_update().filter(pk=run.pk, claimed_by=run.claimed_by).exists():
+                    raise RunTakenOver(f"Payment run {run.pk} was taken over by another worker")
+                run.completed_departments = run.completed_departments + [dept.id]
+                run.calculated_count += dept_result['calculated']
+                run.errors = run.errors + dept_result['errors']
+                run.heartbeat_at = timezone.now()
+                run.save(update_fields=['completed_departments', 'calculated_count', 'errors', 'heartbeat_at'])
+    except RunTakenOver as e:
+        # The department was rolled back; the worker now holding the run finishes it
+        logger.error(str(e))
+        return run
+    except Exception as e:
+        logger.error(f"Payment run {run.pk} failed: {str(e)}")
+        run.status = 'Failed'
+        run.errors = run.errors + [f"Payment run stopped: {str(e)}"]
+    else:
+        run.status = 'Completed'
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'errors', 'finished_at'])
+    return run
+
+
+def recalculate_dirty_payments(calculated_by=None):
+    """
+    Rebuild only the PaymentCalculation and DepartmentPaymentSummary rows
+    affected by work log changes recorded in DirtyPaymentMonth
+
+    Months whose payroll has not been calculated yet are skipped, since the
+    next full run will pick their logs up anyway.
+
+    Returns:
+        dict: 'recalculated' (int), 'removed' (int) and 'errors' (list of str)
+    """
+    result = {'recalculated': 0, 'removed': 0, 'errors': []}
+
+    months = sorted(set(DirtyPaymentMonth.objects.values_list('month', flat=True)))
+
+    for calculation_month in months:
+        with transaction.atomic():
+            # Claim the month's rows in the same transaction as the recalculation, so a
+            # change marked while it runs leaves a new row behind instead of being lost
+            claimed = list(DirtyPaymentMonth.objects.select_for_update().filter(
+                month=calculation_month
+            ).values_list('pk', 'student_id'))
+            if not claimed:
+                continue
+            DirtyPaymentMonth.objects.filter(pk__in=[pk for pk, _ in claimed]).delete()
+            student_ids = {student_id for _, student_id in claimed}
+
+            # Departments the students belong to now, plus any they were paid under before
+            department_ids = set(StudentDepartmentAssignment.objects.filter(
+                student_id__in=student_ids, is_active=True
+            ).values_list('department_id', flat=True))
+            existing_department_ids = set(PaymentCalculation.objects.filter(
+                student_id__in=student_ids, calculation_month=calculation_month
+            ).values_list('department_id', flat=True))
+
+            # Only touch departments whose payroll for the month has already been calculated
+            calculated_department_ids = set(DepartmentPaymentSummary.objects.filter(
+                calculation_month=calculation_month,
+                department_id__in=department_ids | existing_department_ids
+            ).values_list('department_id', flat=True)) | existing_department_ids
+            if not calculated_department_ids:
+                continue
+
+            departments = list(Department.objects.filter(id__in=calculated_department_ids))
+
+            # Students whose verified hours for the month were all rejected no longer get paid
+            paid_student_ids = WorkLog.objects.filter(
+                student_id__in=student_ids,
+                **month_range(calculation_month.year, calculation_month.month),
+                is_verified=True,
+                is_rejected=False
+            ).values_list('student_id', flat=True)
+            removed, _ = PaymentCalculation.objects.filter(
+                student_id__in=student_ids,
+                calculation_month=calculation_month
+            ).exclude(student_id__in=paid_student_ids).delete()
+            result['removed'] += removed
+
+            month_result = calculate_payments_for_month(
+                [dept for dept in departments if dept.id in department_ids],
+                calculation_month.year, calculation_month.month,
+                recalculate_existing=True,
+                calculated_by=calculated_by,
+                student_ids=student_ids
+            )
+            result['recalculated'] += month_result['calculated']
+            result['errors'].extend(month_result['errors'])
+
+            # Summaries of departments that only lost students were not regenerated above
+            result['errors'].extend(generate_department_summaries(
+                [dept for dept in departments if dept.id not in month_result['department_counts']],
+                calculation_month
+            ))
+
+    return result
+
+
+def department_budget_matrix(departments, start_month, end_month, count_assigned=False):
+    """
+    Payment totals for every department by calendar month over a range of months
+
+    The department x month grid comes from one grouped DepartmentPaymentSummary
+    query and the student counts from one more grouped query, whatever the range.
+
+    Args:
+        departments: Iterable of Department objects to include
+        start_month: First day of the first month in the range
+        end_month: Any day in the last month of the range
+        count_assigned: Count every approved student assigned to the department
+            instead of only those with a payment calculation in the range
+
+    Returns:
+        list: One dict per department with 'department', 'monthly_totals' (12 Decimals, Jan-Dec),
+        'quarterly_totals' (4 Decimals), 'year_total' and 'student_count'
+    """
+    departments = list(departments)
+    department_ids = [dept.id for dept in departments]
+    zero = Decimal('0.00')
+
+    monthly_totals = {dept_id: [zero] * 12 for dept_id in department_ids}
+    for row in DepartmentPaymentSummary.objects.filter(
+        department_id__in=department_ids,
+        calculation_month__gte=start_month,
+        calculation_month__lte=end_month
+    ).values('department_id', 'calculation_month').annotate(amount=Sum('total_amount')):
+        # Ranges longer than a year fold onto the same calendar month
+        monthly_totals[row['department_id']][row['calculation_month'].month - 1] += row['amount'] or zero
+
+    if count_assigned:
+        student_rows = StudentDepartmentAssignment.objects.filter(
+            department_id__in=department_ids,
+            is_active=True,
+            student__schemeapplication__status='Approved'
+        ).values('department_id').annotate(student_count=Count('student', distinct=True))
+    else:
+        student_rows = PaymentCalculation.objects.filter(
+            department_id__in=department_ids,
+            calculation_month__gte=start_month,
+            calculation_month__lte=end_month,
+            student__studentdepartmentassignment__department=F('department'),
+            student__studentdepartmentassignment__is_active=True,
+            student__schemeapplication__status='Approved'
+        ).values('department_id').annotate(student_count=Count('student', distinct=True))
+    student_counts = {row['department_id']: row['student_count'] for row in student_rows}
+
+    matrix = []
+    for dept in departments:
+        totals = monthly_totals[dept.id]
+        matrix.append({
+            'department': dept,
+            'monthly_totals': totals,
+            'quarterly_totals': [sum(totals[i:i + 3], zero) for i in range(0, 12, 3)],
+            'year_total': sum(totals, zero),
+            'student_count': student_counts.get(dept.id, 0),
+        })
+    return matrix
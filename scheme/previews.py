@@ -0,0 +1,135 @@
+"""
+Document previews for application review.
+
+Photos are downscaled with Pillow and the first page of each PDF is
+rendered with poppler's pdftoppm, both into small JPEGs stored under
+scheme_documents/previews/. Either tool is optional: documents whose
+renderer is not installed are marked Unsupported and the review pages
+keep linking to the original file.
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .models import SchemeApplication, DocumentPreview
+from .storage import get_document_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; photos then get no preview
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+PREVIEW_PREFIX = 'scheme_documents/previews'
+
+
+def preview_max_size():
+    """Longest side of a preview in pixels (settings.DOCUMENT_PREVIEW_MAX_SIZE)"""
+    return getattr(settings, 'DOCUMENT_PREVIEW_MAX_SIZE', 600)
+
+
+def preview_name_for(source_name):
+    """Storage name of the preview of a document, e.g. scheme_documents/previews/blobs/3f/3fa9...c1.pdf.jpg"""
+    relative = source_name.split('scheme_documents/', 1)[-1]
+    return f'{PREVIEW_PREFIX}/{relative}.jpg'
+
+
+def render_preview(path):
+    """
+    Render a JPEG preview of the document at path
+
+    Returns:
+        bytes: The JPEG, or None if no renderer for this kind of file is installed
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pdf':
+        return _render_pdf_page(path)
+    if extension in IMAGE_EXTENSIONS:
+        return _render_image(path)
+    return None
+
+
+def _render_image(path):
+    if Image is None:
+        return None
+    size = preview_max_size()
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=80, optimize=True)
+    return output.getvalue()
+
+
+def _render_pdf_page(path):
+    command = shutil.which(getattr(settings, 'PDF_PREVIEW_COMMAND', 'pdftoppm'))
+    if command is None:
+        return None
+    with tempfile.TemporaryDirectory() as output_dir:
+        output = os.path.join(output_dir, 'page')
+        subprocess.run(
+            [command, '-jpeg', '-f', '1', '-l', '1', '-scale-to', str(preview_max_size()), '-singlefile', path, output],
+            check=True, capture_output=True, timeout=60,
+        )
+        with open(f'{output}.jpg', 'rb') as page:
+            return page.read()
+
+
+def process_preview(preview):
+    """
+    Render a claimed DocumentPreview and store the image
+
+    Returns:
+        DocumentPreview: The preview with its final status
+    """
+    try:
+        data = render_preview(get_document_storage().path(preview.source_name))
+    except Exception as e:
+        logger.error(f"Preview of {preview.source_name} failed: {e}")
+        preview.status = 'Failed'
+        preview.error = str(e)[:1000]
+    else:
+        if data is None:
+            preview.status = 'Unsupported'
+        else:
+            name = preview_name_for(preview.source_name)
+            # A re-rendered preview replaces the old image under the same name
+            default_storage.delete(name)
+            preview.preview_name = default_storage.save(name, ContentFile(data))
+            preview.status = 'Ready'
+        preview.error = ''
+    preview.claimed_by = ''
+    preview.save(update_fields=['status', 'preview_name', 'error', 'claimed_by', 'updated_at'])
+    return preview
+
+
+def document_gallery(application):
+    """
+    Previews of an application's documents, for showing them inline on review pages
+
+    Returns:
+        list: dicts with field, label, url (the original) and preview_url, in field order,
+        for the documents whose preview is ready
+    """
+    previews = DocumentPreview.for_application(application)
+    return [
+        {
+            'field': field,
+            'label': SchemeApplication._meta.get_field(field).verbose_name.title(),
+            'url': reverse('application_document', args=[application.id, field]),
+            'preview_url': reverse('application_document_preview', args=[application.id, field]),
+        }
+        for field in SchemeApplication.DOCUMENT_FIELDS if field in previews
+    ]
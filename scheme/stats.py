@@ -0,0 +1,70 @@
+"""
+Per-student work log statistics.
+
+Everything the student dashboard shows about a student's hours comes from
+one conditional aggregate over their work logs, and the same numbers are
+handed to work log validation so a submission does not recount them.
+"""
+from datetime import timedelta
+
+from django.db.models import CharField, Count, Max, Q, Sum, Value
+from django.db.models.functions import Concat
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.timezone import localdate
+
+from .models import WorkLog, monthly_hour_cap
+
+
+class StudentStats:
+    """
+    Work log totals for one student as of a given day
+
+    Attributes:
+        total_verified: Verified hours across all months
+        month_verified: Verified hours in the current month
+        month_submitted: Hours submitted (not rejected) in the current month
+        logged_today: Whether a work log exists for today
+        last_updated: {'date', 'time'} of the latest work log, or None
+        monthly_limit: Hours a student may log per month
+    """
+    def __init__(self, student, today=None):
+        self.student = student
+        self.monthly_limit = monthly_hour_cap()
+        self.today = today or localdate()
+        self.month_start = self.today.replace(day=1)
+        self.next_month_start = (self.month_start + timedelta(days=32)).replace(day=1)
+
+        in_month = Q(date__gte=self.month_start, date__lt=self.next_month_start)
+        verified = Q(is_verified=True, is_rejected=False)
+
+        totals = WorkLog.objects.filter(student=student).aggregate(
+            total_verified=Sum('hours_worked', filter=verified),
+            month_verified=Sum('hours_worked', filter=verified & in_month),
+            month_submitted=Sum('hours_worked', filter=in_month & Q(is_rejected=False)),
+            today_count=Count('id', filter=Q(date=self.today)),
+            # ISO dates and times sort as text, so the largest pair is the latest log
+            last_logged=Max(Concat('date', Value(' '), 'time', output_field=CharField())),
+        )
+
+        self.total_verified = totals['total_verified'] or 0
+        self.month_verified = totals['month_verified'] or 0
+        self.month_submitted = totals['month_submitted'] or 0
+        self.logged_today = totals['today_count'] > 0
+
+        self.last_updated = None
+        if totals['last_logged']:
+            last_date, _, last_time = totals['last_logged'].partition(' ')
+            self.last_updated = {'date': parse_date(last_date), 'time': parse_time(last_time)}
+
+    @property
+    def remaining_hours(self):
+        """Verified hours left before the monthly limit"""
+        return self.monthly_limit - self.month_verified
+
+    @property
+    def monthly_limit_reached(self):
+        return self.remaining_hours <= 0
+
+    def covers(self, work_date):
+        """Whether the monthly totals apply to work logged on work_date"""
+        return self.month_start <= work_date < self.next_month_start
@@ -0,0 +1,103 @@
+"""
+Content-addressed storage for scheme application documents.
+
+Uploads are hashed while they are written and stored once under their
+SHA-256 digest, so re-attaching the same PDF on every correction, or two
+siblings uploading the same certificate, keeps a single copy on disk.
+Each stored file has a DocumentBlob row counting the application fields
+that point at it; collect_document_blobs removes files nothing points at.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'scheme_documents/blobs'
+
+
+def blob_name(digest, extension):
+    """Storage name of the blob with a digest, e.g. scheme_documents/blobs/3f/3fa9...c1.pdf"""
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{extension}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names files after the SHA-256 of their content
+
+    The name passed in only contributes its extension. Saving content that is
+    already stored returns the existing name without writing anything.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names come from the content, and equal content may share a name
+        return name
+
+    def _save(self, name, content):
+        from .models import DocumentBlob
+
+        extension = os.path.splitext(name)[1].lower()[:10]
+        temp_dir = self.path(f'{BLOB_PREFIX}/tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+
+        # Hash while copying to a temporary file, as the digest is only known at the end
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp_file:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.remove(temp_file.name)
+                raise
+
+        name = blob_name(digest.hexdigest(), extension)
+        DocumentBlob.stored(name, digest.hexdigest(), size)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(temp_file.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_file.name, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+
+document_storage = ContentAddressedStorage()
+
+
+def get_document_storage():
+    """Storage of the SchemeApplication document fields"""
+    return document_storage
+
+
+def orphan_blob_files(before):
+    """
+    Files under the blob directory without a DocumentBlob row, last modified before a datetime
+
+    These are left by uploads interrupted between writing the file and
+    recording it, and by temporary files of crashed saves.
+
+    Returns:
+        list: (storage name, size) pairs
+    """
+    from .models import DocumentBlob
+
+    root = document_storage.path(BLOB_PREFIX)
+    cutoff = before.timestamp()
+    candidates = []
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            stat = os.stat(path)
+            if stat.st_mtime < cutoff:
+                name = os.path.relpath(path, document_storage.location).replace(os.sep, '/')
+                candidates.append((name, stat.st_size))
+
+    known = set(DocumentBlob.objects.filter(name__in=[name for name, _ in candidates]).values_list('name', flat=True))
+    return [(name, size) for name, size in candidates if name not in known]
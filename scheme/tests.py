@@ -1,3 +1,1697 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import QuerySet, Sum
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+from . import exports, payments
+from .documents import can_view_documents
+from .forms import SchemeApplicationForm, WorkLogForm
+from .imports import DUPLICATE_DAY_ERROR, WorkLogImport, parse_import_rows, write_import_report
+from .membership import VERSION_KEY, department_student_ids, student_department_id
+from .previews import document_gallery, preview_name_for, process_preview
+from .utils import decode_cursor, encode_cursor, month_range
+from .validation import check_document, validate_documents
+from .models import (SchemeApplication, WorkLog, Department, DepartmentIncharge, StudentDepartmentAssignment, PaymentRate,
+                     PaymentCalculation, DepartmentPaymentSummary, DirtyPaymentMonth,
+                     StudentMonthRollup, KpiSnapshot, DocumentBlob, DocumentUpload, PaymentRun,
+                     PaymentExport, DocumentPreview, MAX_DOCUMENT_SIZE)
+from .storage import get_document_storage
+
+
+def create_application(student, prn_number, **fields):
+    return SchemeApplication.objects.create(
+        student=student, first_name='Asha', last_name='Patil', address='Nigdi', state='Maharashtra',
+        dob=datetime.date(2004, 1, 1), annual_income=50000, fathers_occupation='Farmer',
+        caste_category='General', department='CSE', prn_number=prn_number, **fields
+    )
+
+
+class MediaRootTestCase(TestCase):
+    """Stores uploaded documents in a temporary MEDIA_ROOT removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+
+class DirtyPaymentMonthTests(TestCase):
+    """recalculate_dirty_payments rebuilds flagged months without losing flags raised meanwhile"""
+
+    def setUp(self):
+        self.student = User.objects.create_user(username='student1', password='x', role='student',
+                                                is_registered=True)
+        self.department = Department.objects.create(name='Computer Engineering', code='CSE')
+        StudentDepartmentAssignment.objects.create(student=self.student, department=self.department)
+        PaymentRate.objects.create(rate_per_hour=Decimal('50.00'))
+        self.month = datetime.date(2025, 3, 1)
+        # The month's payroll has been calculated once, so changes to it are recalculated
+        DepartmentPaymentSummary.objects.create(
+            department=self.department, calculation_month=self.month, total_students=0,
+            total_hours=0, total_amount=0, average_hours_per_student=0
+        )
+        WorkLog.objects.create(student=self.student, date=datetime.date(2025, 3, 3), hours_worked=2,
+                               description='Lab work', is_verified=True)
+
+    def test_recalculates_and_clears_flagged_month(self):
+        self.assertTrue(DirtyPaymentMonth.objects.filter(student=self.student, month=self.month).exists())
+
+        payments.recalculate_dirty_payments()
+
+        self.assertFalse(DirtyPaymentMonth.objects.exists())
+        calculation = PaymentCalculation.objects.get(student=self.student, calculation_month=self.month)
+        self.assertEqual(calculation.total_hours, 2)
+
+    def test_change_marked_during_recalculation_is_kept(self):
+        calculate = payments.calculate_payments_for_month
+
+        def calculate_while_reviewed(*args, **kwargs):
+            # A review of the same month lands while the recalculation runs
+            DirtyPaymentMonth.mark([(self.student.id, self.month)])
+            return calculate(*args, **kwargs)
+
+        with mock.patch('scheme.payments.calculate_payments_for_month', side_effect=calculate_while_reviewed):
+            payments.recalculate_dirty_payments()
+
+        self.assertTrue(DirtyPaymentMonth.objects.filter(student=self.student, month=self.month).exists())
+
+
+class QueryPlanTests(TestCase):
+    """The hot work log and payment queries use their indexes (EXPLAIN QUERY PLAN)"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"Query does not use {index_name}:\n{plan}")
+
+    def test_student_verified_hours_for_month(self):
+        self.assertUsesIndex(
+            WorkLog.objects.filter(student_id=1, is_verified=True, is_rejected=False, **month_range(2025, 3)),
+            'worklog_verified_student_date'
+        )
+
+    def test_pending_work_logs_newest_first(self):
+        self.assertUsesIndex(
+            WorkLog.objects.filter(is_verified=False, is_rejected=False).order_by('-date'),
+            'worklog_pending_date'
+        )
+
+    def test_payment_calculations_for_month(self):
+        self.assertUsesIndex(
+            PaymentCalculation.objects.filter(**month_range(2025, 3, 'calculation_month')),
+            'paycalc_month_department'
+        )
+
+
+class BulkReviewWorkLogsTests(TestCase):
+    """bulk_review_work_logs reviews exactly the logs asked for"""
+
+    def setUp(self):
+        self.incharge = User.objects.create_user(username='incharge1', password='x', role='department_encharge')
+        department = Department.objects.create(name='Computer Engineering', code='CSE')
+        DepartmentIncharge.objects.create(user=self.incharge, department=department)
+        student = User.objects.create_user(username='student1', password='x', role='student', is_registered=True)
+        StudentDepartmentAssignment.objects.create(student=student, department=department)
+        self.logs = [
+            WorkLog.objects.create(student=student, date=datetime.date(2025, 3, day), hours_worked=1,
+                                   description='Lab work')
+            for day in (3, 4, 5)
+        ]
+        self.client.force_login(self.incharge)
+
+    def review(self, payload):
+        return self.client.post(reverse('bulk_review_work_logs'), json.dumps(payload),
+                                content_type='application/json')
+
+    def test_approves_listed_logs(self):
+        response = self.review({'action': 'approve', 'log_ids': [self.logs[0].id, self.logs[2].id]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()['updated_ids']), [self.logs[0].id, self.logs[2].id])
+        self.assertFalse(WorkLog.objects.get(pk=self.logs[1].pk).is_verified)
+
+    def test_rejects_log_ids_that_are_not_a_list_of_numbers(self):
+        ids = ''.join(str(log.id) for log in self.logs[:2])
+        for log_ids in (ids, [str(self.logs[0].id)], [True], {'id': self.logs[0].id}):
+            with self.subTest(log_ids=log_ids):
+                response = self.review({'action': 'approve', 'log_ids': log_ids})
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(WorkLog.objects.filter(is_verified=True).exists())
+
+
+class DepartmentMembershipTests(TestCase):
+    """Reassigning a student takes effect at once for the incharges' permissions"""
+
+    def setUp(self):
+        self.departments = [Department.objects.create(name=f'Department {code}', code=code) for code in ('CSE', 'IT')]
+        self.incharges = []
+        for department in self.departments:
+            user = User.objects.create_user(username=f'incharge-{department.code}', password='x',
+                                            role='department_encharge')
+            DepartmentIncharge.objects.create(user=user, department=department)
+            self.incharges.append(user)
+        self.student = User.objects.create_user(username='student1', password='x', role='student', is_registered=True)
+        self.assignment = StudentDepartmentAssignment.objects.create(student=self.student, department=self.departments[0])
+        self.application = create_application(self.student, '124M1H001')
+
+    def reassign(self):
+        self.assertEqual(department_student_ids(self.departments[0]), [self.student.id])
+        self.assertTrue(can_view_documents(User.objects.get(pk=self.incharges[0].pk), self.application))
+
+        self.assignment.department = self.departments[1]
+        self.assignment.save()
+
+        self.assertEqual(department_student_ids(self.departments[0]), [])
+        self.assertEqual(department_student_ids(self.departments[1]), [self.student.id])
+        self.assertFalse(can_view_documents(User.objects.get(pk=self.incharges[0].pk), self.application))
+        self.assertTrue(can_view_documents(User.objects.get(pk=self.incharges[1].pk), self.application))
+
+    def shared_cache(self):
+        # A file-based cache is shared by every worker on the host, like memcached or Redis
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cache_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir}})
+        cache_override.enable()
+        self.addCleanup(cache_override.disable)
+
+    def test_reassignment_with_shared_cache(self):
+        self.shared_cache()
+        self.reassign()
+
+    def test_warm_lookups_only_read_the_shared_cache(self):
+        self.shared_cache()
+        department_student_ids(self.departments[0])
+        student_department_id(self.student)
+
+        with self.assertNumQueries(0), mock.patch.object(cache, 'add') as add, mock.patch.object(cache, 'set') as set_:
+            self.assertEqual(department_student_ids(self.departments[0]), [self.student.id])
+            self.assertEqual(student_department_id(self.student), self.departments[0].id)
+        add.assert_not_called()
+        set_.assert_not_called()
+
+    def test_reassignment_with_local_memory_cache(self):
+        self.reassign()
+        # Another worker's local cache would never hear of the change, so nothing is cached
+        self.assertIsNone(cache.get(VERSION_KEY))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'membership_cache'}})
+    def test_database_cache_is_not_used(self):
+        # Each lookup is one indexed query, cheaper than reading the cache table
+        with self.assertNumQueries(1):
+            self.assertEqual(department_student_ids(self.departments[0]), [self.student.id])
+        with self.assertNumQueries(1):
+            self.assertIsNone(student_department_id(self.incharges[0]))
+
+
+@override_settings(WORK_LOG_MONTHLY_HOUR_CAP=10)
+class MonthlyHourCapTests(TestCase):
+    """WorkLog.save reserves hours against the monthly cap through StudentMonthRollup"""
+
+    def setUp(self):
+        self.student = User.objects.create_user(username='student1', password='x', role='student', is_registered=True)
+        # 9 of the 10 hours used in March 2025
+        self.logs = [self.log(day, 3) for day in (3, 4, 5)]
+
+    def log(self, day, hours, **kwargs):
+        return WorkLog.objects.create(student=self.student, date=datetime.date(2025, 3, day), hours_worked=hours,
+                                      description='Lab work', **kwargs)
+
+    def rollup(self):
+        return StudentMonthRollup.objects.get(student=self.student, month=datetime.date(2025, 3, 1))
+
+    def assertRollupMatchesLogs(self):
+        rollup = self.rollup()
+        logs = WorkLog.objects.filter(student=self.student)
+        self.assertEqual(rollup.submitted_hours, sum(log.hours_worked for log in logs if not log.is_rejected))
+        self.assertEqual(rollup.rejected_hours, sum(log.hours_worked for log in logs if log.is_rejected))
+        self.assertEqual(rollup.log_count, len(logs))
+
+    def test_hours_that_exactly_fill_the_month_are_accepted(self):
+        self.log(6, 1)
+
+        self.assertEqual(self.rollup().submitted_hours, 10)
+        self.assertRollupMatchesLogs()
+
+    def test_hours_over_the_cap_are_refused(self):
+        with self.assertRaisesMessage(ValidationError, 'You can only add 1 more hours this month.'):
+            self.log(6, 2)
+
+        self.assertFalse(WorkLog.objects.filter(date=datetime.date(2025, 3, 6)).exists())
+        self.assertEqual(self.rollup().submitted_hours, 9)
+
+    def test_other_months_are_not_affected(self):
+        WorkLog.objects.create(student=self.student, date=datetime.date(2025, 4, 1), hours_worked=3,
+                               description='Lab work')
+
+        self.assertEqual(self.rollup().submitted_hours, 9)
+
+    def test_editing_a_log_only_reserves_the_difference(self):
+        log = self.logs[0]
+        log.hours_worked = 4
+        log.save()
+
+        self.assertEqual(self.rollup().submitted_hours, 10)
+        log.hours_worked = 5
+        with self.assertRaises(ValidationError):
+            log.save()
+        self.assertEqual(WorkLog.objects.get(pk=log.pk).hours_worked, 4)
+
+    def test_rejected_hours_are_released(self):
+        log = self.logs[0]
+        log.is_rejected = True
+        log.save()
+
+        self.assertEqual(self.rollup().submitted_hours, 6)
+        self.log(6, 3)
+        self.log(7, 1)
+        self.assertEqual(self.rollup().submitted_hours, 10)
+        self.assertRollupMatchesLogs()
+
+    def test_bulk_rejected_hours_are_released(self):
+        WorkLog.bulk_review(WorkLog.objects.filter(pk=self.logs[0].pk), verify=False, reason='Not attended')
+
+        self.assertEqual(self.rollup().submitted_hours, 6)
+        self.assertRollupMatchesLogs()
+
+    def test_deleted_hours_are_released(self):
+        self.logs[0].delete()
+
+        self.assertEqual(self.rollup().submitted_hours, 6)
+        self.log(6, 3)
+        self.assertRollupMatchesLogs()
+
+    def test_deleting_every_log_removes_the_rollup(self):
+        for log in self.logs:
+            log.delete()
+
+        self.assertFalse(StudentMonthRollup.objects.filter(student=self.student).exists())
+
+    def test_bulk_refresh_updates_rollups_in_place(self):
+        april = WorkLog.objects.create(student=self.student, date=datetime.date(2025, 4, 1), hours_worked=3,
+                                       description='Lab work')
+        before = dict(StudentMonthRollup.objects.values_list('month', 'pk'))
+
+        WorkLog.bulk_review(WorkLog.objects.filter(pk__in=[self.logs[0].pk, april.pk]), verify=True)
+
+        self.assertEqual(dict(StudentMonthRollup.objects.values_list('month', 'pk')), before)
+        self.assertEqual(self.rollup().verified_hours, 3)
+        self.assertEqual(StudentMonthRollup.objects.get(month=datetime.date(2025, 4, 1)).verified_hours, 3)
+
+    def test_rollups_kept_by_saves_match_a_rebuild(self):
+        other = User.objects.create_user(username='student2', password='x', role='student', is_registered=True)
+        self.logs[1].hours_worked = 1
+        self.logs[1].save()
+        self.logs[2].date = datetime.date(2025, 4, 2)
+        self.logs[2].save()
+        WorkLog.objects.create(student=other, date=datetime.date(2025, 3, 3), hours_worked=4, description='Lab work')
+        WorkLog.objects.create(student=other, date=datetime.date(2025, 4, 3), hours_worked=2, description='Lab work')
+        WorkLog.bulk_review(WorkLog.objects.filter(student=other), verify=False, reason='Not attended')
+        WorkLog.bulk_review(WorkLog.objects.filter(pk=self.logs[0].pk), verify=True)
+        self.log(6, 2).delete()
+        kept = {(r.student_id, r.month): (r.pk, r.submitted_hours, r.verified_hours, r.rejected_hours, r.log_count)
+                for r in StudentMonthRollup.objects.all()}
+
+        call_command('rebuild_work_rollups', '--check', stdout=StringIO())
+        call_command('rebuild_work_rollups', stdout=StringIO())
+
+        rebuilt = {(r.student_id, r.month): (r.pk, r.submitted_hours, r.verified_hours, r.rejected_hours, r.log_count)
+                   for r in StudentMonthRollup.objects.all()}
+        self.assertEqual(rebuilt, kept)
+
+    def test_rebuild_fixes_drift_in_place(self):
+        rollup = self.rollup()
+        StudentMonthRollup.objects.filter(pk=rollup.pk).update(submitted_hours=1)
+
+        call_command('rebuild_work_rollups', stdout=StringIO())
+
+        self.assertEqual(self.rollup().pk, rollup.pk)
+        self.assertRollupMatchesLogs()
+
+    def test_reservation_refused_when_the_total_changes_before_the_check(self):
+        # The conditional UPDATE found no room, but by the time the total is read back a
+        # concurrent change has made room: the reservation still fails, without a partial write
+        with mock.patch('scheme.models.validate_monthly_hours'):
+            with self.assertRaisesMessage(ValidationError, 'Monthly limit of 10 hours has been reached'):
+                self.log(6, 2)
+
+        self.assertEqual(self.rollup().submitted_hours, 9)
+        self.assertRollupMatchesLogs()
+
+
+class KpiSnapshotHoursTests(TestCase):
+    """Work log writes adjust the KPI hours after their transaction, not inside it"""
+
+    def setUp(self):
+        self.student = User.objects.create_user(username='student1', password='x', role='student', is_registered=True)
+        KpiSnapshot.refresh()
+
+    def total_hours(self):
+        return KpiSnapshot.objects.get(pk=1).total_hours
+
+    def test_hours_are_adjusted_once_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                log = WorkLog.objects.create(student=self.student, date=datetime.date(2025, 3, 3),
+                                             hours_worked=2, description='Lab work')
+                # The snapshot row is not written (and so not locked) by the work log transaction
+                self.assertEqual(self.total_hours(), 0)
+        self.assertEqual(self.total_hours(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            log.hours_worked = 3
+            log.save()
+        self.assertEqual(self.total_hours(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            log.delete()
+        self.assertEqual(self.total_hours(), 0)
+
+    def test_rolled_back_write_leaves_hours_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    WorkLog.objects.create(student=self.student, date=datetime.date(2025, 3, 3),
+                                           hours_worked=2, description='Lab work')
+                    raise ValidationError('Cancelled')
+            except ValidationError:
+                pass
+        self.assertEqual(self.total_hours(), 0)
+
+
+class KpiSnapshotDeltaTests(TestCase):
+    """Application, department and assignment writes adjust the KPI counters without recounting"""
+
+    COUNTERS = ('pending_applications_count', 'approved_students_count', 'departments_count',
+                'departments_with_incharge', 'departments_without_incharge',
+                'assigned_students_count', 'unassigned_students_count')
+
+    def setUp(self):
+        self.students = [User.objects.create_user(username=f'student{n}', password='x', role='student',
+                                                  is_registered=True) for n in range(3)]
+        self.incharge = User.objects.create_user(username='incharge1', password='x', role='department_encharge')
+        self.department = Department.objects.create(name='Computer Engineering', code='CSE')
+        KpiSnapshot.refresh()
+
+    def counters(self):
+        return KpiSnapshot.objects.filter(pk=1).values(*self.COUNTERS).get()
+
+    def assertMatchesRecount(self):
+        adjusted = self.counters()
+        KpiSnapshot.refresh()
+        self.assertEqual(adjusted, self.counters())
+
+    def write(self, action):
+        """Run a write and its on-commit adjustments, checking it recounts no table"""
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                action()
+        recounts = [query['sql'] for query in queries.captured_queries
+                    if 'COUNT(' in query['sql'] and 'notifications_notification' not in query['sql']]
+        self.assertEqual(recounts, [])
+        self.assertMatchesRecount()
+
+    def test_application_writes_adjust_status_counts(self):
+        applications = []
+        self.write(lambda: applications.append(create_application(self.students[0], '124M1H001')))
+        self.assertEqual(self.counters()['pending_applications_count'], 1)
+
+        application = applications[0]
+        application.status = 'Approved'
+        self.write(application.save)
+        self.assertEqual(self.counters()['approved_students_count'], 1)
+
+        self.write(application.delete)
+        self.assertEqual(self.counters()['approved_students_count'], 0)
+
+    def test_department_and_incharge_writes_adjust_department_counts(self):
+        incharges = []
+        self.write(lambda: incharges.append(DepartmentIncharge.objects.create(user=self.incharge,
+                                                                              department=self.department)))
+        self.assertEqual(self.counters()['departments_with_incharge'], 1)
+
+        self.department.is_active = False
+        self.write(self.department.save)
+        self.assertEqual(self.counters()['departments_count'], 0)
+
+        self.write(incharges[0].delete)
+        self.write(lambda: Department.objects.create(name='Information Technology', code='IT'))
+        self.assertEqual(self.counters()['departments_without_incharge'], 2)
+
+        self.write(self.department.delete)
+
+    def test_assignment_writes_adjust_student_counts(self):
+        assignments = []
+        self.write(lambda: assignments.append(StudentDepartmentAssignment.objects.create(
+            student=self.students[0], department=self.department)))
+        self.assertEqual(self.counters()['unassigned_students_count'], 2)
+
+        assignments[0].is_active = False
+        self.write(assignments[0].save)
+        self.assertEqual(self.counters()['assigned_students_count'], 0)
+
+        self.write(assignments[0].delete)
+        self.assertEqual(self.counters()['unassigned_students_count'], 3)
+
+        self.write(lambda: StudentDepartmentAssignment.objects.create(student=self.students[1],
+                                                                      department=self.department))
+        self.write(self.department.delete)
+        self.assertEqual(self.counters()['unassigned_students_count'], 3)
+
+    def test_bulk_assignment_adjusts_student_counts(self):
+        coordinator = User.objects.create_user(username='coordinator1', password='x', role='el_coordinator')
+        self.client.force_login(coordinator)
+        self.write(lambda: self.client.post(reverse('bulk_assign_students'), {
+            'students': [student.pk for student in self.students[:2]],
+            'department': self.department.pk,
+        }))
+        self.assertEqual(self.counters()['assigned_students_count'], 2)
+        self.assertEqual(self.counters()['unassigned_students_count'], 1)
+
+    def test_rolled_back_write_leaves_counts_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    create_application(self.students[0], '124M1H001')
+                    raise ValidationError('Cancelled')
+            except ValidationError:
+                pass
+        self.assertEqual(self.counters()['pending_applications_count'], 0)
+
+
+class DashboardDataTests(TestCase):
+    """The dashboard endpoints return only the sections asked for and version the coordinator's by the snapshot"""
+
+    def setUp(self):
+        self.coordinator = User.objects.create_user(username='coordinator1', role='el_coordinator')
+        self.incharge = User.objects.create_user(username='incharge1', role='department_encharge')
+        self.department = Department.objects.create(name='Computer Engineering', code='CSE')
+        DepartmentIncharge.objects.create(user=self.incharge, department=self.department)
+        self.students = [User.objects.create_user(username=f'student{n}', role='student',
+                                                  is_registered=True) for n in range(12)]
+        StudentDepartmentAssignment.objects.create(student=self.students[0], department=self.department)
+        WorkLog.objects.create(student=self.students[0], date=datetime.date(2025, 3, 3), hours_worked=2,
+                               description='Lab work')
+        KpiSnapshot.refresh()
+
+    def get(self, name, user, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse(name), params)
+
+    def test_coordinator_kpis_are_versioned_by_the_snapshot(self):
+        response = self.get('api_coordinator_dashboard', self.coordinator, section='kpis')
+        self.assertEqual(set(response.json()), {'kpis'})
+        self.assertEqual(response.json()['kpis']['pending_applications_count'], 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            unchanged = self.client.get(reverse('api_coordinator_dashboard'), {'section': 'kpis'},
+                                        HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'scheme_studentmonthrollup' in query['sql'] or 'scheme_worklog' in query['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_application(self.students[1], '124M1H001')
+        changed = self.client.get(reverse('api_coordinator_dashboard'), {'section': 'kpis'},
+                                  HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['kpis']['pending_applications_count'], 1)
+
+    def test_coordinator_pages_pending_applications(self):
+        for n, student in enumerate(self.students):
+            create_application(student, f'124M1H{n:03}')
+
+        page = self.get('api_coordinator_dashboard', self.coordinator, section='pending_applications', page=2).json()
+        self.assertEqual(set(page), {'pending_applications', 'pending_applications_page'})
+        self.assertEqual(len(page['pending_applications']), 2)
+        self.assertEqual(page['pending_applications_page']['start_index'], 11)
+        self.assertEqual(page['pending_applications'][0]['url'],
+                         reverse('view_application', args=[page['pending_applications'][0]['id']]))
+        self.assertContains(self.client.get(reverse('el_coordinator_dashboard')), 'id="pendingApplicationsPager"')
+
+    def test_department_counts_skip_the_work_logs(self):
+        counts = self.get('api_department_dashboard', self.incharge, section='counts').json()
+        self.assertEqual(counts, {
+            'department': {'id': self.department.id, 'name': 'Computer Engineering', 'code': 'CSE'},
+            'pending_count': 1, 'verified_count': 0, 'assigned_students_count': 1,
+        })
+
+        pending = self.get('api_department_dashboard', self.incharge, section='pending').json()
+        self.assertEqual(set(pending), {'department', 'pending_work_logs', 'pending_page'})
+        self.assertEqual(pending['pending_work_logs'][0]['student_username'], 'student0')
+
+        summary = self.get('api_department_dashboard', self.incharge, section='summary').json()
+        self.assertEqual(summary['student_hours'], [])
+        self.assertEqual(summary['summary_page']['count'], 0)
+
+    def test_all_sections_without_a_section_parameter(self):
+        data = self.get('api_department_dashboard', self.incharge).json()
+        self.assertTrue({'pending_count', 'pending_work_logs', 'verified_work_logs', 'student_hours'} <= set(data))
+
+    def test_payment_report_sections(self):
+        data = self.get('api_payment_reports', self.coordinator, section='totals,summaries',
+                        year=2025, month=3).json()
+        self.assertEqual(set(data), {'totals', 'department_summaries'})
+        self.assertEqual(data['totals'], {'total_amount': 0, 'total_hours': 0, 'total_students': 0})
+        self.assertContains(self.client.get(reverse('payment_reports'), {'year': 2025, 'month': 3}),
+                            'api/payments/reports/')
+
+    def test_student_stats_section(self):
+        create_application(self.students[0], '124M1H001', status='Approved')
+        data = self.get('api_student_dashboard', self.students[0], section='stats').json()
+        self.assertEqual(set(data), {'stats'})
+        self.assertEqual(data['stats']['month_submitted'], 0)
+
+
+def document(content, name='document.pdf'):
+    return ContentFile(content, name=name)
+
+
+class DocumentBlobTests(MediaRootTestCase):
+    """Identical documents are stored once and counted per referencing field"""
+
+    def setUp(self):
+        super().setUp()
+        self.students = [User.objects.create_user(username=f'student{n}', password='x', role='student')
+                         for n in range(2)]
+        self.certificate = b'%PDF-1.4 same certificate'
+
+    def blob(self, name):
+        return DocumentBlob.objects.get(name=name)
+
+    def test_same_content_is_stored_once_and_counted_per_field(self):
+        first = create_application(self.students[0], '124M1H001', aadhar_card=document(self.certificate),
+                                   bank_passbook=document(self.certificate))
+        second = create_application(self.students[1], '124M1H002', aadhar_card=document(self.certificate))
+
+        self.assertEqual(first.aadhar_card.name, first.bank_passbook.name)
+        self.assertEqual(first.aadhar_card.name, second.aadhar_card.name)
+        self.assertEqual(DocumentBlob.objects.count(), 1)
+        self.assertEqual(self.blob(first.aadhar_card.name).ref_count, 3)
+        blob_dir = os.path.dirname(get_document_storage().path(first.aadhar_card.name))
+        self.assertEqual(os.listdir(blob_dir), [os.path.basename(first.aadhar_card.name)])
+
+    def test_replacing_and_deleting_release_references(self):
+        first = create_application(self.students[0], '124M1H001', aadhar_card=document(self.certificate))
+        second = create_application(self.students[1], '124M1H002', aadhar_card=document(self.certificate))
+        shared = first.aadhar_card.name
+
+        first.aadhar_card = document(b'%PDF-1.4 new certificate')
+        first.save()
+        self.assertEqual(self.blob(shared).ref_count, 1)
+        self.assertEqual(self.blob(first.aadhar_card.name).ref_count, 1)
+
+        second.delete()
+        self.assertEqual(self.blob(shared).ref_count, 0)
+        self.assertEqual(DocumentBlob.recount(), 0)
+
+    def test_collect_removes_only_unreferenced_blobs(self):
+        kept = create_application(self.students[0], '124M1H001', aadhar_card=document(self.certificate))
+        dropped = create_application(self.students[1], '124M1H002', aadhar_card=document(b'%PDF-1.4 other'))
+        dropped_name = dropped.aadhar_card.name
+        dropped.delete()
+
+        collected = DocumentBlob.collect(before=timezone.now() + datetime.timedelta(seconds=1))
+
+        self.assertEqual([name for name, _ in collected], [dropped_name])
+        storage = get_document_storage()
+        self.assertFalse(storage.exists(dropped_name))
+        self.assertTrue(storage.exists(kept.aadhar_card.name))
+        self.assertEqual(list(DocumentBlob.objects.values_list('name', flat=True)), [kept.aadhar_card.name])
+
+    def test_collect_keeps_recently_stored_blobs(self):
+        application = create_application(self.students[0], '124M1H001', aadhar_card=document(self.certificate))
+        name = application.aadhar_card.name
+        application.delete()
+
+        self.assertEqual(DocumentBlob.collect(before=timezone.now() - datetime.timedelta(hours=1)), [])
+        self.assertTrue(get_document_storage().exists(name))
+
+
+class DocumentServingTests(MediaRootTestCase):
+    """application_document checks the viewer and answers Range and conditional requests"""
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user(username='student1', password='x', role='student')
+        self.content = b'%PDF-1.4 ' + bytes(range(256)) * 4
+        self.application = create_application(self.student, '124M1H001', aadhar_card=document(self.content))
+        # A fractional mtime, as most file systems record
+        os.utime(get_document_storage().path(self.application.aadhar_card.name), (1700000000.5, 1700000000.5))
+        self.url = reverse('application_document', args=[self.application.id, 'aadhar_card'])
+        self.client.force_login(self.student)
+
+    def get(self, **headers):
+        return self.client.get(self.url, headers=headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_document(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=3600')
+
+    def test_byte_ranges(self):
+        size = len(self.content)
+        for header, start, end in [('bytes=0-99', 0, 99), ('bytes=-10', size - 10, size - 1),
+                                   ('bytes=1000-', 1000, size - 1), ('bytes=1000-99999', 1000, size - 1)]:
+            with self.subTest(range=header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(self.body(response), self.content[start:end + 1])
+
+    def test_range_outside_the_document(self):
+        response = self.get(Range=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_for_a_changed_document_sends_it_whole(self):
+        etag = self.get()['ETag']
+
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': etag}).status_code, 206)
+        response = self.get(Range='bytes=0-9', **{'If-Range': '"0-0"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_conditional_requests(self):
+        first = self.get()
+
+        self.assertEqual(self.get(**{'If-None-Match': first['ETag']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-Modified-Since': first['Last-Modified']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'}).status_code, 200)
+
+    def test_other_students_are_refused(self):
+        other = User.objects.create_user(username='student2', password='x', role='student')
+        self.client.force_login(other)
+
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('application_document', args=[self.application.id, 'first_name']))
+
+        self.assertEqual(response.status_code, 404)
+
+
+PDF = b'%PDF-1.7\n' + b'x' * 5000 + b'\ntrailer\n<<>>\nstartxref\n123\n%%EOF\n'
+
+
+class DocumentPreviewTests(MediaRootTestCase):
+    """Saved documents queue one preview each, which workers claim, render and the review page shows"""
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user(username='student1', role='student')
+        self.coordinator = User.objects.create_user(username='coordinator1', role='el_coordinator')
+
+    def apply(self, **documents):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_application(self.student, '124M1H001', **documents)
+
+    def render(self, data=b'rendered jpeg', **options):
+        """Process every queued preview with the renderer returning data"""
+        with mock.patch('scheme.previews.render_preview', return_value=data, **options):
+            while (preview := DocumentPreview.claim_next('worker-1')) is not None:
+                process_preview(preview)
+
+    def test_saving_an_application_queues_each_document_once(self):
+        application = self.apply(aadhar_card=document(b'%PDF-1.4 card'), bank_passbook=document(b'%PDF-1.4 card'),
+                                 photo=document(b'photo', name='photo.png'))
+
+        self.assertEqual(sorted(DocumentPreview.objects.values_list('source_name', flat=True)),
+                         sorted({application.aadhar_card.name, application.photo.name}))
+        with self.captureOnCommitCallbacks(execute=True):
+            application.save()
+        self.assertEqual(DocumentPreview.objects.filter(status='Pending').count(), 2)
+
+    def test_claim_takes_the_oldest_pending_and_stale_renders(self):
+        DocumentPreview.request(['first.pdf'])
+        DocumentPreview.request(['second.pdf'])
+
+        self.assertEqual(DocumentPreview.claim_next('worker-1').source_name, 'first.pdf')
+        claimed = DocumentPreview.claim_next('worker-2')
+        self.assertEqual((claimed.source_name, claimed.status, claimed.claimed_by), ('second.pdf', 'Rendering', 'worker-2'))
+        self.assertIsNone(DocumentPreview.claim_next('worker-3'))
+
+        # A worker that stopped mid-render hands its preview over once it goes stale
+        DocumentPreview.objects.filter(source_name='first.pdf').update(
+            updated_at=timezone.now() - datetime.timedelta(minutes=11))
+        self.assertEqual(DocumentPreview.claim_next('worker-3').claimed_by, 'worker-3')
+
+    def test_processing_stores_the_rendered_image(self):
+        application = self.apply(aadhar_card=document(PDF))
+        self.render()
+
+        preview = DocumentPreview.objects.get()
+        self.assertEqual((preview.status, preview.claimed_by, preview.error), ('Ready', '', ''))
+        with default_storage.open(preview.preview_name) as file:
+            self.assertEqual(file.read(), b'rendered jpeg')
+        self.assertEqual(preview.preview_name, preview_name_for(application.aadhar_card.name))
+
+    def test_processing_records_missing_renderers_and_failures(self):
+        DocumentPreview.request(['scheme_documents/blobs/aa/missing.pdf'])
+        self.render(data=None)
+        self.assertEqual(DocumentPreview.objects.get().status, 'Unsupported')
+
+        DocumentPreview.objects.update(status='Pending')
+        with self.assertLogs('scheme.previews', 'ERROR'):
+            self.render(side_effect=OSError('pdftoppm crashed'))
+        preview = DocumentPreview.objects.get()
+        self.assertEqual((preview.status, preview.error), ('Failed', 'pdftoppm crashed'))
+
+    def test_worker_command_processes_the_queue(self):
+        self.apply(aadhar_card=document(PDF))
+        output = StringIO()
+
+        with mock.patch('scheme.previews.render_preview', return_value=b'rendered jpeg'):
+            call_command('render_document_previews', '--once', stdout=output)
+
+        self.assertIn('1 previews processed', output.getvalue())
+        self.assertEqual(DocumentPreview.objects.get().status, 'Ready')
+
+    def test_gallery_shows_ready_previews_to_reviewers(self):
+        application = self.apply(aadhar_card=document(b'%PDF-1.4 card'), bank_passbook=document(b'%PDF-1.4 card'),
+                                 income_certificate=document(PDF))
+        self.render()
+        DocumentPreview.objects.filter(source_name=application.income_certificate.name).update(status='Failed')
+
+        gallery = document_gallery(application)
+        self.assertEqual([item['field'] for item in gallery], ['aadhar_card', 'bank_passbook'])
+
+        self.client.force_login(self.coordinator)
+        self.assertContains(self.client.get(reverse('view_application', args=[application.id])),
+                            gallery[0]['preview_url'])
+        response = self.client.get(gallery[1]['preview_url'])
+        self.assertEqual(b''.join(response.streaming_content), b'rendered jpeg')
+        self.assertEqual(self.client.get(reverse('application_document_preview', args=[
+            application.id, 'income_certificate'])).status_code, 404)
+
+        self.client.force_login(User.objects.create_user(username='student2', role='student'))
+        self.assertEqual(self.client.get(gallery[0]['preview_url']).status_code, 403)
+
+
+def png(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', width, height) + b'\x08\x02\x00\x00\x00'
+
+
+def jpeg(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    frame = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\x01\x11\x00'
+    return b'\xff\xd8' + app0 + frame + b'\xff\xda\x00\x08' + b'\x00' * 50 + b'\xff\xd9'
+
+
+class SlowFile(ContentFile):
+    """A file whose every read takes a while, like one on a busy disk"""
+    def __init__(self, content, name, delay):
+        super().__init__(content, name=name)
+        self.delay = delay
+
+    def read(self, *args):
+        time.sleep(self.delay)
+        return super().read(*args)
+
+
+class DocumentContentTests(TestCase):
+    """Documents are checked by content, concurrently and within a time budget"""
+
+    def check(self, content, name, kind):
+        return check_document(ContentFile(content, name=name), kind)
+
+    def test_genuine_documents_pass(self):
+        for content, name, kind in [
+            (PDF, 'form.pdf', 'pdf'),
+            (b'junk' + PDF, 'form.pdf', 'pdf'),
+            (png(400, 300), 'photo.png', 'image'),
+            (jpeg(640, 480), 'photo.jpg', 'image'),
+            (b'GIF89a' + struct.pack('<HH', 32, 16) + b'\x00' * 16, 'photo.gif', 'image'),
+            (b'BM' + b'\x00' * 16 + struct.pack('<ii', 30, -20) + b'\x00' * 10, 'photo.bmp', 'image'),
+        ]:
+            with self.subTest(name=name):
+                self.assertIsNone(self.check(content, name, kind))
+
+    def test_renamed_and_damaged_documents_fail(self):
+        for content, name, kind, message in [
+            (png(40, 40), 'form.pdf', 'pdf', 'not a PDF'),
+            (b'%PDF-1.4 cut off here', 'form.pdf', 'pdf', 'incomplete'),
+            (PDF, 'photo.jpg', 'image', 'not a JPG'),
+            (b'\xff\xd8\xff\xe0\x00', 'photo.jpg', 'image', 'damaged'),
+            (png(0, 40), 'photo.png', 'image', '0x40'),
+            (png(50000, 40), 'photo.png', 'image', '50000x40'),
+        ]:
+            with self.subTest(name=name, message=message):
+                self.assertIn(message, self.check(content, name, kind))
+
+    def test_wrong_extension_is_left_to_the_field_validators(self):
+        self.assertIsNone(self.check(b'plain text', 'notes.txt', 'pdf'))
+
+    def test_file_is_left_at_its_start(self):
+        file = ContentFile(PDF, name='form.pdf')
+        check_document(file, 'pdf')
+
+        self.assertEqual(file.tell(), 0)
+
+    def test_documents_are_checked_concurrently(self):
+        files = {field: SlowFile(PDF, 'document.pdf', 0.1) for field in SchemeApplication.DOCUMENT_FIELDS}
+        files['photo'] = SlowFile(png(40, 40), 'photo.png', 0.1)
+
+        started = time.monotonic()
+        self.assertEqual(validate_documents(files), {})
+        # Two reads per PDF: ten files one after another would take two seconds
+        self.assertLess(time.monotonic() - started, 1)
+
+    @override_settings(DOCUMENT_VALIDATION_TIMEOUT=0.3)
+    def test_slow_document_runs_out_of_time(self):
+        files = {field: ContentFile(PDF, name='document.pdf') for field in ('application_form', 'aadhar_card')}
+        files['bank_passbook'] = SlowFile(PDF, 'document.pdf', 0.5)
+
+        errors = validate_documents(files)
+
+        self.assertEqual(list(errors), ['bank_passbook'])
+        self.assertIn('longer than 0.3 seconds', errors['bank_passbook'])
+        # The timed-out check was stopped and waited for, not left reading the file
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith('document-check')])
+
+
+class DocumentUploadViewTests(MediaRootTestCase):
+    """The chunked upload endpoints store chunks in order, refuse overruns and resume, delete and purge uploads"""
+
+    def setUp(self):
+        super().setUp()
+        upload_dir = override_settings(DOCUMENT_UPLOAD_TEMP_DIR=os.path.join(settings.MEDIA_ROOT, 'upload_parts'))
+        upload_dir.enable()
+        self.addCleanup(upload_dir.disable)
+        self.student = User.objects.create_user(username='student1', role='student')
+        self.client.force_login(self.student)
+
+    def start(self, size=len(PDF), file_name='document.pdf'):
+        return self.client.post(reverse('start_document_upload'),
+                                json.dumps({'field': 'aadhar_card', 'file_name': file_name, 'size': size}),
+                                content_type='application/json')
+
+    def send(self, upload_id, offset, chunk):
+        return self.client.post(reverse('document_upload', args=[upload_id]), chunk,
+                                content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_are_stored_in_order(self):
+        upload_id = self.start().json()['id']
+
+        self.assertEqual(self.send(upload_id, 0, PDF[:10]).json()['offset'], 10)
+        response = self.send(upload_id, 10, PDF[10:])
+
+        self.assertTrue(response.json()['complete'])
+        with DocumentUpload.objects.get(pk=upload_id).open() as file:
+            self.assertEqual(file.read(), PDF)
+
+    def test_out_of_order_chunk_is_refused_with_the_offset_to_continue_from(self):
+        upload_id = self.start().json()['id']
+        self.send(upload_id, 0, PDF[:10])
+
+        for offset in (0, 20):
+            with self.subTest(offset=offset):
+                response = self.send(upload_id, offset, PDF[offset:offset + 10])
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.json()['offset'], 10)
+
+    def test_chunk_past_the_declared_size_is_refused(self):
+        upload_id = self.start(size=10).json()['id']
+
+        response = self.send(upload_id, 0, PDF[:11])
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertFalse(os.path.exists(DocumentUpload.objects.get(pk=upload_id).temp_path))
+
+    def test_oversize_file_is_refused_before_any_data(self):
+        response = self.start(size=MAX_DOCUMENT_SIZE + 1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DocumentUpload.objects.exists())
+
+    def test_restarting_the_same_file_resumes_the_upload(self):
+        upload_id = self.start().json()['id']
+        self.send(upload_id, 0, PDF[:10])
+
+        response = self.start()
+
+        self.assertEqual(response.json()['id'], upload_id)
+        self.assertEqual(response.json()['offset'], 10)
+        self.assertEqual(self.client.get(reverse('document_upload', args=[upload_id])).json()['offset'], 10)
+
+    def test_delete_removes_the_upload_and_its_file(self):
+        upload_id = self.start().json()['id']
+        self.send(upload_id, 0, PDF[:10])
+        temp_path = DocumentUpload.objects.get(pk=upload_id).temp_path
+
+        response = self.client.delete(reverse('document_upload', args=[upload_id]))
+
+        self.assertEqual(response.json(), {'deleted': True})
+        self.assertFalse(DocumentUpload.objects.exists())
+        self.assertFalse(os.path.exists(temp_path))
+
+    def test_other_students_cannot_touch_an_upload(self):
+        upload_id = self.start().json()['id']
+        self.client.force_login(User.objects.create_user(username='student2', role='student'))
+
+        self.assertEqual(self.send(upload_id, 0, PDF[:10]).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('document_upload', args=[upload_id])).status_code, 404)
+
+    def test_purge_deletes_only_stale_uploads(self):
+        stale_id = self.start().json()['id']
+        self.send(stale_id, 0, PDF[:10])
+        stale_path = DocumentUpload.objects.get(pk=stale_id).temp_path
+        DocumentUpload.objects.filter(pk=stale_id).update(updated_at=timezone.now() - datetime.timedelta(days=2))
+        fresh_id = self.start(file_name='other.pdf').json()['id']
+
+        call_command('purge_document_uploads', stdout=StringIO())
+
+        self.assertEqual(list(DocumentUpload.objects.values_list('pk', flat=True)), [uuid.UUID(fresh_id)])
+        self.assertFalse(os.path.exists(stale_path))
+
+    def test_pages_send_the_csrf_token_with_every_write(self):
+        create_application(self.student, '124M1H001', status='Correction Required')
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.student)
+        for name in ('update_scheme_application', 'scheme_registration'):
+            with self.subTest(page=name):
+                if name == 'scheme_registration':
+                    SchemeApplication.objects.filter(student=self.student).delete()
+                html = client.get(reverse(name)).content.decode()
+                script = html[html.index('const startUrl'):]
+                # Every POST and DELETE fetch carries the token header
+                for method in re.findall(r"method: '(POST|DELETE)',\s*headers: \{([^}]*)\}", script):
+                    self.assertIn("'X-CSRFToken': csrfToken", method[1])
+                self.assertEqual(len(re.findall(r"method: '(?:POST|DELETE)'", script)), 3)
+
+                token = re.search(r"const csrfToken = '([^']+)';", script).group(1)
+                data = json.dumps({'field': 'aadhar_card', 'file_name': 'document.pdf', 'size': len(PDF)})
+                self.assertEqual(client.post(reverse('start_document_upload'), data,
+                                             content_type='application/json').status_code, 403)
+                self.assertEqual(client.post(reverse('start_document_upload'), data, content_type='application/json',
+                                             HTTP_X_CSRFTOKEN=token).status_code, 201)
+
+
+@override_settings(DOCUMENT_VALIDATION_TIMEOUT=5)
+class ApplicationFormDocumentTests(MediaRootTestCase):
+    """SchemeApplicationForm checks document content and closes the chunked upload files it opens"""
+
+    def setUp(self):
+        super().setUp()
+        upload_dir = override_settings(DOCUMENT_UPLOAD_TEMP_DIR=os.path.join(settings.MEDIA_ROOT, 'upload_parts'))
+        upload_dir.enable()
+        self.addCleanup(upload_dir.disable)
+        self.student = User.objects.create_user(username='student1', password='x', role='student')
+        self.data = {
+            'first_name': 'Asha', 'last_name': 'Patil', 'address': 'Nigdi', 'state': 'Maharashtra',
+            'dob': '2004-01-01', 'annual_income': '50000', 'fathers_occupation': 'Farmer',
+            'caste_category': 'General', 'college_name': 'PCCOE', 'department': 'CSE', 'prn_number': '124M1H001',
+        }
+        self.files = {field: SimpleUploadedFile('document.pdf', PDF) for field in SchemeApplication.DOCUMENT_FIELDS}
+        self.files['photo'] = SimpleUploadedFile('photo.png', png(40, 40))
+
+    def upload(self, field, content, file_name='document.pdf'):
+        upload = DocumentUpload.start(self.student, field, file_name, len(content))
+        upload.append(0, ContentFile(content), len(content))
+        del self.files[field]
+        self.data[f'{field}_upload'] = str(upload.id)
+
+    def form(self):
+        opened = []
+        open_upload = DocumentUpload.open
+
+        def record_open(upload):
+            opened.append(open_upload(upload))
+            return opened[-1]
+
+        with mock.patch.object(DocumentUpload, 'open', autospec=True, side_effect=record_open):
+            form = SchemeApplicationForm(self.data, self.files, student=self.student)
+            form.is_valid()
+        return form, opened
+
+    def test_genuine_documents_are_accepted(self):
+        self.upload('aadhar_card', PDF)
+        form, opened = self.form()
+
+        self.assertEqual(form.errors, {})
+        self.assertFalse(opened[0].closed)
+        form.discard_document_uploads()
+        self.assertTrue(opened[0].closed)
+
+    def test_renamed_files_are_refused(self):
+        self.files['income_certificate'] = SimpleUploadedFile('document.pdf', png(40, 40))
+        self.files['photo'] = SimpleUploadedFile('photo.png', PDF)
+        form, _ = self.form()
+
+        self.assertEqual(sorted(form.errors), ['income_certificate', 'photo'])
+
+    def test_upload_files_are_closed_when_the_form_is_invalid(self):
+        self.upload('aadhar_card', PDF)
+        self.upload('bank_passbook', b'%PDF-1.4 cut off here')
+        form, opened = self.form()
+
+        self.assertEqual(list(form.errors), ['bank_passbook'])
+        self.assertEqual(len(opened), 2)
+        self.assertTrue(all(file.closed for file in opened))
+
+
+class PaymentEngineTests(TestCase):
+    """calculate_payments_for_month matches the per-student calculation it replaced"""
+
+    def setUp(self):
+        PaymentRate.objects.create(rate_per_hour=Decimal('62.50'))
+        self.departments = [Department.objects.create(name=f'Department {code}', code=code) for code in ('CSE', 'IT')]
+        self.students = []
+        for n in range(6):
+            student = User.objects.create_user(username=f'student{n}', password='x', role='student', is_registered=True)
+            StudentDepartmentAssignment.objects.create(student=student, department=self.departments[n % 2])
+            self.students.append(student)
+        # Verified, pending and rejected logs in March, and verified logs in other months
+        for n, student in enumerate(self.students[:5]):
+            for day in range(3, 3 + n + 1):
+                WorkLog.objects.create(student=student, date=datetime.date(2025, 3, day), hours_worked=1 + day % 3,
+                                       description='Lab work', is_verified=True)
+            WorkLog.objects.create(student=student, date=datetime.date(2025, 3, 20), hours_worked=2,
+                                   description='Lab work')
+            WorkLog.objects.create(student=student, date=datetime.date(2025, 3, 21), hours_worked=3,
+                                   description='Lab work', is_rejected=True)
+            WorkLog.objects.create(student=student, date=datetime.date(2025, 4, 1), hours_worked=3,
+                                   description='Lab work', is_verified=True)
+
+    def calculations(self):
+        return {
+            (calc.student_id, calc.department_id): (calc.total_hours, calc.rate_per_hour, calc.total_amount)
+            for calc in PaymentCalculation.objects.filter(calculation_month=datetime.date(2025, 3, 1))
+        }
+
+    def test_same_totals_as_the_per_student_calculation(self):
+        for student in self.students:
+            PaymentCalculation.calculate_for_student_month(student, 2025, 3)
+        expected = self.calculations()
+        PaymentCalculation.objects.all().delete()
+
+        result = payments.calculate_payments_for_month(self.departments, 2025, 3)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['calculated'], 5)
+        self.assertEqual(self.calculations(), expected)
+        # The student without verified hours gets no record
+        self.assertNotIn(self.students[5].id, {student_id for student_id, _ in expected})
+        summaries = {s.department_id: s for s in DepartmentPaymentSummary.objects.filter(calculation_month=datetime.date(2025, 3, 1))}
+        for department in self.departments:
+            rows = [amounts for (_, department_id), amounts in expected.items() if department_id == department.id]
+            self.assertEqual(summaries[department.id].total_students, len(rows))
+            self.assertEqual(summaries[department.id].total_amount, sum(amount for _, _, amount in rows))
+
+    def test_existing_records_are_kept_unless_recalculating(self):
+        payments.calculate_payments_for_month(self.departments, 2025, 3)
+        before = self.calculations()
+        PaymentRate.objects.create(rate_per_hour=Decimal('80.00'))
+
+        result = payments.calculate_payments_for_month(self.departments, 2025, 3)
+        self.assertEqual(result['calculated'], 0)
+        self.assertEqual(self.calculations(), before)
+
+        result = payments.calculate_payments_for_month(self.departments, 2025, 3, recalculate_existing=True)
+        self.assertEqual(result['calculated'], 5)
+        self.assertTrue(all(rate == Decimal('80.00') for _, rate, _ in self.calculations().values()))
+
+    def test_reassigned_student_is_paid_under_the_new_department(self):
+        payments.calculate_payments_for_month(self.departments, 2025, 3)
+        student = self.students[0]
+        assignment = StudentDepartmentAssignment.objects.get(student=student)
+        assignment.department = self.departments[1]
+        assignment.save()
+
+        payments.calculate_payments_for_month(self.departments, 2025, 3, recalculate_existing=True)
+
+        # One record per student, whichever departments the join passes through
+        self.assertEqual(PaymentCalculation.objects.filter(student=student).count(), 1)
+        self.assertEqual(PaymentCalculation.objects.get(student=student).department, self.departments[1])
+
+    def test_failing_department_does_not_discard_the_others(self):
+        bulk_create = PaymentCalculation.objects.bulk_create
+
+        def fail_for_cse(records, *args, **kwargs):
+            if records and records[0].department_id == self.departments[0].id:
+                raise ValueError('disk full')
+            return bulk_create(records, *args, **kwargs)
+
+        with mock.patch.object(PaymentCalculation.objects, 'bulk_create', side_effect=fail_for_cse):
+            result = payments.calculate_payments_for_month(self.departments, 2025, 3)
+
+        self.assertEqual(result['errors'], ['Error processing department Department CSE: disk full'])
+        self.assertEqual(set(result['department_counts']), {self.departments[1].id})
+        self.assertEqual({department_id for _, department_id in self.calculations()}, {self.departments[1].id})
+        self.assertFalse(DepartmentPaymentSummary.objects.filter(department=self.departments[0]).exists())
+
+    def test_query_count_does_not_grow_with_the_cohort(self):
+        def count_queries():
+            PaymentCalculation.objects.all().delete()
+            DepartmentPaymentSummary.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                payments.calculate_payments_for_month(self.departments, 2025, 3)
+            return len(queries)
+
+        small = count_queries()
+        for n in range(6, 26):
+            student = User.objects.create_user(username=f'student{n}', password='x', role='student', is_registered=True)
+            StudentDepartmentAssignment.objects.create(student=student, department=self.departments[n % 2])
+            WorkLog.objects.create(student=student, date=datetime.date(2025, 3, 3), hours_worked=2,
+                                   description='Lab work', is_verified=True)
+
+        self.assertEqual(count_queries(), small)
+        self.assertEqual(PaymentCalculation.objects.count(), 25)
+
+
+class PaymentRunTests(TestCase):
+    """process_payment_run keeps its claim alive and never commits a run it has lost"""
+
+    def setUp(self):
+        PaymentRate.objects.create(rate_per_hour=Decimal('62.50'))
+        self.department = Department.objects.create(name='Department CSE', code='CSE')
+        student = User.objects.create_user(username='student', password='x', role='student', is_registered=True)
+        StudentDepartmentAssignment.objects.create(student=student, department=self.department)
+        WorkLog.objects.create(student=student, date=datetime.date(2025, 3, 3), hours_worked=2,
+                               description='Lab work', is_verified=True)
+        self.run = PaymentRun.objects.create(calculation_month=datetime.date(2025, 3, 1), department=self.department,
+                                             status='Running', claimed_by='worker-1', heartbeat_at=timezone.now())
+
+    @override_settings(PAYMENT_RUN_HEARTBEAT_INTERVAL=0.01)
+    def test_heartbeat_is_written_while_a_department_is_calculated(self):
+        calculate = payments.calculate_payments_for_month
+
+        def slow_calculation(*args, **kwargs):
+            time.sleep(0.2)
+            return calculate(*args, **kwargs)
+
+        # The heartbeat thread has its own connection, so its writes are stubbed out here
+        with mock.patch.object(payments, 'calculate_payments_for_month', side_effect=slow_calculation), \
+                mock.patch.object(PaymentRun, 'touch', autospec=True, return_value=True) as touch:
+            run = payments.process_payment_run(self.run)
+
+        self.assertGreater(touch.call_count, 1)
+        self.assertEqual(run.status, 'Completed')
+        self.assertEqual(run.calculated_count, 1)
+
+    def test_touch_only_updates_a_run_still_held(self):
+        self.assertTrue(self.run.touch())
+        PaymentRun.objects.filter(pk=self.run.pk).update(claimed_by='worker-2')
+        self.assertFalse(self.run.touch())
+
+    def test_department_is_rolled_back_when_the_run_was_taken_over(self):
+        calculate = payments.calculate_payments_for_month
+
+        def taken_over(*args, **kwargs):
+            result = calculate(*args, **kwargs)
+            PaymentRun.objects.filter(pk=self.run.pk).update(claimed_by='worker-2')
+            return result
+
+        with mock.patch.object(payments, 'calculate_payments_for_month', side_effect=taken_over):
+            payments.process_payment_run(self.run)
+
+        self.assertFalse(PaymentCalculation.objects.exists())
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.completed_departments, [])
+        self.assertEqual(self.run.status, 'Running')
+
+
+class PaymentReportExportTests(MediaRootTestCase):
+    """export_payment_report writes workbooks in write-only mode from one joined query"""
+
+    def setUp(self):
+        super().setUp()
+        PaymentRate.objects.create(rate_per_hour=Decimal('50.00'))
+        self.coordinator = User.objects.create_user(username='coordinator', password='x', role='el_coordinator')
+        self.departments = [Department.objects.create(name=f'Department {code}', code=code) for code in ('CSE', 'IT')]
+        for n in range(4):
+            self.add_student(n)
+        payments.calculate_payments_for_month(self.departments, 2025, 3)
+        self.client.force_login(self.coordinator)
+
+    def add_student(self, n):
+        student = User.objects.create_user(username=f'student{n}', password='x', role='student', is_registered=True)
+        create_application(student, f'PRN{n:03d}')
+        StudentDepartmentAssignment.objects.create(student=student, department=self.departments[n % 2])
+        WorkLog.objects.create(student=student, date=datetime.date(2025, 3, 3), hours_worked=n + 1,
+                               description='Lab work', is_verified=True)
+        return student
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_payment_report'), {'year': 2025, 'month': 3, **params})
+        self.addCleanup(response.close)
+        return response
+
+    def workbook_rows(self, response):
+        from openpyxl import load_workbook
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+
+    def test_department_workbook(self):
+        response = self.export(type='department')
+
+        self.assertEqual(response['Content-Type'], exports.XLSX_CONTENT_TYPE)
+        rows = self.workbook_rows(response)
+        self.assertEqual(rows[0], ['Student Name', 'PRN', 'Department', 'Total Hours', 'Rate/Hour', 'Total Amount'])
+        body = rows[1:5]
+        self.assertEqual(sorted(row[1] for row in body), ['PRN000', 'PRN001', 'PRN002', 'PRN003'])
+        self.assertEqual({row[0] for row in body}, {'Asha Patil'})
+        self.assertEqual(rows[-1][-2:], ['Grand Total:', 500.0])
+
+    def test_row_queries_do_not_grow_with_the_report(self):
+        def count_queries():
+            report = exports.department_report(self.departments, 2025, 3, 'All Departments')
+            with CaptureQueriesContext(connection) as queries:
+                rows = list(report['rows'])
+            return len(queries), len(rows)
+
+        small, small_rows = count_queries()
+        for n in range(4, 24):
+            self.add_student(n)
+        payments.calculate_payments_for_month(self.departments, 2025, 3)
+
+        self.assertEqual(count_queries(), (small, 24))
+        self.assertEqual(small_rows, 4)
+
+    def test_stored_workbook_is_replaced_when_the_data_changes(self):
+        self.export(type='summary')
+        first = PaymentExport.objects.get()
+        self.export(type='summary')
+        self.assertEqual(PaymentExport.objects.filter(file_path=first.file_path).count(), 2)
+
+        PaymentRate.objects.create(rate_per_hour=Decimal('80.00'))
+        payments.calculate_payments_for_month(self.departments, 2025, 3, recalculate_existing=True)
+        rows = self.workbook_rows(self.export(type='summary'))
+
+        latest = PaymentExport.objects.order_by('-created_at', '-pk').first()
+        self.assertNotEqual(latest.data_version, first.data_version)
+        self.assertNotEqual(latest.file_path, first.file_path)
+        self.assertFalse(default_storage.exists(first.file_path))
+        self.assertEqual(rows[-1][3], 800.0)
+
+    def test_student_report_requires_a_student(self):
+        response = self.export(type='student')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentExport.objects.exists())
+
+    def test_student_report(self):
+        student = User.objects.get(username='student2')
+        rows = self.workbook_rows(self.export(type='student', student=student.pk))
+
+        self.assertEqual(rows[1][:2], ['2025-03-03', 3])
+        self.assertEqual(rows[-1][-1], 150.0)
+        self.assertEqual(PaymentExport.objects.get().student, student)
+
+    def test_workbook_evicted_after_the_lookup_is_regenerated(self):
+        self.export(type='summary')
+        first = PaymentExport.objects.get()
+        storage_open = default_storage.open
+        evicted = []
+
+        def evict_then_open(name, mode='rb'):
+            # Another request trims the store between the lookup and the open
+            if not evicted:
+                evicted.append(name)
+                exports._evict_artifact(name)
+            return storage_open(name, mode)
+
+        with mock.patch.object(exports.default_storage, 'open', side_effect=evict_then_open):
+            response = self.export(type='summary')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(evicted, [first.file_path])
+        self.assertEqual(self.workbook_rows(response)[-1][3], 500.0)
+        self.assertTrue(default_storage.exists(PaymentExport.objects.order_by('-pk').first().file_path))
+
+    def test_payment_data_streams_as_csv(self):
+        response = self.export(type='department', format='csv')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), exports.PAYMENT_CALCULATION_FIELDS)
+        self.assertEqual(len(lines), 5)
+
+    def test_summaries_of_the_whole_year_stream_as_json_lines(self):
+        response = self.export(type='summary', format='jsonl', month='all')
+
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(record['department'] for record in records), ['Department CSE', 'Department IT'])
+        self.assertEqual(sum(Decimal(record['total_amount']) for record in records), Decimal('500.00'))
+
+    def test_incharges_only_receive_their_own_department(self):
+        incharge = User.objects.create_user(username='incharge', password='x', role='department_encharge')
+        DepartmentIncharge.objects.create(user=incharge, department=self.departments[1])
+        self.client.force_login(incharge)
+
+        response = self.export(type='department', format='jsonl')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({record['department'] for record in records}, {'Department IT'})
+        self.assertEqual(len(records), 2)
+
+        response = self.client.get(reverse('export_work_logs'), {'year': 2025, 'month': 'all', 'format': 'jsonl',
+                                                                 'department': self.departments[0].pk})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(record['prn'] for record in records), ['PRN001', 'PRN003'])
+
+    def test_work_logs_stream_as_csv(self):
+        response = self.client.get(reverse('export_work_logs'), {'year': 2025, 'month': 3})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('work_logs_all_departments_2025_03.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), exports.WORK_LOG_FIELDS)
+        self.assertEqual(len(lines), 5)
+
+
+class DepartmentBudgetMatrixTests(TestCase):
+    """department_budget_matrix builds the department x month grid with a fixed number of queries"""
+
+    def setUp(self):
+        PaymentRate.objects.create(rate_per_hour=Decimal('50.00'))
+        self.departments = [Department.objects.create(name=f'Department {code}', code=code) for code in ('CSE', 'IT')]
+        for n in range(4):
+            student = User.objects.create_user(username=f'student{n}', password='x', role='student', is_registered=True)
+            create_application(student, f'PRN{n:03d}', status='Approved' if n < 3 else 'Pending')
+            StudentDepartmentAssignment.objects.create(student=student, department=self.departments[n % 2])
+            for month, day in ((1, 6), (2, 3), (4, 1)):
+                WorkLog.objects.create(student=student, date=datetime.date(2025, month, day), hours_worked=n + 1,
+                                       description='Lab work', is_verified=True)
+        for month in (1, 2, 4):
+            payments.calculate_payments_for_month(self.departments, 2025, month)
+
+    def matrix(self, **kwargs):
+        return payments.department_budget_matrix(self.departments, datetime.date(2025, 1, 1),
+                                                 datetime.date(2025, 12, 31), **kwargs)
+
+    def test_totals_match_the_department_summaries(self):
+        for row in self.matrix():
+            summaries = DepartmentPaymentSummary.objects.filter(department=row['department'])
+            for summary in summaries:
+                self.assertEqual(row['monthly_totals'][summary.calculation_month.month - 1], summary.total_amount)
+            self.assertEqual(row['year_total'], sum(summary.total_amount for summary in summaries))
+            self.assertEqual(row['quarterly_totals'][0], row['monthly_totals'][0] + row['monthly_totals'][1])
+            self.assertEqual(row['quarterly_totals'][1], row['monthly_totals'][3])
+            self.assertTrue(all(isinstance(total, Decimal) for total in row['monthly_totals']))
+
+    def test_students_are_counted_once_per_department(self):
+        # student3's application is still pending, so only student1 is counted for IT
+        self.assertEqual([row['student_count'] for row in self.matrix()], [2, 1])
+        self.assertEqual([row['student_count'] for row in self.matrix(count_assigned=True)], [2, 1])
+        monthly = payments.department_budget_matrix(self.departments, datetime.date(2025, 3, 1), datetime.date(2025, 3, 1))
+        self.assertEqual([row['student_count'] for row in monthly], [0, 0])
+
+    def test_query_count_does_not_grow_with_the_departments(self):
+        with self.assertNumQueries(2):
+            self.matrix()
+        self.departments += [Department.objects.create(name=f'Department {n}', code=f'D{n}') for n in range(10)]
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.matrix()), 12)
+
+    def test_budget_page(self):
+        coordinator = User.objects.create_user(username='coordinator', password='x', role='el_coordinator')
+        self.client.force_login(coordinator)
+
+        response = self.client.get(reverse('department_payment_budget'), {'year': 2025})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_budget'], sum(
+            (summary.total_amount for summary in DepartmentPaymentSummary.objects.all()), Decimal('0.00')))
+
+        response = self.client.get(reverse('department_payment_budget'),
+                                   {'view_type': 'monthly', 'year': 2025, 'month': 2})
+        self.assertEqual(response.context['total_budget'], DepartmentPaymentSummary.objects.filter(
+            calculation_month=datetime.date(2025, 2, 1)).aggregate(total=Sum('total_amount'))['total'])
+
+
+class StudentStatsTests(TestCase):
+    """StudentStats returns the numbers the dashboard used to query one by one, in one query"""
+
+    def setUp(self):
+        self.student = User.objects.create_user(username='student1', password='x', role='student', is_registered=True)
+        self.today = datetime.date(2025, 3, 5)
+        for work_date, hours, fields in (
+            (datetime.date(2025, 2, 27), 3, {'is_verified': True}),
+            (datetime.date(2025, 3, 3), 2, {'is_verified': True}),
+            (datetime.date(2025, 3, 4), 3, {'is_rejected': True}),
+            (datetime.date(2025, 3, 5), 1, {}),
+            (datetime.date(2025, 4, 1), 2, {'is_verified': True}),
+        ):
+            WorkLog.objects.create(student=self.student, date=work_date, hours_worked=hours,
+                                   description='Lab work', **fields)
+
+    def stats(self, today=None):
+        from .stats import StudentStats
+        return StudentStats(self.student, today or self.today)
+
+    def test_matches_the_per_query_values(self):
+        with self.assertNumQueries(1):
+            stats = self.stats()
+
+        month = StudentMonthRollup.get_for(self.student.pk, self.today)
+        last_log = WorkLog.objects.filter(student=self.student).order_by('-date', '-time').first()
+        self.assertEqual(stats.total_verified, StudentMonthRollup.objects.filter(
+            student=self.student).aggregate(total=Sum('verified_hours'))['total'])
+        self.assertEqual(stats.month_verified, month.verified_hours)
+        self.assertEqual(stats.month_submitted, month.submitted_hours)
+        self.assertEqual(stats.logged_today, WorkLog.objects.filter(student=self.student, date=self.today).exists())
+        self.assertEqual(stats.last_updated, {'date': last_log.date, 'time': last_log.time})
+        self.assertEqual((stats.total_verified, stats.month_verified, stats.month_submitted), (7, 2, 3))
+
+    def test_student_without_logs(self):
+        self.student = User.objects.create_user(username='student2', password='x', role='student')
+        stats = self.stats()
+
+        self.assertEqual((stats.total_verified, stats.month_verified, stats.month_submitted), (0, 0, 0))
+        self.assertFalse(stats.logged_today)
+        self.assertIsNone(stats.last_updated)
+        self.assertEqual(stats.remaining_hours, stats.monthly_limit)
+
+    def test_form_validation_reuses_the_stats(self):
+        data = {'hours_worked': 2, 'description': 'Catalogued the library returns'}
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime.datetime(2025, 3, 5, 17))):
+            form = WorkLogForm(data, user=self.student, stats=self.stats())
+            with self.assertNumQueries(0):
+                self.assertFalse(form.is_valid())
+        self.assertIn('You can only submit one work log per day.', form.non_field_errors())
+
+    @override_settings(WORK_LOG_MONTHLY_HOUR_CAP=4)
+    def test_monthly_limit_is_checked_against_the_stats(self):
+        data = {'hours_worked': 2, 'description': 'Catalogued the library returns'}
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime.datetime(2025, 3, 6, 17))):
+            form = WorkLogForm(data, user=self.student, stats=self.stats(datetime.date(2025, 3, 6)))
+            with self.assertNumQueries(0):
+                self.assertFalse(form.is_valid())
+
+            data['hours_worked'] = 1
+            form = WorkLogForm(data, user=self.student, stats=self.stats(datetime.date(2025, 3, 6)))
+            with self.assertNumQueries(0):
+                self.assertTrue(form.is_valid())
+
+
+class KeysetCursorTests(TestCase):
+    """Tampered keyset cursors fall back to the first page instead of failing"""
+
+    def setUp(self):
+        self.coordinator = User.objects.create_user(username='coordinator', password='x', role='el_coordinator')
+        student = User.objects.create_user(username='student1', password='x', role='student', is_registered=True)
+        self.application = create_application(student, 'PRN001', status='Approved')
+        for day in range(3, 9):
+            WorkLog.objects.create(student=student, date=datetime.date(2025, 3, day), hours_worked=1,
+                                   description='Lab work')
+        self.fields = [WorkLog._meta.get_field(name) for name in ('date', 'time', 'id')]
+        self.client.force_login(self.coordinator)
+
+    def cursor(self, keys, backwards=False):
+        payload = json.dumps({'k': keys, 'b': backwards}).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def test_keys_are_parsed_to_their_field_types(self):
+        keys = [datetime.date(2025, 3, 5), datetime.time(17, 30), 4]
+        self.assertEqual(decode_cursor(encode_cursor(keys, backwards=True), self.fields), (keys, True))
+
+    def test_malformed_cursors_are_ignored(self):
+        for cursor in (
+            'not base64!',
+            self.cursor(['2025-03-05', '17:30:00']),
+            self.cursor(['2025-13-45', '17:30:00', 4]),
+            self.cursor(['2025-03-05', 'teatime', 4]),
+            self.cursor(['2025-03-05', '17:30:00', 'x']),
+            self.cursor(['2025-03-05', '17:30:00', None]),
+            self.cursor([{'a': 1}, '17:30:00', 4]),
+        ):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor, self.fields))
+
+    def test_worklog_page_with_a_tampered_cursor_shows_the_first_page(self):
+        url = reverse('student_worklog', args=[self.application.pk])
+        page = self.client.get(url, {'per_page': 5}).context['page_obj']
+        first_page = [log.pk for log in page]
+        second_page = self.client.get(url, {'per_page': 5, 'cursor': page.next_cursor}).context['page_obj']
+        self.assertEqual(len(second_page), 1)
+
+        response = self.client.get(url, {'per_page': 5, 'cursor': self.cursor(['2025-02-30', 'noon', 'x'])})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([log.pk for log in response.context['page_obj']], first_page)
+        self.assertEqual(len(first_page), 5)
+
+
+class WorkLogImportTests(TestCase):
+    """WorkLogImport checks rows a batch at a time and reports every row"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Computer Engineering', code='CSE')
+        self.students = []
+        for n in range(2):
+            student = User.objects.create_user(username=f'student{n}', password='x', role='student', is_registered=True)
+            create_application(student, f'PRN{n:03d}', status='Approved')
+            StudentDepartmentAssignment.objects.create(student=student, department=self.department)
+            self.students.append(student)
+
+    def row(self, prn='PRN000', day=3, hours=2, description='Library cataloguing'):
+        return {'prn': prn, 'date': f'2025-03-{day:02d}', 'hours': hours, 'description': description}
+
+    def run_import(self, records, **kwargs):
+        return WorkLogImport(department=self.department, **kwargs).run(enumerate(records, start=2))
+
+    def errors(self, work_log_import):
+        return [result['error'] for result in work_log_import.results]
+
+    def test_rows_are_imported(self):
+        work_log_import = self.run_import([self.row(day=3), self.row(day=4), self.row('PRN001', day=3)], verify=True)
+
+        self.assertEqual((work_log_import.accepted_count, work_log_import.rejected_count), (3, 0))
+        self.assertEqual(WorkLog.objects.filter(is_verified=True).count(), 3)
+        self.assertEqual(StudentMonthRollup.get_for(self.students[0].pk, datetime.date(2025, 3, 1)).verified_hours, 4)
+        self.assertTrue(DirtyPaymentMonth.objects.exists())
+
+    def test_rows_the_parser_rejects_are_reported(self):
+        lines = [
+            'not json\n',
+            json.dumps(self.row(day=9)) + '\n',                          # Sunday
+            json.dumps({**self.row(), 'date': '03/03/2025'}) + '\n',
+            json.dumps({**self.row(), 'date': '2099-03-03'}) + '\n',
+            json.dumps(self.row(hours=5)) + '\n',
+            json.dumps(self.row(hours='two')) + '\n',
+            json.dumps(self.row(description='short')) + '\n',
+            json.dumps(self.row(prn='')) + '\n',
+            json.dumps(self.row(prn='PRN999')) + '\n',
+            json.dumps(self.row()) + '\n',
+        ]
+        work_log_import = WorkLogImport(department=self.department).run(
+            parse_import_rows(BytesIO(''.join(lines).encode()), 'jsonl'))
+
+        self.assertEqual(self.errors(work_log_import), [
+            'Could not parse this row',
+            'Work logs cannot be added on Sundays',
+            'Date must be in YYYY-MM-DD format',
+            'Date is in the future',
+            'Hours worked must be between 1 and 3 hours per day',
+            'Hours must be a whole number',
+            'Description must be at least 10 characters',
+            'PRN is required',
+            'No approved scheme application with this PRN in your department',
+            '',
+        ])
+        self.assertEqual([result['row'] for result in work_log_import.results], list(range(1, 11)))
+        self.assertEqual(WorkLog.objects.count(), 1)
+
+        report = StringIO()
+        write_import_report(work_log_import.results, report)
+        self.assertEqual(len(report.getvalue().splitlines()), 11)
+
+    def test_duplicate_days_within_one_file(self):
+        WorkLog.objects.create(student=self.students[1], date=datetime.date(2025, 3, 4), hours_worked=1,
+                               description='Lab work')
+
+        work_log_import = self.run_import([self.row(day=3), self.row(day=3, hours=1), self.row('PRN001', day=4)],
+                                          batch_size=1)
+
+        self.assertEqual(self.errors(work_log_import), ['', DUPLICATE_DAY_ERROR, DUPLICATE_DAY_ERROR])
+        self.assertEqual(WorkLog.objects.get(student=self.students[0]).hours_worked, 2)
+
+    @override_settings(WORK_LOG_MONTHLY_HOUR_CAP=5)
+    def test_monthly_cap_across_batches(self):
+        WorkLog.objects.create(student=self.students[0], date=datetime.date(2025, 3, 3), hours_worked=1,
+                               description='Lab work')
+
+        work_log_import = self.run_import([self.row(day=4, hours=3), self.row(day=5, hours=2),
+                                           self.row(day=6, hours=1), self.row(day=7, hours=1, prn='PRN001')],
+                                          batch_size=2)
+
+        self.assertEqual(self.errors(work_log_import)[:3], ['', 'Exceeds the monthly limit of 5 hours (1 remaining)', ''])
+        self.assertEqual(StudentMonthRollup.get_for(self.students[0].pk, datetime.date(2025, 3, 1)).submitted_hours, 5)
+        self.assertEqual(work_log_import.accepted_count, 3)
+
+    def test_each_batch_locks_its_month_totals(self):
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=select_for_update) as lock:
+            self.run_import([self.row(day=3), self.row('PRN001', day=3), self.row(day=4, prn='PRN001')], batch_size=2)
+
+        locked = [call.args[0] for call in lock.call_args_list if call.args[0].model is StudentMonthRollup]
+        # One lock while checking each batch, and one more while refreshing its rollups
+        self.assertEqual(len(locked), 4)
+        self.assertEqual(StudentMonthRollup.objects.count(), 2)
+
+    def test_dry_run_leaves_no_rows(self):
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True) as lock:
+            work_log_import = self.run_import([self.row(day=3), self.row('PRN001', day=4)], dry_run=True)
+
+        self.assertEqual(work_log_import.accepted_count, 2)
+        self.assertFalse(WorkLog.objects.exists())
+        self.assertFalse(StudentMonthRollup.objects.exists())
+        lock.assert_not_called()
+
+    def test_day_logged_by_a_concurrent_submission(self):
+        lock_month_totals = WorkLogImport._lock_month_totals
+
+        def student_submits_meanwhile(work_log_import, parsed):
+            result = lock_month_totals(work_log_import, parsed)
+            # Saved after the batch was checked but before it is inserted
+            WorkLog.objects.create(student=self.students[0], date=datetime.date(2025, 3, 4), hours_worked=1,
+                                   description='Lab work')
+            return result
+
+        with mock.patch.object(WorkLogImport, '_lock_month_totals', autospec=True,
+                               side_effect=student_submits_meanwhile):
+            work_log_import = self.run_import([self.row(day=3), self.row(day=4), self.row('PRN001', day=4)])
+
+        self.assertEqual(self.errors(work_log_import), ['', DUPLICATE_DAY_ERROR, ''])
+        self.assertEqual(WorkLog.objects.count(), 3)
+        self.assertEqual(WorkLog.objects.get(student=self.students[0], date=datetime.date(2025, 3, 4)).hours_worked, 1)
+        rollup = StudentMonthRollup.get_for(self.students[0].pk, datetime.date(2025, 3, 1))
+        self.assertEqual((rollup.submitted_hours, rollup.log_count), (3, 2))
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from . import api
 from users.views import applicant_profile
 
 urlpatterns = [
@@ -13,8 +14,13 @@ urlpatterns = [
     path('department-dashboard/', department_dashboard, name='department_dashboard'),
     path('approve-work-log/<int:log_id>/', approve_work_log, name='approve_work_log'),
     path('reject-work-log/<int:log_id>/', reject_work_log, name='reject_work_log'),
+    path('work-logs/bulk-review/', bulk_review_work_logs, name='bulk_review_work_logs'),
+    path('work-logs/import/', upload_work_logs, name='upload_work_logs'),
     path("el-coordinator-dashboard/", el_coordinator_dashboard, name="el_coordinator_dashboard"),
     path("application/<int:application_id>/", view_application, name="view_application"),
+    path('application/<int:application_id>/documents/<str:field>/', application_document, name='application_document'),
+    path('application/<int:application_id>/documents/<str:field>/preview/', application_document_preview,
+         name='application_document_preview'),
     path('registered-students-list/', registered_students_view, name='registered_students'),
     path('student/<int:student_id>/worklog/', student_worklog_view, name='student_worklog'),
     path('student/<int:application_id>/profile/', applicant_profile, name='el_student_profile'),
@@ -36,8 +42,16 @@ urlpatterns = [
     path('payments/', payment_reports, name='payment_reports'),
     path('payments/rates/', payment_rate_management, name='payment_rate_management'),
     path('payments/calculate/', payment_calculation_bulk, name='payment_calculation_bulk'),
+    path('payments/runs/<int:run_id>/progress/', payment_run_progress, name='payment_run_progress'),
     path('payments/calculation/<int:record_id>/', payment_calculation_detail, name='payment_calculation_detail'),
     path('payments/export/', export_payment_report, name='export_payment_report'),
+    path('work-logs/export/', export_work_logs, name='export_work_logs'),
     path('payments/budget/', department_payment_budget, name='department_payment_budget'),
     path('student/payments/', student_payment_dashboard, name='student_payment_dashboard'),
+    path('application/uploads/', start_document_upload, name='start_document_upload'),
+    path('application/uploads/<uuid:upload_id>/', document_upload, name='document_upload'),
+    path('api/student/dashboard/', api.student_dashboard_data, name='api_student_dashboard'),
+    path('api/department/dashboard/', api.department_dashboard_data, name='api_department_dashboard'),
+    path('api/coordinator/dashboard/', api.coordinator_dashboard_data, name='api_coordinator_dashboard'),
+    path('api/payments/reports/', api.payment_reports_data, name='api_payment_reports'),
 ]
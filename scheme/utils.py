@@ -1,8 +1,14 @@
 """
 Utility functions for pagination and filtering
 """
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q
+from django.utils.functional import cached_property
 
 
 def get_paginated_queryset(request, queryset, per_page_default=10, per_page_options=None):
@@ -44,6 +50,224 @@ def get_paginated_queryset(request, queryset, per_page_default=10, per_page_opti
     return page_obj, per_page, per_page_options
 
 
+def month_range(year, month, field='date'):
+    """
+    Half-open range lookups covering one calendar month
+    
+    Unlike field__year/field__month, which compile to a function call on the
+    column, a plain range comparison can be answered from an index on field.
+    
+    Args:
+        year: Calendar year
+        month: Calendar month (1-12)
+        field: Date field to filter on
+        
+    Returns:
+        dict: {field__gte: first day of the month, field__lt: first day of the next month}
+    """
+    start = datetime.date(int(year), int(month), 1)
+    end = datetime.date(start.year + 1, 1, 1) if start.month == 12 else datetime.date(start.year, start.month + 1, 1)
+    return {f'{field}__gte': start, f'{field}__lt': end}
+
+
+class KeysetPage:
+    """
+    One page of a keyset (seek) paginated queryset
+
+    Rows are found by seeking past the sort key of the last row shown rather
+    than by OFFSET, and nothing is counted. Supports the parts of Django's Page
+    interface that templates iterate over; navigation uses opaque cursors
+    instead of page numbers. Rows are only fetched when first used.
+    """
+    is_keyset = True
+
+    def __init__(self, request, queryset, per_page, ordering, cursor_param):
+        self.request = request
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.cursor_param = cursor_param
+        fields = [queryset.model._meta.get_field(field.lstrip('-')) for field in self.ordering]
+        self.cursor = decode_cursor(request.GET.get(cursor_param), fields)
+
+    @cached_property
+    def _window(self):
+        if self.cursor is None:
+            keys, backwards = None, False
+        else:
+            keys, backwards = self.cursor
+
+        ordering = _reverse_ordering(self.ordering) if backwards else self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if keys is not None:
+            queryset = queryset.filter(_seek_filter(ordering, keys))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            return rows, True, has_more
+        return rows, has_more, keys is not None
+
+    @property
+    def object_list(self):
+        return self._window[0]
+
+    def has_next(self):
+        return self._window[1]
+
+    def has_previous(self):
+        return self._window[2]
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor(_sort_key(self.object_list[-1], self.ordering), backwards=False)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return encode_cursor(_sort_key(self.object_list[0], self.ordering), backwards=True)
+
+    @property
+    def next_query(self):
+        """Query string for the next page, keeping the request's other parameters"""
+        return self._query_with_cursor(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        """Query string for the previous page, keeping the request's other parameters"""
+        return self._query_with_cursor(self.previous_cursor)
+
+    @property
+    def first_query(self):
+        """Query string for the first page, keeping the request's other parameters"""
+        return self._query_with_cursor(None)
+
+    def _query_with_cursor(self, cursor):
+        params = self.request.GET.copy()
+        params.pop(self.cursor_param, None)
+        params.pop('page', None)
+        if cursor:
+            params[self.cursor_param] = cursor
+        return params.urlencode()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def encode_cursor(keys, backwards=False):
+    """Opaque, URL-safe cursor for a row's sort key"""
+    payload = {
+        'k': [value.isoformat() if hasattr(value, 'isoformat') else value for value in keys],
+        'b': backwards,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    Decode a cursor made by encode_cursor()
+
+    Each key is parsed with its model field's to_python(), so a tampered
+    cursor is treated as no cursor rather than reaching the database.
+
+    Args:
+        cursor: The cursor from the query string
+        fields: Model fields of the sort key, in ordering order
+
+    Returns:
+        tuple: (keys, backwards), or None when the cursor is missing or malformed
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        keys = payload['k']
+        backwards = bool(payload.get('b'))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    if not isinstance(keys, list) or len(keys) != len(fields):
+        return None
+    try:
+        keys = [field.to_python(value) for field, value in zip(fields, keys)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+    if any(key is None for key in keys):
+        return None
+    return keys, backwards
+
+
+def _reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+def _sort_key(obj, ordering):
+    return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+
+def _seek_filter(ordering, keys):
+    """
+    Rows that sort after keys under ordering, e.g. for ('-date', '-time', '-id'):
+    date < d OR (date = d AND time < t) OR (date = d AND time = t AND id < i)
+    """
+    condition = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal_prefix = {ordering[i].lstrip('-'): keys[i] for i in range(position)}
+        condition |= Q(**equal_prefix, **{f'{name}__{lookup}': keys[position]})
+    return condition
+
+
+def get_keyset_paginated_queryset(request, queryset, per_page_default=10, per_page_options=None,
+                                  ordering=('-date', '-time', '-id'), cursor_param='cursor'):
+    """
+    Keyset counterpart of get_paginated_queryset for large, append-mostly tables
+
+    Args:
+        request: Django request object
+        queryset: QuerySet to paginate (its own ordering is replaced by ordering)
+        per_page_default: Default number of items per page
+        per_page_options: List of allowed per_page values
+        ordering: Sort fields, ending in a unique field so every row has a distinct key
+        cursor_param: Query parameter holding the cursor, distinct per list on a page
+
+    Returns:
+        tuple: (page_obj, per_page_value, per_page_options)
+    """
+    if per_page_options is None:
+        per_page_options = [5, 10, 15, 25, 50]
+    
+    per_page = request.GET.get('per_page', str(per_page_default))
+    try:
+        per_page = int(per_page)
+        if per_page not in per_page_options:
+            per_page = per_page_default
+    except (ValueError, TypeError):
+        per_page = per_page_default
+    
+    page_obj = KeysetPage(request, queryset, per_page, ordering, cursor_param)
+    return page_obj, per_page, per_page_options
+
+
 def apply_search_filter(queryset, search_term, search_fields):
     """
     Apply search filter to queryset
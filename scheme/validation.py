@@ -0,0 +1,181 @@
+"""
+Content checks for uploaded application documents.
+
+The model validators only look at a document's extension and size. These
+checks also confirm that a file really is what it claims to be: a PDF
+needs its %PDF- header and a trailer with startxref and %%EOF, and a photo
+needs a PNG, JPEG, GIF or BMP header with sensible dimensions. Only the
+few bytes involved are read (the first and last KB of a PDF, the header
+segments of an image), and the documents of one submission are checked
+concurrently, each within a time budget, so ten attachments take about
+as long as the slowest one.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .models import SchemeApplication, validate_image_file
+from .previews import IMAGE_EXTENSIONS
+
+MAX_IMAGE_DIMENSION = 10000
+PDF_HEAD_BYTES = 1024
+PDF_TAIL_BYTES = 2048
+
+
+def validation_timeout():
+    """Seconds each document may take to check (settings.DOCUMENT_VALIDATION_TIMEOUT)"""
+    return getattr(settings, 'DOCUMENT_VALIDATION_TIMEOUT', 5)
+
+
+def document_kind(field_name):
+    """'image' for document fields that take a photo, 'pdf' for the rest"""
+    field = SchemeApplication._meta.get_field(field_name)
+    return 'image' if validate_image_file in field.validators else 'pdf'
+
+
+def check_pdf(file, size):
+    """Error message if the file does not have a PDF header and trailer, else None"""
+    file.seek(0)
+    head = file.read(PDF_HEAD_BYTES)
+    # The header may follow a little leading junk, which readers tolerate
+    start = head.find(b'%PDF-')
+    if start < 0 or not head[start + 5:start + 8].replace(b'.', b'', 1).isdigit():
+        return "This file is not a PDF document."
+
+    file.seek(max(size - PDF_TAIL_BYTES, 0))
+    tail = file.read(PDF_TAIL_BYTES)
+    if b'%%EOF' not in tail or b'startxref' not in tail:
+        return "This PDF is incomplete or damaged. Please save it again and re-upload."
+    return None
+
+
+def check_image(file, size):
+    """Error message if the file is not a PNG, JPEG, GIF or BMP image of sensible dimensions, else None"""
+    file.seek(0)
+    header = file.read(26)
+    dimensions = None
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR':
+        dimensions = int.from_bytes(header[16:20], 'big'), int.from_bytes(header[20:24], 'big')
+    elif header[:6] in (b'GIF87a', b'GIF89a'):
+        dimensions = int.from_bytes(header[6:8], 'little'), int.from_bytes(header[8:10], 'little')
+    elif header.startswith(b'BM') and len(header) >= 26:
+        dimensions = (int.from_bytes(header[18:22], 'little', signed=True),
+                      abs(int.from_bytes(header[22:26], 'little', signed=True)))
+    elif header.startswith(b'\xff\xd8\xff'):
+        dimensions = _jpeg_dimensions(file)
+    else:
+        return "This file is not a JPG, PNG, GIF or BMP image."
+
+    if dimensions is None:
+        return "This image is incomplete or damaged. Please re-upload it."
+    width, height = dimensions
+    if not (0 < width <= MAX_IMAGE_DIMENSION and 0 < height <= MAX_IMAGE_DIMENSION):
+        return f"Image dimensions {width}x{height} are not supported."
+    return None
+
+
+def _jpeg_dimensions(file):
+    """Width and height from a JPEG's start-of-frame segment, skipping the segments before it"""
+    file.seek(2)
+    for _ in range(1000):
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        while code == 0xFF:  # Fill bytes
+            code = (file.read(1) or b'\x00')[0]
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            continue  # Markers without a length
+        if code in (0xD9, 0xDA):
+            return None  # End of image or scan data before any frame header
+        length = file.read(2)
+        if len(length) < 2:
+            return None
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            frame = file.read(5)
+            if len(frame) < 5:
+                return None
+            return int.from_bytes(frame[3:5], 'big'), int.from_bytes(frame[1:3], 'big')
+        file.seek(int.from_bytes(length, 'big') - 2, os.SEEK_CUR)
+    return None
+
+
+class CheckCancelled(Exception):
+    """Raised inside a document check whose time budget has run out"""
+
+
+class _CancellableFile:
+    """Read access to a file that stops at the next read once the check is cancelled"""
+    def __init__(self, file, cancelled):
+        self.file = file
+        self.cancelled = cancelled
+
+    def read(self, size=-1):
+        if self.cancelled.is_set():
+            raise CheckCancelled()
+        return self.file.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.cancelled.is_set():
+            raise CheckCancelled()
+        return self.file.seek(offset, whence)
+
+
+def check_document(file, kind, cancelled=None):
+    """
+    Check one document, leaving the file at its start for whoever reads it next
+
+    Args:
+        file: The uploaded file
+        kind: 'pdf' or 'image'
+        cancelled: Optional threading.Event that stops the check at its next read
+    """
+    extension = os.path.splitext(file.name or '')[1].lower()
+    if extension not in (IMAGE_EXTENSIONS if kind == 'image' else ('.pdf',)):
+        return None  # A wrong extension is reported by the model field validators
+    check = check_image if kind == 'image' else check_pdf
+    try:
+        return check(_CancellableFile(file, cancelled or threading.Event()), file.size)
+    finally:
+        file.seek(0)
+
+
+def validate_documents(files):
+    """
+    Check the content of several documents concurrently
+
+    Checks still running when the time budget runs out are cancelled at their
+    next read and waited for, so no thread touches the files after this returns.
+
+    Args:
+        files: {document field name: uploaded file}
+
+    Returns:
+        dict: {field name: error message} for the documents that failed
+    """
+    if not files:
+        return {}
+    timeout = validation_timeout()
+    cancelled = threading.Event()
+    with ThreadPoolExecutor(max_workers=len(files), thread_name_prefix='document-check') as executor:
+        futures = {
+            executor.submit(check_document, file, document_kind(field), cancelled): field
+            for field, file in files.items()
+        }
+        # Every document starts at once, so one budget covers them all
+        done, not_done = wait(futures, timeout=timeout)
+        cancelled.set()
+
+    errors = {}
+    for future in done:
+        try:
+            error = future.result()
+        except (OSError, ValueError) as e:
+            error = f"This file could not be read: {e}"
+        if error:
+            errors[futures[future]] = error
+    for future in not_done:
+        errors[futures[future]] = f"Checking this file took longer than {timeout} seconds. Please re-upload it."
+    return errors
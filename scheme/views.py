@@ -1,32 +1,41 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.http import HttpResponseForbidden, HttpResponseRedirect, JsonResponse, HttpResponse
+from django.http import (HttpResponseForbidden, HttpResponseRedirect, JsonResponse, HttpResponse, FileResponse, Http404,
+                         HttpResponseBadRequest)
 from django.urls import reverse
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.utils.crypto import get_random_string
 from django.contrib.auth import get_user_model
 from django.utils.timezone import localdate
-from django.db.models import Sum, Count, Q
+from django.db import IntegrityError
+from django.db.models import Sum, Count, Q, Prefetch
 from django.core.exceptions import ValidationError
 from datetime import timedelta, date
 from decimal import Decimal
 import calendar
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
-from openpyxl.utils import get_column_letter
-import io
+import json
+import os
 
 from .forms import (SchemeApplicationForm, WorkLogForm, DepartmentForm, 
                    DepartmentInchargeCreationForm, StudentDepartmentAssignmentForm, 
                    BulkStudentAssignmentForm, PaymentRateForm, PaymentReportFilterForm,
-                   PaymentCalculationForm, StudentPaymentSearchForm)
+                   PaymentCalculationForm, StudentPaymentSearchForm, WorkLogImportForm)
 from scheme.models import (SchemeApplication, WorkLog, Department, 
                           DepartmentIncharge, StudentDepartmentAssignment,
-                          PaymentRate, PaymentCalculation, DepartmentPaymentSummary, PaymentExport)
+                          PaymentRate, PaymentCalculation, DepartmentPaymentSummary, PaymentExport,
+                          PaymentRun, StudentMonthRollup, KpiSnapshot, DocumentUpload, DocumentPreview)
 from users.decorators import role_required, approved_scheme_required
+from . import exports
+from .payments import department_budget_matrix
+from .membership import department_student_ids
+from .stats import StudentStats
+from .previews import document_gallery
+from .documents import can_view_documents, serve_stored_file
+from .utils import month_range
 from notifications.models import Notification
 from users.models import User
 # Create your views here.
@@ -52,19 +61,27 @@ def scheme_registration(request):
         # If rejected, allow new application (though this is rare)
         
     if request.method == 'POST':
-        form = SchemeApplicationForm(request.POST, request.FILES)
+        form = SchemeApplicationForm(request.POST, request.FILES, student=request.user)
         if form.is_valid():
             scheme_application = form.save(commit=False)
             scheme_application.student = request.user
             scheme_application.save()
+            form.discard_document_uploads()
+            was_registered = request.user.is_registered
             request.user.is_registered = True
             request.user.save()
+            # Newly registered students count as unassigned until placed in a department
+            if not was_registered and not StudentDepartmentAssignment.objects.filter(student=request.user).exists():
+                KpiSnapshot.adjust_on_commit(unassigned_students_count=1)
             messages.success(request, "Your application has been submitted successfully!")
             return redirect('student_dashboard')  
     else:
-        form = SchemeApplicationForm()
+        form = SchemeApplicationForm(student=request.user)
 
-    return render(request, 'scheme/scheme_registration.html', {'form': form})
+    return render(request, 'scheme/scheme_registration.html', {
+        'form': form,
+        'chunk_size': getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 256 * 1024),
+    })
 
 @login_required
 @role_required('student')
@@ -96,18 +113,19 @@ def update_scheme_application(request):
                     field_feedback[field_name] = message
 
     if request.method == "POST":
-        form = SchemeApplicationForm(request.POST, request.FILES, instance=application)
+        form = SchemeApplicationForm(request.POST, request.FILES, instance=application, student=student)
         if form.is_valid():
             updated_application = form.save(commit=False)
             updated_application.status = "Pending"
             updated_application.comments = ""  # Clear previous feedback
             updated_application.save()
+            form.discard_document_uploads()
             messages.success(request, "Your application has been updated and resubmitted successfully!")
             return redirect('student_dashboard')
         else:
             messages.error(request, "Please correct the errors in the form before submitting.")
     else:
-        form = SchemeApplicationForm(instance=application)
+        form = SchemeApplicationForm(instance=application, student=student)
 
     context = {
         'form': form,
@@ -115,23 +133,93 @@ def update_scheme_application(request):
         'is_update': True,
         'field_feedback': field_feedback,
         'general_comment': general_comment,
-        'feedback_available': bool(application.comments)
+        'feedback_available': bool(application.comments),
+        'chunk_size': getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 256 * 1024),
     }
     
     return render(request, 'scheme/update_scheme_application.html', context)
 
+@login_required
+@role_required('student')
+def start_document_upload(request):
+    """
+    Begin a chunked upload of one application document
+
+    Accepts JSON with 'field' (a SchemeApplication document field), 'file_name'
+    and 'size'. An unfinished upload of the same file is resumed instead of
+    started over. Answers with the upload's id and the offset to send from.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST request required.'}, status=405)
+
+    try:
+        payload = json.loads(request.body or '{}')
+        size = int(payload.get('size'))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': "Send JSON with 'field', 'file_name' and a numeric 'size'."}, status=400)
+
+    try:
+        upload = DocumentUpload.start(request.user, payload.get('field'), payload.get('file_name'), size)
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+    return JsonResponse(_document_upload_state(upload), status=201)
+
+@login_required
+@role_required('student')
+def document_upload(request, upload_id):
+    """
+    Status, next chunk or cancellation of a chunked document upload
+
+    GET reports how many bytes are stored, so a client can resume after a
+    dropped connection. POST appends the raw request body (application/octet-stream)
+    at the byte given in the Upload-Offset header; a wrong offset gets 409 with
+    the offset to continue from. DELETE abandons the upload.
+    """
+    upload = get_object_or_404(DocumentUpload, id=upload_id, student=request.user)
+
+    if request.method == 'GET':
+        return JsonResponse(_document_upload_state(upload))
+    if request.method == 'DELETE':
+        upload.delete()
+        return JsonResponse({'deleted': True})
+    if request.method != 'POST':
+        return JsonResponse({'error': 'GET, POST or DELETE request required.'}, status=405)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required.'}, status=400)
+
+    try:
+        # Read straight from the request stream; request.body would hold the whole chunk in memory first
+        upload.append(offset, request, length)
+    except ValidationError as e:
+        status = 409 if e.code == 'offset' else 413
+        upload.refresh_from_db()
+        return JsonResponse({'error': ' '.join(e.messages), **_document_upload_state(upload)}, status=status)
+    return JsonResponse(_document_upload_state(upload))
+
+def _document_upload_state(upload):
+    return {
+        'id': str(upload.id),
+        'field': upload.field_name,
+        'file_name': upload.file_name,
+        'size': upload.size,
+        'offset': upload.received,
+        'complete': upload.is_complete,
+    }
+
 @login_required
 @role_required('student')
 def student_dashboard(request):
     student = request.user  
 
     # If no application exists, redirect to registration
-    if not SchemeApplication.objects.filter(student=student).exists():
+    application = SchemeApplication.objects.filter(student=student).first()
+    if application is None:
         return redirect('scheme_registration')
     
-    # Get the student's application
-    application = get_object_or_404(SchemeApplication, student=student)
-    
     # If application is not approved, show limited dashboard with application status
     if application.status != 'Approved':
         context = {
@@ -148,57 +236,53 @@ def student_dashboard(request):
 
     # For approved students, show full dashboard with work log functionality
     today = localdate()  
-    already_submitted = WorkLog.objects.filter(student=student, date=today).exists()
-    work_logs = WorkLog.objects.filter(student=student).order_by('-date')
-    last_work_log = WorkLog.objects.filter(student=student).order_by('-id').first()
-    last_updated = {'date':last_work_log.date, 'time':last_work_log.time } if last_work_log else None  # Only date available
-    total_hours = WorkLog.objects.filter(student=student, is_verified=True).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-
-    # Calculate current month's hours and remaining limit
+    
+    # All hour totals in one aggregate, shared with the work log validation below
+    stats = StudentStats(student, today)
+    already_submitted = stats.logged_today
+    last_updated = stats.last_updated
+    total_hours = stats.total_verified
+    
     # Only count verified hours for monthly limit tracking
-    current_month_verified = WorkLog.objects.filter(
-        student=student,
-        date__year=today.year,
-        date__month=today.month,
-        is_verified=True,
-        is_rejected=False
-    ).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
+    current_month_verified = stats.month_verified
     
     # Also get total submitted hours for this month (for form validation)
-    current_month_submitted = WorkLog.objects.filter(
-        student=student,
-        date__year=today.year,
-        date__month=today.month,
-        is_rejected=False
-    ).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
+    current_month_submitted = stats.month_submitted
     
-    monthly_limit = 30
-    remaining_hours = monthly_limit - current_month_verified
-    monthly_limit_reached = remaining_hours <= 0
+    monthly_limit = stats.monthly_limit
+    remaining_hours = stats.remaining_hours
+    monthly_limit_reached = stats.monthly_limit_reached
     is_sunday = today.weekday() == 6  # Sunday is weekday 6
 
     if request.method == "POST" and not already_submitted and not monthly_limit_reached and not is_sunday:
-        form = WorkLogForm(request.POST, user=student)
+        form = WorkLogForm(request.POST, user=student, stats=stats)
         if form.is_valid():
-            # Double-check to prevent race conditions
-            if not WorkLog.objects.filter(student=student, date=today).exists():
-                work_log = form.save(commit=False)
-                work_log.student = student
-                work_log.date = today
-                try:
-                    work_log.full_clean()  # This will run model validation
-                    work_log.save()
-                    messages.success(request, "Work log submitted successfully!")
-                except ValidationError as e:
-                    messages.error(request, f"Validation Error: {', '.join(e.messages)}")
-                    form.add_error(None, e)
-            else:
+            work_log = form.save(commit=False)
+            work_log.student = student
+            work_log.date = today
+            work_log.student_stats = stats
+            try:
+                work_log.full_clean()  # This will run model validation
+                # save() reserves the hours atomically; a concurrent submit for the same
+                # day is stopped by the one-log-per-day constraint
+                work_log.save()
+                messages.success(request, "Work log submitted successfully!")
+            except ValidationError as e:
+                messages.error(request, f"Validation Error: {', '.join(e.messages)}")
+                form.add_error(None, e)
+            except IntegrityError:
                 messages.warning(request, "You have already submitted a work log for today.")
             return redirect('student_dashboard')
         else:
             messages.error(request, "Please correct the errors in the form.")  
     else:
-        form = WorkLogForm(user=student)
+        form = WorkLogForm(user=student, stats=stats)
+
+    # Recent work logs, a page at a time rather than the whole history
+    from .utils import get_paginated_queryset
+    work_logs, per_page, per_page_options = get_paginated_queryset(
+        request, WorkLog.objects.filter(student=student).order_by('-date', '-time'), per_page_default=5
+    )
 
     context = {
         'applicant': application,
@@ -206,6 +290,8 @@ def student_dashboard(request):
         'application_status': application.status,
         'can_submit_work': True,
         'work_logs': work_logs,
+        'page_obj': work_logs,
+        'per_page': per_page,
         'already_submitted': already_submitted,
         'form': form,
         'total_hours': total_hours,
@@ -251,10 +337,13 @@ def work_summary(request):
     elif status_filter == 'pending':
         work_logs_query = work_logs_query.filter(is_verified=False)
     
-    # Calculate statistics (always based on all non-rejected logs)
-    all_logs = WorkLog.objects.filter(student=student, is_rejected=False)
-    total_hours = all_logs.aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-    verified_hours = all_logs.filter(is_verified=True).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
+    # Calculate statistics (always based on all non-rejected logs) from the monthly rollups
+    rollup_totals = StudentMonthRollup.objects.filter(student=student).aggregate(
+        total_hours=Sum('submitted_hours'),
+        verified_hours=Sum('verified_hours')
+    )
+    total_hours = rollup_totals['total_hours'] or 0
+    verified_hours = rollup_totals['verified_hours'] or 0
     pending_hours = total_hours - verified_hours
     
     # Pagination
@@ -269,7 +358,9 @@ def work_summary(request):
         work_logs = paginator.page(paginator.num_pages)
     
     # Calculate weekly hours
-    weekly_hours = all_logs.filter(
+    weekly_hours = WorkLog.objects.filter(
+        student=student,
+        is_rejected=False,
         date__gte=localdate() - timedelta(days=7)
     ).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
     
@@ -291,36 +382,42 @@ def work_summary(request):
 @login_required
 @role_required('department_encharge')
 def department_dashboard(request):
+    from .utils import get_keyset_paginated_queryset
+    
     # Get the department incharge record
     try:
         dept_incharge = DepartmentIncharge.objects.get(user=request.user)
         department = dept_incharge.department
         
-        # Filter work logs for students assigned to this department only
-        assigned_students = StudentDepartmentAssignment.objects.filter(
-            department=department, is_active=True
-        ).values_list('student_id', flat=True)
+        # Filter work logs for students assigned to this department only (cached membership)
+        assigned_students = department_student_ids(department)
         
-        # Get pending work logs with pagination
+        # Get pending work logs with keyset pagination (10 items per page)
         pending_work_logs_list = WorkLog.objects.filter(
             is_verified=False, 
             is_rejected=False,
             student_id__in=assigned_students
-        ).order_by('-date', '-time')
-        
-        pending_paginator = Paginator(pending_work_logs_list, 10)  # 10 items per page
-        pending_page = request.GET.get('pending_page', 1)
-        pending_work_logs = pending_paginator.get_page(pending_page)
+        )
+        pending_work_logs, _, _ = get_keyset_paginated_queryset(
+            request, pending_work_logs_list, per_page_default=10, per_page_options=[10],
+            cursor_param='pending_cursor'
+        )
 
-        # Get verified work logs with pagination
+        # Get verified work logs with keyset pagination (15 items per page)
         verified_work_logs_list = WorkLog.objects.filter(
             is_verified=True,
             student_id__in=assigned_students
-        ).order_by('-date', '-time')
+        )
+        verified_work_logs, _, _ = get_keyset_paginated_queryset(
+            request, verified_work_logs_list, per_page_default=15, per_page_options=[15],
+            cursor_param='verified_cursor'
+        )
         
-        verified_paginator = Paginator(verified_work_logs_list, 15)  # 15 items per page
-        verified_page = request.GET.get('verified_page', 1)
-        verified_work_logs = verified_paginator.get_page(verified_page)
+        # Both list totals in one query, since keyset pages are never counted
+        log_counts = WorkLog.objects.filter(student_id__in=assigned_students).aggregate(
+            pending_count=Count('id', filter=Q(is_verified=False, is_rejected=False)),
+            verified_count=Count('id', filter=Q(is_verified=True))
+        )
 
         # Get student hours summary with pagination
         student_hours_list = WorkLog.objects.filter(
@@ -342,8 +439,10 @@ def department_dashboard(request):
         'department': department,
         'pending_work_logs': pending_work_logs,
         'verified_work_logs': verified_work_logs,
+        'pending_count': log_counts['pending_count'],
+        'verified_count': log_counts['verified_count'],
         'student_hours': student_hours,
-        'assigned_students_count': assigned_students.count() if assigned_students else 0,
+        'assigned_students_count': len(assigned_students),
     }
     return render(request, 'scheme/department_dashboard.html', context)
 
@@ -368,25 +467,159 @@ def reject_work_log(request, log_id):
         messages.success(request, "Work log has been rejected.")
     return HttpResponseRedirect(reverse('department_dashboard'))
 
+@login_required
+@role_required('department_encharge')
+def bulk_review_work_logs(request):
+    """
+    Verify or reject many work logs of the incharge's department in one request
+    
+    Accepts JSON (or form data) with 'action' ('approve' or 'reject') and either
+    'log_ids' or 'week' (any date in the week; selects that week's pending logs).
+    Rejections take a shared 'rejection_reason' and optional per-log 'reasons'.
+    Answers with a JSON summary so the dashboard can update in place.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST request required.'}, status=405)
+    
+    try:
+        department = DepartmentIncharge.objects.get(user=request.user).department
+    except DepartmentIncharge.DoesNotExist:
+        return JsonResponse({'error': 'You are not assigned to any department.'}, status=403)
+    
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or '{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({'error': 'JSON body must be an object.'}, status=400)
+        log_ids = payload.get('log_ids') or []
+        # A string would otherwise be read one digit at a time as IDs
+        if not isinstance(log_ids, list) or not all(
+                isinstance(log_id, int) and not isinstance(log_id, bool) for log_id in log_ids):
+            return JsonResponse({'error': 'log_ids must be a list of numbers.'}, status=400)
+    else:
+        payload = request.POST
+        log_ids = request.POST.getlist('log_ids')
+    
+    action = payload.get('action')
+    if action not in ('approve', 'reject'):
+        return JsonResponse({'error': "Action must be 'approve' or 'reject'."}, status=400)
+    
+    # Only logs of students currently assigned to this department can be reviewed
+    assigned_students = department_student_ids(department)
+    queryset = WorkLog.objects.filter(student_id__in=assigned_students)
+    
+    # Per-log rejection reasons can only be sent as JSON ({log_id: reason})
+    raw_reasons = payload.get('reasons') if request.content_type == 'application/json' else None
+    try:
+        log_ids = [int(log_id) for log_id in log_ids]
+        reasons = {int(log_id): str(text).strip() for log_id, text in (raw_reasons or {}).items()}
+    except (AttributeError, TypeError, ValueError):
+        return JsonResponse({'error': 'Log IDs must be numbers.'}, status=400)
+    
+    week = payload.get('week')
+    if log_ids:
+        queryset = queryset.filter(id__in=log_ids)
+    elif week:
+        try:
+            week_start = date.fromisoformat(week)
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'Week must be a date in YYYY-MM-DD format.'}, status=400)
+        week_start -= timedelta(days=week_start.weekday())
+        queryset = queryset.filter(date__gte=week_start, date__lt=week_start + timedelta(days=7))
+    else:
+        return JsonResponse({'error': 'Provide log_ids or a week.'}, status=400)
+    
+    reviewed_ids = WorkLog.bulk_review(
+        queryset,
+        verify=action == 'approve',
+        reviewer=request.user,
+        reason=(payload.get('rejection_reason') or '').strip(),
+        reasons=reasons
+    )
+    
+    pending_count = WorkLog.objects.filter(
+        student_id__in=assigned_students,
+        is_verified=False,
+        is_rejected=False
+    ).count()
+    
+    return JsonResponse({
+        'action': action,
+        'updated': len(reviewed_ids),
+        'updated_ids': reviewed_ids,
+        # Requested logs that were not pending or not in this department
+        'skipped_ids': sorted(set(log_ids) - set(reviewed_ids)),
+        'pending_count': pending_count,
+    })
+
+
+@login_required
+@role_required('department_encharge')
+def upload_work_logs(request):
+    """
+    Bulk import work logs of the incharge's department from an attendance system file
+    
+    Accepts a CSV or JSONL upload of (prn, date, hours, description) rows and shows
+    the per-row accept/reject report, or returns it as a CSV download.
+    """
+    from .imports import WorkLogImport, detect_import_format, parse_import_rows, write_import_report
+    
+    try:
+        department = DepartmentIncharge.objects.get(user=request.user).department
+    except DepartmentIncharge.DoesNotExist:
+        messages.error(request, "You are not assigned to any department.")
+        return redirect('department_dashboard')
+    
+    work_log_import = None
+    if request.method == 'POST':
+        form = WorkLogImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            uploaded = form.cleaned_data['file']
+            work_log_import = WorkLogImport(department=department, verify=form.cleaned_data['verified'])
+            try:
+                work_log_import.run(parse_import_rows(uploaded, detect_import_format(uploaded.name)))
+            except UnicodeDecodeError:
+                form.add_error('file', "The file must be UTF-8 text.")
+                work_log_import = None
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.error(f"Error importing work logs for {department.code}: {str(e)}")
+                messages.error(request, "The import stopped on an unexpected error; batches before it may already be imported.")
+                work_log_import = None
+            
+            if work_log_import is not None:
+                messages.success(
+                    request,
+                    f"{work_log_import.accepted_count} work logs imported, {work_log_import.rejected_count} rows rejected."
+                )
+                if form.cleaned_data['download_report']:
+                    response = HttpResponse(content_type='text/csv')
+                    response['Content-Disposition'] = f'attachment; filename="work_log_import_{department.code}.csv"'
+                    write_import_report(work_log_import.results, response)
+                    return response
+    else:
+        form = WorkLogImportForm()
+    
+    context = {
+        'form': form,
+        'department': department,
+        'work_log_import': work_log_import,
+        'rejected_rows': [r for r in work_log_import.results if r['status'] == 'rejected'] if work_log_import else [],
+    }
+    return render(request, 'scheme/upload_work_logs.html', context)
 
 
 @login_required
 @role_required('el_coordinator')
 def el_coordinator_dashboard(request):
-    from .utils import get_paginated_queryset
+    from .utils import get_paginated_queryset, get_keyset_paginated_queryset
     
-    # Get basic statistics
+    # Headline totals come from the KPI snapshot rather than scanning every table
+    kpis = KpiSnapshot.get()
     pending_applications = SchemeApplication.objects.filter(status="Pending")
-    approved_students = SchemeApplication.objects.filter(status="Approved")
-    total_hours = WorkLog.objects.aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-    
-    # Additional statistics for multi-department system
-    departments_count = Department.objects.filter(is_active=True).count()
-    unassigned_students_count = User.objects.filter(
-        role='student', 
-        is_registered=True, 
-        studentdepartmentassignment__isnull=True
-    ).count()
 
     # Paginate pending applications for better performance
     pending_page_obj, _, _ = get_paginated_queryset(
@@ -394,22 +627,24 @@ def el_coordinator_dashboard(request):
         per_page_default=10
     )
 
-    # Recent work logs with pagination
-    recent_work_logs = WorkLog.objects.select_related('student').order_by('-date', '-time')
-    work_logs_page_obj, _, _ = get_paginated_queryset(
+    # Recent work logs with keyset pagination (this list spans every WorkLog in the system)
+    recent_work_logs = WorkLog.objects.select_related('student')
+    work_logs_page_obj, _, _ = get_keyset_paginated_queryset(
         request, recent_work_logs, 
         per_page_default=15
     )
 
     context = {
         "pending_applications": pending_page_obj,
-        "approved_students": approved_students,
         "work_logs": work_logs_page_obj,
-        "total_hours": total_hours,
-        "departments_count": departments_count,
-        "unassigned_students_count": unassigned_students_count,
-        "pending_applications_count": pending_applications.count(),
-        "approved_students_count": approved_students.count(),
+        "kpis": kpis,
+        "total_hours": kpis.total_hours,
+        "departments_count": kpis.departments_count,
+        "departments_with_incharge": kpis.departments_with_incharge,
+        "assigned_students_count": kpis.assigned_students_count,
+        "unassigned_students_count": kpis.unassigned_students_count,
+        "pending_applications_count": kpis.pending_applications_count,
+        "approved_students_count": kpis.approved_students_count,
     }
     return render(request, "scheme/el_coordinator_dashboard.html", context)
 
@@ -491,9 +726,46 @@ def view_application(request, application_id):
 
         return redirect("el_coordinator_dashboard")
 
-    context = {"application": application}
+    context = {"application": application, "document_previews": document_gallery(application)}
     return render(request, "scheme/view_application.html", context)
 
+@login_required
+def application_document(request, application_id, field):
+    """
+    Serve one uploaded document of an application to those allowed to see it
+
+    The applicant, coordinators and the incharge of the student's department.
+    Supports Range and conditional requests, or hands the transfer to the front
+    proxy (settings.DOCUMENT_SERVE_MODE).
+    """
+    application = get_object_or_404(SchemeApplication, id=application_id)
+    if field not in SchemeApplication.DOCUMENT_FIELDS or not getattr(application, field):
+        raise Http404("No such document.")
+    if not can_view_documents(request.user, application):
+        return HttpResponseForbidden("You are not authorized to view this document.")
+
+    document = getattr(application, field)
+    extension = os.path.splitext(document.name)[1].lower()
+    try:
+        return serve_stored_file(request, document.storage, document.name, f"{application.prn_number}_{field}{extension}")
+    except FileNotFoundError:
+        raise Http404("The document file is missing.")
+
+@login_required
+def application_document_preview(request, application_id, field):
+    """Serve the rendered preview of an application document (same access as the document)"""
+    application = get_object_or_404(SchemeApplication, id=application_id)
+    if field not in SchemeApplication.DOCUMENT_FIELDS or not getattr(application, field):
+        raise Http404("No such document.")
+    if not can_view_documents(request.user, application):
+        return HttpResponseForbidden("You are not authorized to view this document.")
+
+    preview = get_object_or_404(DocumentPreview, source_name=getattr(application, field).name, status='Ready')
+    try:
+        return serve_stored_file(request, default_storage, preview.preview_name, f"{application.prn_number}_{field}.jpg")
+    except FileNotFoundError:
+        raise Http404("The preview file is missing.")
+
 
 @login_required
 @role_required('el_coordinator')
@@ -535,7 +807,7 @@ def registered_students_view(request):
         'approved_students': page_obj,
         'page_obj': page_obj,
         'per_page': per_page,
-        'total_count': queryset.count(),
+        'total_count': queryset.count,  # counted only if the template asks
         **filter_context
     }
     
@@ -547,7 +819,7 @@ def student_worklog_view(request, student_id):
     """
     Display worklogs for a specific student by ID.
     """
-    from .utils import get_paginated_queryset, apply_date_range_filter, get_filter_context
+    from .utils import get_keyset_paginated_queryset, apply_date_range_filter, get_filter_context
     
     student = get_object_or_404(SchemeApplication, id=student_id, status="Approved")
 
@@ -568,14 +840,26 @@ def student_worklog_view(request, student_id):
     date_to = request.GET.get('date_to')
     queryset = apply_date_range_filter(queryset, date_from, date_to)
     
+    # Export the filtered logs as CSV / JSON Lines instead of rendering the page
+    export_format = request.GET.get('export')
+    if export_format in exports.RAW_FORMATS:
+        return exports.streaming_export_response(
+            exports.WORK_LOG_FIELDS, exports.work_log_rows(queryset), export_format,
+            f"work_logs_{student.prn_number}"
+        )
+    
     # Get paginated results
-    page_obj, per_page, per_page_options = get_paginated_queryset(request, queryset, per_page_default=15)
+    page_obj, per_page, per_page_options = get_keyset_paginated_queryset(request, queryset, per_page_default=15)
     
-    # Calculate statistics (always based on all logs)
-    all_logs = WorkLog.objects.filter(student=student.student)
-    verified_hours = all_logs.filter(is_verified=True).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-    total_hours = all_logs.aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
-    pending_hours = all_logs.filter(is_verified=False, is_rejected=False).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
+    # Calculate statistics (always based on all logs) from the monthly rollups
+    rollup_totals = StudentMonthRollup.objects.filter(student=student.student).aggregate(
+        submitted_hours=Sum('submitted_hours'),
+        verified_hours=Sum('verified_hours'),
+        rejected_hours=Sum('rejected_hours')
+    )
+    verified_hours = rollup_totals['verified_hours'] or 0
+    total_hours = (rollup_totals['submitted_hours'] or 0) + (rollup_totals['rejected_hours'] or 0)
+    pending_hours = (rollup_totals['submitted_hours'] or 0) - verified_hours
     
     # Status options for filter
     status_options = [
@@ -602,7 +886,7 @@ def student_worklog_view(request, student_id):
         'verified_hours': verified_hours,
         'total_hours': total_hours,
         'pending_hours': pending_hours,
-        'total_count': queryset.count(),
+        'total_count': queryset.count,  # counted only if the template asks
         **filter_context
     }
     
@@ -652,14 +936,11 @@ def department_list(request):
     # Get paginated results
     page_obj, per_page, per_page_options = get_paginated_queryset(request, queryset, per_page_default=10)
 
-    # Calculate statistics for all departments (not just current page)
-    all_departments = Department.objects.all().annotate(
-        students_count=Count('assigned_students', filter=Q(assigned_students__is_active=True))
-    )
-    
-    total_students = sum(dept.students_count for dept in all_departments)
-    departments_with_incharge = all_departments.filter(incharge__isnull=False).count()
-    departments_without_incharge = all_departments.filter(incharge__isnull=True).count()
+    # Statistics for all departments (not just current page) from the KPI snapshot
+    kpis = KpiSnapshot.get()
+    total_students = kpis.assigned_students_count
+    departments_with_incharge = kpis.departments_with_incharge
+    departments_without_incharge = kpis.departments_without_incharge
 
     # Status options for filter
     status_options = [
@@ -680,10 +961,11 @@ def department_list(request):
     context = {
         'page_obj': page_obj,
         'per_page': per_page,
-        'total_count': queryset.count(),
+        'total_count': queryset.count,  # counted only if the template asks
         'total_students': total_students,
         'departments_with_incharge': departments_with_incharge,
         'departments_without_incharge': departments_without_incharge,
+        'kpis': kpis,
         **filter_context
     }
     # Ensure departments is set after filter_context to avoid override
@@ -736,8 +1018,7 @@ def department_detail(request, department_id):
     ).select_related('student').prefetch_related('student__schemeapplication_set')
     
     # Get work logs summary for this department
-    student_ids = assigned_students.values_list('student_id', flat=True)
-    work_logs = WorkLog.objects.filter(student_id__in=student_ids, is_rejected=False)
+    work_logs = WorkLog.objects.filter(student_id__in=department_student_ids(department), is_rejected=False)
     total_hours = work_logs.aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
     verified_hours = work_logs.filter(is_verified=True).aggregate(Sum('hours_worked'))['hours_worked__sum'] or 0
     
@@ -852,8 +1133,11 @@ def bulk_assign_students(request):
                     message=f'You have been assigned to {department.name} department for your Earn & Learn activities.'
                 ))
             
-            # Bulk create
+            # Bulk create (skips save(), so discard the cached membership here)
             StudentDepartmentAssignment.objects.bulk_create(assignments)
+            StudentDepartmentAssignment.assignments_changed(
+                added=[(assignment.student_id, assignment.is_active) for assignment in assignments]
+            )
             Notification.objects.bulk_create(notifications)
             
             messages.success(request, f"{len(students)} students assigned to {department.name} successfully!")
@@ -948,108 +1232,60 @@ def payment_calculation_bulk(request):
                 messages.error(request, 'No payment rate has been set. Please set a payment rate before calculating payments.')
                 return render(request, 'scheme/payment_calculation_bulk.html', {'form': form})
             
-            # Determine departments to process
-            if department:
-                departments = [department]
-            elif hasattr(request.user, 'departmentincharge'):
-                departments = [request.user.departmentincharge.department]
-            else:
-                departments = Department.objects.filter(is_active=True)
-            
-            total_calculated = 0
-            total_students = 0
-            errors = []
-            
-            for dept in departments:
-                try:
-                    # Get students assigned to department with proper filtering
-                    students = User.objects.filter(
-                        role='student',
-                        is_registered=True,
-                        studentdepartmentassignment__department=dept,
-                        studentdepartmentassignment__is_active=True
-                    ).distinct()  # Use distinct to avoid duplicates
-                    
-                    dept_calculated = 0
-                    
-                    for student in students:
-                        try:
-                            # Check if payment record already exists
-                            payment_date = date(year, month, 1)
-                            existing_record = PaymentCalculation.objects.filter(
-                                student=student,
-                                calculation_month=payment_date
-                            ).first()
-                            
-                            if existing_record and not recalculate:
-                                continue
-                            
-                            # Check if student has any verified work logs for the month
-                            has_work_logs = WorkLog.objects.filter(
-                                student=student,
-                                date__year=year,
-                                date__month=month,
-                                is_verified=True,
-                                is_rejected=False
-                            ).exists()
-                            
-                            if not has_work_logs:
-                                continue  # Skip students with no verified work logs
-                            
-                            payment_calculation = PaymentCalculation.calculate_for_student_month(student, year, month)
-                            if payment_calculation:
-                                payment_calculation.calculated_by = request.user
-                                payment_calculation.save()
-                                dept_calculated += 1
-                                total_calculated += 1
-                                
-                        except Exception as e:
-                            error_msg = f"Error calculating payment for {student.get_full_name()}: {str(e)}"
-                            errors.append(error_msg)
-                            continue
-                    
-                    # Generate department summary only if calculations were made
-                    if dept_calculated > 0:
-                        try:
-                            DepartmentPaymentSummary.generate_for_department_month(dept, year, month)
-                        except Exception as e:
-                            error_msg = f"Error generating summary for {dept.name}: {str(e)}"
-                            errors.append(error_msg)
-                    
-                    total_students += dept_calculated
-                    
-                except Exception as e:
-                    error_msg = f"Error processing department {dept.name}: {str(e)}"
-                    errors.append(error_msg)
-                    continue
-            
-            # Provide feedback to user
-            if total_calculated > 0:
-                messages.success(request, f'Payment calculations completed for {total_calculated} students across {len(departments)} departments!')
-            else:
-                messages.info(request, 'No new payment calculations were needed. Students may not have verified work logs for the selected period.')
-            
-            # Display any errors that occurred
-            if errors:
-                for error in errors[:5]:  # Limit to first 5 errors to avoid overwhelming the user
-                    messages.warning(request, error)
-                if len(errors) > 5:
-                    messages.warning(request, f'... and {len(errors) - 5} more errors occurred.')
+            # Determine department to process (blank means all active departments)
+            if not department and hasattr(request.user, 'departmentincharge'):
+                department = request.user.departmentincharge.department
             
-            return redirect('payment_reports')
+            # Queue the run for the background worker instead of calculating in the request
+            run = PaymentRun.objects.create(
+                calculation_month=date(year, month, 1),
+                department=department,
+                recalculate_existing=recalculate,
+                requested_by=request.user
+            )
+            messages.info(request, f'Payment calculation for {run.month_year_display} has been queued. Progress is shown below.')
+            return redirect(f"{reverse('payment_calculation_bulk')}?run={run.id}")
     else:
         form = PaymentCalculationForm(user=request.user)
     
     # Get current payment rate for display
     current_rate = PaymentRate.get_current_rate()
     
+    # Run being tracked on this page, if any
+    payment_run = None
+    run_id = request.GET.get('run')
+    if run_id and run_id.isdigit():
+        payment_run = PaymentRun.objects.filter(id=run_id).first()
+    
     context = {
         'form': form,
-        'current_rate': current_rate
+        'current_rate': current_rate,
+        'payment_run': payment_run,
+        'recent_runs': PaymentRun.objects.select_related('department')[:5],
     }
     return render(request, 'scheme/payment_calculation_bulk.html', context)
 
 
+@login_required
+@role_required(['el_coordinator'])
+def payment_run_progress(request, run_id):
+    """JSON progress of a queued payment run, polled by the bulk calculation page"""
+    payment_run = get_object_or_404(PaymentRun, id=run_id)
+    return JsonResponse({
+        'id': payment_run.id,
+        'status': payment_run.status,
+        'month': payment_run.month_year_display,
+        'department': payment_run.department.name if payment_run.department else 'All Departments',
+        'total_departments': payment_run.total_departments,
+        'completed_departments': len(payment_run.completed_departments),
+        'progress_percent': payment_run.progress_percent,
+        'calculated_count': payment_run.calculated_count,
+        'errors': payment_run.errors[:5],
+        'error_count': len(payment_run.errors),
+        'is_finished': payment_run.is_finished,
+    })
+
+
 @login_required
 @role_required(['el_coordinator', 'department_encharge'])
 def payment_reports(request):
@@ -1064,8 +1300,7 @@ def payment_reports(request):
     
     # Base queryset
     payment_calculations = PaymentCalculation.objects.filter(
-        calculation_month__year=year,
-        calculation_month__month=month
+        **month_range(year, month, 'calculation_month')
     )
     
     # Apply filters based on user role
@@ -1083,14 +1318,12 @@ def payment_reports(request):
     # Get department summaries
     if hasattr(request.user, 'departmentincharge'):
         dept_summaries = DepartmentPaymentSummary.objects.filter(
-            calculation_month__year=year,
-            calculation_month__month=month,
+            **month_range(year, month, 'calculation_month'),
             department=request.user.departmentincharge.department
         )
     else:
         dept_summaries = DepartmentPaymentSummary.objects.filter(
-            calculation_month__year=year,
-            calculation_month__month=month
+            **month_range(year, month, 'calculation_month')
         )
         if department_id:
             dept_summaries = dept_summaries.filter(department_id=department_id)
@@ -1101,7 +1334,10 @@ def payment_reports(request):
     total_hours = payment_calculations.aggregate(Sum('total_hours'))['total_hours__sum'] or 0
     
     # Pagination
-    paginator = Paginator(payment_calculations.order_by('-created_at'), 20)
+    # Student names come annotated in one extra query instead of one per row
+    paginator = Paginator(payment_calculations.select_related('department').prefetch_related(
+        Prefetch('student', queryset=User.objects.with_display_name())
+    ).order_by('-created_at'), 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -1132,8 +1368,7 @@ def payment_calculation_detail(request, record_id):
     # Get related work logs
     work_logs = WorkLog.objects.filter(
         student=payment_calculation.student,
-        date__year=payment_calculation.calculation_month.year,
-        date__month=payment_calculation.calculation_month.month,
+        **month_range(payment_calculation.calculation_month.year, payment_calculation.calculation_month.month),
         is_verified=True,
         is_rejected=False
     ).order_by('date')
@@ -1155,23 +1390,14 @@ def student_payment_dashboard(request):
         current_date = date.today()
         current_month_record = PaymentCalculation.objects.filter(
             student=request.user,
-            calculation_month__year=current_date.year,
-            calculation_month__month=current_date.month
+            **month_range(current_date.year, current_date.month, 'calculation_month')
         ).first()
         
         # Get current payment rate
         current_rate = PaymentRate.get_current_rate()
         
-        # Get current month's verified hours using database aggregation
-        current_month_hours_result = WorkLog.objects.filter(
-            student=request.user,
-            date__year=current_date.year,
-            date__month=current_date.month,
-            is_verified=True,
-            is_rejected=False
-        ).aggregate(Sum('hours_worked'))
-        
-        current_month_hours = current_month_hours_result['hours_worked__sum'] or 0
+        # Get current month's verified hours from the monthly rollup
+        current_month_hours = StudentMonthRollup.get_for(request.user.pk, current_date).verified_hours
         
         # Calculate potential earnings for current month
         potential_earnings = 0
@@ -1225,201 +1451,160 @@ def student_payment_dashboard(request):
 @login_required
 @role_required(['el_coordinator', 'department_encharge'])
 def export_payment_report(request):
-    """Export payment reports to Excel"""
+    """Export payment reports to Excel, or the raw payment data as CSV / JSON Lines"""
+    export_format = request.GET.get('format', 'xlsx')
+    if export_format in exports.RAW_FORMATS:
+        return _stream_payment_data(request, export_format)
+    
     year = int(request.GET.get('year', date.today().year))
     month = int(request.GET.get('month', date.today().month))
     export_type = request.GET.get('type', 'department')
     department_id = request.GET.get('department')
     student_id = request.GET.get('student')
     
-    # Create workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    
-    # Set up styles
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    
-    if export_type == 'student' and student_id:
+    if export_type == 'student':
         # Individual student report
+        if not student_id:
+            return HttpResponseBadRequest('A student is required for a student report.')
         student = get_object_or_404(User, id=student_id)
-        payment_calculation = PaymentCalculation.objects.filter(
-            student=student,
-            calculation_month__year=year,
-            calculation_month__month=month
-        ).first()
-        
-        ws.title = f"{student.get_full_name()} - {calendar.month_name[month]} {year}"
-        
-        # Headers
-        headers = ['Date', 'Hours', 'Description', 'Verified', 'Rate/Hour', 'Amount']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, col=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Get work logs
-        work_logs = WorkLog.objects.filter(
-            student=student,
-            date__year=year,
-            date__month=month
-        ).order_by('date')
-        
-        row = 2
-        total_amount = 0
-        rate_per_hour = payment_calculation.rate_per_hour if payment_calculation else (PaymentRate.get_current_rate().rate_per_hour if PaymentRate.get_current_rate() else 0)
-        
-        for log in work_logs:
-            ws.cell(row=row, col=1, value=log.date.strftime('%Y-%m-%d'))
-            ws.cell(row=row, col=2, value=log.hours_worked)
-            ws.cell(row=row, col=3, value=log.description[:50] + '...' if len(log.description) > 50 else log.description)
-            ws.cell(row=row, col=4, value='Yes' if log.is_verified else 'No')
-            ws.cell(row=row, col=5, value=float(rate_per_hour) if log.is_verified else 0)
-            amount = float(rate_per_hour * log.hours_worked) if log.is_verified else 0
-            ws.cell(row=row, col=6, value=amount)
-            if log.is_verified:
-                total_amount += amount
-            row += 1
-        
-        # Add total row
-        ws.cell(row=row + 1, col=5, value="Total:").font = Font(bold=True)
-        ws.cell(row=row + 1, col=6, value=total_amount).font = Font(bold=True)
-        
-        filename = f"payment_report_{student.get_full_name().replace(' ', '_')}_{year}_{month:02d}.xlsx"
+        version = exports.data_version(export_type, year, month, student=student)
+        build_report = lambda: exports.student_report(student, year, month)
         
     elif export_type == 'department':
-        # Department report
-        if department_id:
+        # Department report (department incharges are limited to their own department)
+        if hasattr(request.user, 'departmentincharge'):
+            department = request.user.departmentincharge.department
+            department_id = department.id
+            departments = [department]
+            title_scope = department.name
+        elif department_id:
             department = get_object_or_404(Department, id=department_id)
             departments = [department]
-            ws.title = f"{department.name} - {calendar.month_name[month]} {year}"
-        elif hasattr(request.user, 'departmentincharge'):
-            departments = [request.user.departmentincharge.department]
-            ws.title = f"{departments[0].name} - {calendar.month_name[month]} {year}"
+            title_scope = department.name
         else:
             departments = Department.objects.filter(is_active=True)
-            ws.title = f"All Departments - {calendar.month_name[month]} {year}"
-        
-        # Headers
-        headers = ['Student Name', 'PRN', 'Department', 'Total Hours', 'Rate/Hour', 'Total Amount', 'Status']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, col=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-        
-        row = 2
-        grand_total = 0
-        
-        for dept in departments:
-            payment_calculations = PaymentCalculation.objects.filter(
-                department=dept,
-                calculation_month__year=year,
-                calculation_month__month=month
-            ).order_by('student__first_name')
-            
-            for record in payment_calculations:
-                ws.cell(row=row, col=1, value=record.student.get_full_name())
-                # Get PRN from scheme application
-                try:
-                    prn = record.student.schemeapplication.prn_number
-                except:
-                    prn = 'N/A'
-                ws.cell(row=row, col=2, value=prn)
-                ws.cell(row=row, col=3, value=record.department.name)
-                ws.cell(row=row, col=4, value=float(record.total_hours))
-                ws.cell(row=row, col=5, value=float(record.rate_per_hour))
-                ws.cell(row=row, col=6, value=float(record.total_amount))
-                ws.cell(row=row, col=7, value=record.get_status_display())
-                grand_total += float(record.total_amount)
-                row += 1
-        
-        # Add total row
-        ws.cell(row=row + 1, col=5, value="Grand Total:").font = Font(bold=True)
-        ws.cell(row=row + 1, col=6, value=grand_total).font = Font(bold=True)
-        
-        filename = f"payment_report_departments_{year}_{month:02d}.xlsx"
+            title_scope = "All Departments"
+        version = exports.data_version(export_type, year, month, departments=departments)
+        build_report = lambda: exports.department_report(departments, year, month, title_scope)
     
     else:
         # All departments summary
-        ws.title = f"Payment Summary - {calendar.month_name[month]} {year}"
-        
-        # Headers
-        headers = ['Department', 'Total Students', 'Total Hours', 'Total Amount', 'Avg Hours/Student']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, col=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-        
-        summaries = DepartmentPaymentSummary.objects.filter(
-            calculation_month__year=year,
-            calculation_month__month=month
-        ).order_by('department__name')
-        
-        row = 2
-        grand_total_amount = 0
-        grand_total_students = 0
-        grand_total_hours = 0
-        
-        for summary in summaries:
-            ws.cell(row=row, col=1, value=summary.department.name)
-            ws.cell(row=row, col=2, value=summary.total_students)
-            ws.cell(row=row, col=3, value=float(summary.total_hours))
-            ws.cell(row=row, col=4, value=float(summary.total_amount))
-            ws.cell(row=row, col=5, value=float(summary.average_hours_per_student))
-            
-            grand_total_amount += float(summary.total_amount)
-            grand_total_students += summary.total_students
-            grand_total_hours += float(summary.total_hours)
-            row += 1
-        
-        # Add totals
-        ws.cell(row=row + 1, col=1, value="TOTALS:").font = Font(bold=True)
-        ws.cell(row=row + 1, col=2, value=grand_total_students).font = Font(bold=True)
-        ws.cell(row=row + 1, col=3, value=grand_total_hours).font = Font(bold=True)
-        ws.cell(row=row + 1, col=4, value=grand_total_amount).font = Font(bold=True)
-        ws.cell(row=row + 1, col=5, value=grand_total_hours/grand_total_students if grand_total_students > 0 else 0).font = Font(bold=True)
-        
-        filename = f"payment_summary_all_departments_{year}_{month:02d}.xlsx"
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Save to memory
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+        version = exports.data_version(export_type, year, month)
+        build_report = lambda: exports.summary_report(year, month)
+    
+    if export_type != 'student':
+        student_id = None
+    if export_type != 'department':
+        department_id = None
+    
+    # Serve the stored workbook for this data version, generating it only when needed
+    export_month = date(year, month, 1)
+    artifact = exports.get_export_artifact(
+        export_type, export_month, department_id, student_id, version, build_report
+    )
     
     # Create export record
     PaymentExport.objects.create(
         export_type=export_type,
-        export_month=date(year, month, 1),
+        export_month=export_month,
         department_id=department_id,
         student_id=student_id,
-        file_name=filename,
-        file_path=f"exports/{filename}",
+        file_name=artifact['file_name'],
+        file_path=artifact['file_path'],
+        data_version=version,
+        file_size=artifact['file_size'],
         exported_by=request.user
     )
     
-    # Return file
-    response = HttpResponse(
-        output.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return FileResponse(
+        artifact['file'],
+        as_attachment=True,
+        filename=artifact['file_name'],
+        content_type=exports.XLSX_CONTENT_TYPE
+    )
+
+
+def _stream_payment_data(request, export_format):
+    """
+    Stream PaymentCalculation or DepartmentPaymentSummary rows as CSV / JSON Lines
+    
+    month=all exports the whole year. Department incharges only receive rows
+    for their own department.
+    """
+    year = int(request.GET.get('year', date.today().year))
+    month = request.GET.get('month', str(date.today().month))
+    export_type = request.GET.get('type', 'department')
+    department_id = request.GET.get('department')
+    student_id = request.GET.get('student')
+    
+    is_summary = export_type not in ('student', 'department')
+    if is_summary:
+        queryset = DepartmentPaymentSummary.objects.all()
+    else:
+        queryset = PaymentCalculation.objects.all()
+        if export_type == 'student' and student_id:
+            student = get_object_or_404(User, id=student_id)
+            queryset = queryset.filter(student=student)
+    
+    # __year alone already compiles to a date range; single months use month_range
+    if month == 'all':
+        queryset = queryset.filter(calculation_month__year=year)
+    else:
+        month = int(month)
+        queryset = queryset.filter(**month_range(year, month, 'calculation_month'))
+    
+    if hasattr(request.user, 'departmentincharge'):
+        queryset = queryset.filter(department=request.user.departmentincharge.department)
+    elif export_type == 'department' and department_id:
+        queryset = queryset.filter(department=get_object_or_404(Department, id=department_id))
+    
+    period = f"{year}" if month == 'all' else f"{year}_{month:02d}"
+    if is_summary:
+        fields = exports.DEPARTMENT_SUMMARY_FIELDS
+        rows = exports.department_summary_rows(queryset)
+        filename = f"payment_summaries_{period}"
+    else:
+        fields = exports.PAYMENT_CALCULATION_FIELDS
+        rows = exports.payment_calculation_rows(queryset)
+        filename = f"payment_calculations_{period}"
+    
+    return exports.streaming_export_response(fields, rows, export_format, filename)
+
+
+@login_required
+@role_required(['el_coordinator', 'department_encharge'])
+def export_work_logs(request):
+    """Stream work logs of one or all departments as CSV / JSON Lines"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.RAW_FORMATS:
+        export_format = 'csv'
+    year = int(request.GET.get('year', date.today().year))
+    month = request.GET.get('month', str(date.today().month))
+    department_id = request.GET.get('department')
+    
+    if month == 'all':
+        queryset = WorkLog.objects.filter(date__year=year)
+    else:
+        month = int(month)
+        queryset = WorkLog.objects.filter(**month_range(year, month))
+    
+    # Department incharges are limited to their own department
+    if hasattr(request.user, 'departmentincharge'):
+        department = request.user.departmentincharge.department
+    elif department_id:
+        department = get_object_or_404(Department, id=department_id)
+    else:
+        department = None
+    
+    if department:
+        queryset = queryset.filter(student_id__in=department_student_ids(department))
+    
+    period = f"{year}" if month == 'all' else f"{year}_{month:02d}"
+    scope = department.name.replace(' ', '_') if department else 'all_departments'
+    return exports.streaming_export_response(
+        exports.WORK_LOG_FIELDS, exports.work_log_rows(queryset), export_format,
+        f"work_logs_{scope}_{period}"
     )
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
 
 
 @login_required
@@ -1439,109 +1624,37 @@ def department_payment_budget(request):
     if hasattr(request.user, 'departmentincharge'):
         departments = departments.filter(id=request.user.departmentincharge.department.id)
     
-    budget_data = []
-    total_budget = 0
+    # Resolve the requested view to a range of calculation months
+    if view_type == 'monthly':
+        range_start = date(current_year, current_month, 1)
+        range_end = range_start
+        count_assigned = False
+    elif view_type == 'custom' and start_date and end_date:
+        from datetime import datetime
+        range_start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        range_end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        count_assigned = False
+    else:
+        range_start = date(current_year, 1, 1)
+        range_end = date(current_year, 12, 31)
+        # The yearly view counts every approved student assigned to the department
+        count_assigned = True
     
-    for dept in departments:
-        if view_type == 'monthly':
-            # Get data for specific month
-            monthly_summaries = DepartmentPaymentSummary.objects.filter(
-                department=dept,
-                calculation_month__year=current_year,
-                calculation_month__month=current_month
-            )
-            month_total = sum(float(s.total_amount) for s in monthly_summaries)
-            monthly_totals = [0] * 12
-            monthly_totals[current_month - 1] = month_total
-            year_total = month_total
-            
-        elif view_type == 'custom' and start_date and end_date:
-            # Get data for custom date range
-            from datetime import datetime
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-            
-            monthly_summaries = DepartmentPaymentSummary.objects.filter(
-                department=dept,
-                calculation_month__gte=start_dt,
-                calculation_month__lte=end_dt
-            ).order_by('calculation_month')
-            
-            monthly_totals = [0] * 12
-            year_total = 0
-            for summary in monthly_summaries:
-                month_index = summary.calculation_month.month - 1
-                monthly_totals[month_index] = float(summary.total_amount)
-                year_total += float(summary.total_amount)
-                
-        else:
-            # Default yearly view
-            monthly_summaries = DepartmentPaymentSummary.objects.filter(
-                department=dept,
-                calculation_month__year=current_year
-            ).order_by('calculation_month')
-            
-            monthly_totals = [0] * 12  # Initialize 12 months
-            year_total = 0
-            
-            for summary in monthly_summaries:
-                month_index = summary.calculation_month.month - 1
-                monthly_totals[month_index] = float(summary.total_amount)
-                year_total += float(summary.total_amount)
-        
-        # Calculate quarterly totals
-        q1_total = sum(monthly_totals[0:3])  # Jan-Mar
-        q2_total = sum(monthly_totals[3:6])  # Apr-Jun
-        q3_total = sum(monthly_totals[6:9])  # Jul-Sep
-        q4_total = sum(monthly_totals[9:12]) # Oct-Dec
-        
-        # Get current month total for easy template access
-        current_month_total = monthly_totals[current_month - 1] if view_type == 'monthly' else year_total
-        
-        # Calculate student count based on students with approved applications assigned to this department
-        # Get students who are assigned to this department and have approved scheme applications
-        approved_student_ids = dept.assigned_students.filter(
-            is_active=True,
-            student__schemeapplication__status='Approved'
-        ).values_list('student_id', flat=True)
-        
-        if view_type == 'monthly':
-            # Count approved students who have payment calculations for the specific month
-            student_count = PaymentCalculation.objects.filter(
-                student_id__in=approved_student_ids,
-                department=dept,
-                calculation_month__year=current_year,
-                calculation_month__month=current_month
-            ).values('student').distinct().count()
-        elif view_type == 'custom' and start_date and end_date:
-            # Count approved students who have payment calculations in the custom date range
-            student_count = PaymentCalculation.objects.filter(
-                student_id__in=approved_student_ids,
-                department=dept,
-                calculation_month__gte=start_dt,
-                calculation_month__lte=end_dt
-            ).values('student').distinct().count()
-        else:
-            # For yearly view, just count all approved students assigned to department
-            student_count = len(approved_student_ids)
-        
-        budget_data.append({
-            'department': dept,
-            'monthly_totals': monthly_totals,
-            'quarterly_totals': [q1_total, q2_total, q3_total, q4_total],
-            'year_total': year_total,
-            'current_month_total': current_month_total,
-            'student_count': student_count
-        })
-        
-        total_budget += year_total
+    budget_data = department_budget_matrix(departments, range_start, range_end, count_assigned=count_assigned)
+    
+    for dept_data in budget_data:
+        # Current month total for easy template access
+        dept_data['current_month_total'] = (
+            dept_data['monthly_totals'][current_month - 1] if view_type == 'monthly' else dept_data['year_total']
+        )
     
     # Calculate totals for footer
+    total_budget = sum((dept_data['year_total'] for dept_data in budget_data), Decimal('0.00'))
     total_students = sum(dept_data['student_count'] for dept_data in budget_data)
-    total_quarterly = [0, 0, 0, 0]
-    for dept_data in budget_data:
-        for i in range(4):
-            total_quarterly[i] += dept_data['quarterly_totals'][i]
+    total_quarterly = [
+        sum((dept_data['quarterly_totals'][i] for dept_data in budget_data), Decimal('0.00'))
+        for i in range(4)
+    ]
     
     # Get monthly labels
     months = [calendar.month_abbr[i] for i in range(1, 13)]
@@ -32,31 +32,24 @@ def approved_scheme_required(view_func):
         if request.user.role != 'student':
             return view_func(request, *args, **kwargs)
         
-        # Check if student has any scheme application first
-        from scheme.models import SchemeApplication
+        # Check if student has any scheme application first (statuses are cached per user)
         from django.shortcuts import redirect
         
-        scheme_applications = SchemeApplication.objects.filter(student=request.user)
-        
-        if not scheme_applications.exists():
+        if not request.user.has_scheme_application():
             # No application at all - redirect to registration
             from django.contrib import messages
             messages.info(request, 'Please complete your scheme application to access this feature.')
             return redirect('scheme_registration')
         
         # Check if student has approved scheme application
-        try:
-            scheme_app = SchemeApplication.objects.get(
-                student=request.user,
-                status='Approved'
-            )
+        if request.user.has_approved_scheme_application():
             return view_func(request, *args, **kwargs)
-        except SchemeApplication.DoesNotExist:
-            # Has application but not approved - show approval required page
-            return render(request, 'scheme/scheme_approval_required.html', {
-                'message': 'You need an approved scheme application to access this feature.',
-                'help_text': 'Please ensure your scheme application has been approved by the EL Coordinator before accessing work logs and payment features.'
-            })
+        
+        # Has application but not approved - show approval required page
+        return render(request, 'scheme/scheme_approval_required.html', {
+            'message': 'You need an approved scheme application to access this feature.',
+            'help_text': 'Please ensure your scheme application has been approved by the EL Coordinator before accessing work logs and payment features.'
+        })
     
     return wrapper
 
@@ -76,13 +69,7 @@ def scheme_benefits_required(view_func):
         
         # If student, check for approved scheme application
         if request.user.role == 'student':
-            from scheme.models import SchemeApplication
-            try:
-                scheme_app = SchemeApplication.objects.get(
-                    student=request.user,
-                    status='Approved'
-                )
-            except SchemeApplication.DoesNotExist:
+            if not request.user.has_approved_scheme_application():
                 return render(request, 'scheme/scheme_approval_required.html', {
                     'message': 'You need an approved scheme application to access this feature.',
                     'help_text': 'Please ensure your scheme application has been approved by the EL Coordinator before accessing work logs and payment features.'
@@ -0,0 +1,33 @@
+from .models import current_session, display_name_memo
+
+
+class DisplayNameMemoMiddleware:
+    """
+    Memoize User.get_full_name() lookups for the duration of one request,
+    so a user shown on several rows only costs one SchemeApplication query
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = display_name_memo.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            display_name_memo.reset(token)
+
+
+class SchemeStatusSessionMiddleware:
+    """
+    Expose the request's session to User.get_scheme_statuses(), which keeps
+    a student's own application statuses there between requests
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_session.set(request.session)
+        try:
+            return self.get_response(request)
+        finally:
+            current_session.reset(token)
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # Creates the table of any DatabaseCache configured in settings.CACHES; the
+    # default settings configure none, so this does nothing unless one is added
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_managers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
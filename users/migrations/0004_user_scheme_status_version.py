@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='scheme_status_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Bumped whenever the user's scheme applications change; stamps the statuses kept in their session"),
+        ),
+    ]
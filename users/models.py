@@ -1,5 +1,58 @@
-from django.contrib.auth.models import AbstractUser, Group, Permission
+import contextvars
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import AbstractUser, Group, Permission, UserManager as BaseUserManager
 from django.db import models
+from django.db.models import Case, CharField, F, Q, Subquery, Value, When
+from django.db.models.functions import Concat
+
+# Display names looked up during the current request, keyed by user id.
+# None outside a request (see DisplayNameMemoMiddleware), so management
+# commands and workers never see stale names.
+display_name_memo = contextvars.ContextVar('display_name_memo', default=None)
+
+# The current request's session (see SchemeStatusSessionMiddleware), where a
+# student's own application statuses are kept between requests
+current_session = contextvars.ContextVar('current_session', default=None)
+
+SCHEME_STATUS_SESSION_KEY = '_scheme_statuses'
+
+
+def application_name_subquery(user_ref):
+    """
+    SQL subquery for a student's full name as written on their scheme application
+
+    Args:
+        user_ref: OuterRef (or expression) pointing at the user's id
+
+    Returns:
+        Subquery: The concatenated name, or NULL when there is no application
+    """
+    from scheme.models import SchemeApplication
+    application = SchemeApplication.objects.filter(student=user_ref).annotate(
+        full_name=Concat(
+            'first_name',
+            Case(
+                When(~Q(middle_name='') & Q(middle_name__isnull=False), then=Concat(Value(' '), 'middle_name')),
+                default=Value(''),
+            ),
+            Value(' '),
+            'last_name',
+            output_field=CharField(),
+        )
+    ).values('full_name')[:1]
+    return Subquery(application, output_field=CharField())
+
+
+class UserQuerySet(models.QuerySet):
+    def with_display_name(self):
+        """Annotate each user with the name from their scheme application, so get_full_name() needs no query"""
+        return self.annotate(application_name=application_name_subquery(models.OuterRef('pk')))
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -11,24 +64,48 @@ class User(AbstractUser):
 
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='student')
     is_registered = models.BooleanField(default=False)
+    scheme_status_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Bumped whenever the user's scheme applications change; stamps the statuses kept in their session"
+    )
 
     groups = models.ManyToManyField(Group, related_name="custom_user_groups", blank=True)
     user_permissions = models.ManyToManyField(Permission, related_name="custom_user_permissions", blank=True)
 
+    objects = UserManager()
+
     def __str__(self):
         return f"{self.username} - {self.role}"
     
     def get_full_name(self):
         """Get full name from SchemeApplication if available, otherwise from User model"""
         if self.role == 'student':
-            scheme_app = self.get_scheme_application()
-            if scheme_app:
-                middle_name = f" {scheme_app.middle_name}" if scheme_app.middle_name else ""
-                return f"{scheme_app.first_name}{middle_name} {scheme_app.last_name}".strip()
+            if 'application_name' in self.__dict__:
+                # Annotated by User.objects.with_display_name()
+                if self.application_name:
+                    return self.application_name.strip()
+            else:
+                memo = display_name_memo.get()
+                if memo is not None and self.pk in memo:
+                    full_name = memo[self.pk]
+                else:
+                    full_name = self._get_application_name()
+                    if memo is not None:
+                        memo[self.pk] = full_name
+                if full_name:
+                    return full_name
         
         # Fallback to User model's default behavior
         return super().get_full_name() or self.username
     
+    def _get_application_name(self):
+        scheme_app = self.get_scheme_application()
+        if scheme_app:
+            middle_name = f" {scheme_app.middle_name}" if scheme_app.middle_name else ""
+            return f"{scheme_app.first_name}{middle_name} {scheme_app.last_name}".strip()
+        return None
+    
     def get_display_name(self):
         """Get display name prioritizing SchemeApplication data"""
         return self.get_full_name()
@@ -37,18 +114,61 @@ class User(AbstractUser):
         """Check if the student has an approved scheme application"""
         if self.role != 'student':
             return False
+        return 'Approved' in self.get_scheme_statuses()
+    
+    def has_scheme_application(self):
+        """Check if the student has submitted any scheme application"""
+        if self.role != 'student':
+            return False
+        return bool(self.get_scheme_statuses())
+    
+    def get_scheme_statuses(self):
+        """
+        Statuses of the student's scheme applications
         
-        from scheme.models import SchemeApplication
-        return SchemeApplication.objects.filter(
-            student=self,
-            status='Approved'
-        ).exists()
+        A student's own statuses are kept in their session, stamped with
+        scheme_status_version. The user row is loaded on every request anyway,
+        so while the stamp matches no query is needed, and a status change made
+        by any worker is seen on the student's next request.
+        
+        Returns:
+            tuple: Application statuses, empty when the student has not applied
+        """
+        if hasattr(self, '_scheme_statuses'):
+            return self._scheme_statuses
+        
+        session = current_session.get()
+        if session is not None and session.get(SESSION_KEY) != str(self.pk):
+            session = None  # Someone else's statuses, e.g. a coordinator's list
+        
+        statuses = None
+        if session is not None:
+            stored = session.get(SCHEME_STATUS_SESSION_KEY)
+            if stored and stored[0] == self.scheme_status_version:
+                statuses = tuple(stored[1])
+        if statuses is None:
+            from scheme.models import SchemeApplication
+            statuses = tuple(SchemeApplication.objects.filter(student=self).values_list('status', flat=True))
+            if session is not None:
+                session[SCHEME_STATUS_SESSION_KEY] = [self.scheme_status_version, list(statuses)]
+        self._scheme_statuses = statuses
+        return statuses
+    
+    @classmethod
+    def clear_scheme_status_cache(cls, user_ids):
+        """Invalidate the statuses kept in the given users' sessions after a status change"""
+        cls.objects.filter(pk__in=user_ids).update(scheme_status_version=F('scheme_status_version') + 1)
     
     def get_scheme_application(self):
         """Get the student's scheme application if it exists"""
         if self.role != 'student':
             return None
             
+        # Reuse applications loaded with prefetch_related('schemeapplication_set')
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('schemeapplication_set')
+        if prefetched is not None:
+            return prefetched[0] if prefetched else None
+        
         from scheme.models import SchemeApplication
         try:
             return SchemeApplication.objects.get(student=self)
@@ -1,3 +1,121 @@
+import datetime
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
 from django.test import TestCase
+from django.urls import reverse
+
+from scheme.models import SchemeApplication
+from .models import SCHEME_STATUS_SESSION_KEY, User, current_session, display_name_memo
+
+
+class SchemeStatusCacheTests(TestCase):
+    """A student's statuses are kept in their session and follow status changes"""
+
+    def setUp(self):
+        self.student = User.objects.create_user(username='student1', password='x', role='student')
+        self.application = SchemeApplication.objects.create(
+            student=self.student, first_name='Asha', last_name='Patil', address='Nigdi', state='Maharashtra',
+            dob=datetime.date(2004, 1, 1), annual_income=50000, fathers_occupation='Farmer',
+            caste_category='General', department='CSE', prn_number='124M1H001'
+        )
+        # The student's session, as SchemeStatusSessionMiddleware exposes it during their requests
+        self.session = SessionStore()
+        self.session[SESSION_KEY] = str(self.student.pk)
+        token = current_session.set(self.session)
+        self.addCleanup(current_session.reset, token)
+
+    def user(self, pk=None):
+        # A new User instance, as in the next request
+        return User.objects.get(pk=pk or self.student.pk)
+
+    def test_statuses_are_kept_in_the_session(self):
+        self.assertEqual(self.user().get_scheme_statuses(), ('Pending',))
+        self.assertEqual(self.session[SCHEME_STATUS_SESSION_KEY], [self.user().scheme_status_version, ['Pending']])
+
+        user = self.user()
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_scheme_statuses(), ('Pending',))
+
+    def test_approval_invalidates_the_stored_statuses(self):
+        self.assertFalse(self.user().has_approved_scheme_application())
+
+        self.application.status = 'Approved'
+        self.application.save()
+
+        self.assertTrue(self.user().has_approved_scheme_application())
+        self.assertEqual(self.session[SCHEME_STATUS_SESSION_KEY], [self.user().scheme_status_version, ['Approved']])
+
+    def test_bulk_status_changes_invalidate_the_stored_statuses(self):
+        self.user().get_scheme_statuses()
+
+        SchemeApplication.objects.filter(pk=self.application.pk).update(status='Completed')
+        User.clear_scheme_status_cache([self.student.pk])
+
+        self.assertEqual(self.user().get_scheme_statuses(), ('Completed',))
+
+    def test_other_users_statuses_are_not_stored(self):
+        other = User.objects.create_user(username='student2', password='x', role='student')
+
+        self.assertEqual(self.user(other.pk).get_scheme_statuses(), ())
+        self.assertNotIn(SCHEME_STATUS_SESSION_KEY, self.session)
+
+    def test_statuses_are_kept_between_requests(self):
+        self.application.status = 'Approved'
+        self.application.save()
+        self.client.force_login(self.student)
+
+        self.assertEqual(self.client.get(reverse('api_student_dashboard')).status_code, 200)
+        self.assertEqual(self.client.session[SCHEME_STATUS_SESSION_KEY], [self.user().scheme_status_version, ['Approved']])
+
+        self.application.status = 'Rejected'
+        self.application.save()
+        response = self.client.get(reverse('api_student_dashboard'))
+        self.assertTemplateUsed(response, 'scheme/scheme_approval_required.html')
+
+
+class DisplayNameTests(TestCase):
+    """get_full_name uses the annotated or memoized application name instead of a query per call"""
+
+    def setUp(self):
+        self.students = []
+        for n in range(3):
+            student = User.objects.create_user(username=f'student{n}', password='x', role='student',
+                                               first_name='Account', last_name=f'Name{n}')
+            SchemeApplication.objects.create(
+                student=student, first_name='Asha', middle_name='R' if n == 1 else '', last_name=f'Patil{n}',
+                address='Nigdi', state='Maharashtra', dob=datetime.date(2004, 1, 1), annual_income=50000,
+                fathers_occupation='Farmer', caste_category='General', department='CSE', prn_number=f'124M1H00{n}'
+            )
+            self.students.append(student)
+        self.unapplied = User.objects.create_user(username='student9', password='x', role='student')
+
+    def test_annotated_names_need_no_queries(self):
+        users = list(User.objects.with_display_name().filter(role='student').order_by('username'))
+
+        with self.assertNumQueries(0):
+            names = [user.get_full_name() for user in users]
+        self.assertEqual(names, ['Asha Patil0', 'Asha R Patil1', 'Asha Patil2', 'student9'])
+
+    def test_names_are_memoized_for_the_request(self):
+        token = display_name_memo.set({})
+        self.addCleanup(display_name_memo.reset, token)
+        student = User.objects.get(pk=self.students[1].pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(student.get_full_name(), 'Asha R Patil1')
+            # Another instance of the same user, as on a second row of a list
+            self.assertEqual(User(pk=student.pk, role='student').get_full_name(), 'Asha R Patil1')
+
+    def test_names_are_looked_up_again_outside_a_request(self):
+        student = User.objects.get(pk=self.students[0].pk)
+        self.assertEqual(student.get_full_name(), 'Asha Patil0')
+        SchemeApplication.objects.filter(student=student).update(last_name='Kulkarni')
+
+        self.assertEqual(User.objects.get(pk=student.pk).get_full_name(), 'Asha Kulkarni')
 
-# Create your tests here.
+    def test_other_roles_use_their_account_name(self):
+        coordinator = User.objects.create_user(username='coordinator', password='x', role='el_coordinator',
+                                               first_name='Meera', last_name='Joshi')
+        with self.assertNumQueries(0):
+            self.assertEqual(coordinator.get_full_name(), 'Meera Joshi')
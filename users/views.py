@@ -4,6 +4,7 @@ from django.contrib import messages
 from .forms import StudentSignupForm
 from .models import User, StudentProfile
 from scheme.models import SchemeApplication
+from scheme.previews import document_gallery
 
 def student_signup(request):
     # Redirect if user is already logged in
@@ -135,6 +136,7 @@ def applicant_profile(request, application_id):
 
     context = {
         'student': student,
+        'document_previews': document_gallery(student),
     }
     
     return render(request, 'users/student_profile.html', context)
@@ -144,6 +146,7 @@ def student_profile(request):
 
     context = {
         'student': student,
+        'document_previews': document_gallery(student),
     }
     
     return render(request, 'users/student_profile.html', context)
\ No newline at end of file